@@ -23,7 +23,109 @@ AVAILABLE_LIBRARIES_URL = os.getenv("AVAILABLE_LIBRARIES_URL", "http://127.0.0.1
 REQUEST_TIMEOUT = int(os.getenv("REQUEST_TIMEOUT", 1000))
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 CACHE_TTL = int(os.getenv("CACHE_TTL", 5 * 24 * 60 * 60))
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "true").lower() == "true"
+SEMANTIC_CACHE_FEATURES = [
+    feature.strip()
+    for feature in os.getenv("SEMANTIC_CACHE_FEATURES", "QUIZ,FLASHCARDS,NOTES,SUMMARY").split(",")
+    if feature.strip()
+]
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", 0.97))
+SEMANTIC_CACHE_TTL = int(os.getenv("SEMANTIC_CACHE_TTL", 24 * 60 * 60))
+SEMANTIC_CACHE_MAX_BYTES = int(os.getenv("SEMANTIC_CACHE_MAX_BYTES", 64 * 1024 * 1024))
 DEFAULT_POINTS = int(os.getenv("DEFAULT_POINTS", 25))
+STREAM_MAX_BUFFER = int(os.getenv("STREAM_MAX_BUFFER", 64))
+STREAM_IDLE_TIMEOUT = float(os.getenv("STREAM_IDLE_TIMEOUT", 60))
+STREAM_REPLAY_CHUNK_SIZE = int(os.getenv("STREAM_REPLAY_CHUNK_SIZE", 32))
+STREAM_REPLAY_DELAY = float(os.getenv("STREAM_REPLAY_DELAY", 0.005))
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "true").lower() == "true"
+SINGLE_FLIGHT_LOCK_TTL = int(os.getenv("SINGLE_FLIGHT_LOCK_TTL", 90))
+SINGLE_FLIGHT_WAIT_TIMEOUT = int(os.getenv("SINGLE_FLIGHT_WAIT_TIMEOUT", 90))
+
+# Latency quantile of the primary model after which the fallback is raced, per feature.
+# Sync calls keep running when they lose, long ones like PRESENTATION are not hedged by default
+HEDGE_POLICIES = get_dict_from_env_var("HEDGE_POLICIES", {"CHAT": 0.95})
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", 8))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", 1))
+HEDGE_MAX_DELAY = float(os.getenv("HEDGE_MAX_DELAY", 20))
+
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_ERROR_THRESHOLD = float(os.getenv("CIRCUIT_ERROR_THRESHOLD", 0.5))
+CIRCUIT_MIN_REQUESTS = int(os.getenv("CIRCUIT_MIN_REQUESTS", 10))
+CIRCUIT_WINDOW = float(os.getenv("CIRCUIT_WINDOW", 60))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", 30))
+# Time to first token (to the answer when not streamed) after which a call counts as failed
+CIRCUIT_SLOW_CALL_SECONDS = float(os.getenv("CIRCUIT_SLOW_CALL_SECONDS", 30))
+
+# Requests and tokens per minute per provider deployment, shared by all workers
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMITS = get_dict_from_env_var(
+    "RATE_LIMITS",
+    {
+        "azure:gpt-4o-mini": {"rpm": 2500, "tpm": 250000},
+        "azure:text-embedding-3-small": {"rpm": 2000, "tpm": 350000},
+    },
+)
+RATE_LIMIT_BACKGROUND_FEATURES = [
+    feature.strip().upper()
+    for feature in os.getenv("RATE_LIMIT_BACKGROUND_FEATURES", "PRESENTATION,ASSIGNMENT,LECTURE").split(",")
+    if feature.strip()
+]
+RATE_LIMIT_BACKGROUND_RESERVE = float(os.getenv("RATE_LIMIT_BACKGROUND_RESERVE", 0.2))
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", 120))
+
+# Trivial general chat turns skip the agent and its tools
+PROMPT_ROUTER_ENABLED = os.getenv("PROMPT_ROUTER_ENABLED", "false").lower() == "true"
+PROMPT_ROUTER_THRESHOLD = float(os.getenv("PROMPT_ROUTER_THRESHOLD", 0.7))
+PROMPT_ROUTER_WEIGHTS = get_dict_from_env_var("PROMPT_ROUTER_WEIGHTS", {})
+FAST_CHAT_DEPLOYMENT = os.getenv("FAST_CHAT_DEPLOYMENT", "gpt-4o-mini")
+FAST_CHAT_MAX_TOKENS = int(os.getenv("FAST_CHAT_MAX_TOKENS", 500))
+FAST_CHAT_HISTORY_LIMIT = int(os.getenv("FAST_CHAT_HISTORY_LIMIT", 1500))
+
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 100))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", 4))
+INGEST_WRITE_WORKERS = int(os.getenv("INGEST_WRITE_WORKERS", 4))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", 4))
+
+# Uploads and link files are ingested by background workers, clients poll the job
+INGEST_JOBS_ENABLED = os.getenv("INGEST_JOBS_ENABLED", "true").lower() == "true"
+INGEST_JOB_WORKERS = int(os.getenv("INGEST_JOB_WORKERS", 2))
+INGEST_JOB_STALE_AFTER = int(os.getenv("INGEST_JOB_STALE_AFTER", 15 * 60))
+
+# Vectors reused across users for identical chunks, roughly 3KB each
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200_000))
+EMBEDDING_CACHE_TTL = int(os.getenv("EMBEDDING_CACHE_TTL", 30 * 24 * 60 * 60))
+
+# Extracted text and OCR output reused for identical files, compressed in Redis
+EXTRACTION_CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+EXTRACTION_CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", 20_000))
+EXTRACTION_CACHE_TTL = int(os.getenv("EXTRACTION_CACHE_TTL", 30 * 24 * 60 * 60))
+
+# In process vector indexes per subject, Firestore only answers while they load
+VECTOR_INDEX_ENABLED = os.getenv("VECTOR_INDEX_ENABLED", "true").lower() == "true"
+VECTOR_INDEX_MAX_BYTES = int(os.getenv("VECTOR_INDEX_MAX_BYTES", 512 * 1024 * 1024))
+VECTOR_INDEX_HNSW_THRESHOLD = int(os.getenv("VECTOR_INDEX_HNSW_THRESHOLD", 5000))
+
+# Repeat questions against an unchanged subject skip embedding and search
+RETRIEVAL_CACHE_ENABLED = os.getenv("RETRIEVAL_CACHE_ENABLED", "true").lower() == "true"
+RETRIEVAL_CACHE_TTL = int(os.getenv("RETRIEVAL_CACHE_TTL", 5 * 60))
+
+# Subjects and files list given to the chat agent, rebuilt only after a change
+SUBJECTS_SUMMARY_CACHE_ENABLED = os.getenv("SUBJECTS_SUMMARY_CACHE_ENABLED", "true").lower() == "true"
+SUBJECTS_SUMMARY_CACHE_TTL = int(os.getenv("SUBJECTS_SUMMARY_CACHE_TTL", 24 * 60 * 60))
+
+# Latest messages loaded as chat history, prompts only keep what fits their limit anyway
+CHAT_HISTORY_MESSAGES = int(os.getenv("CHAT_HISTORY_MESSAGES", 20))
+
+# Chat prompts embedded at once in the background for tool picking, others only use keywords
+TOOL_INDEX_MAX_PENDING_QUERIES = int(os.getenv("TOOL_INDEX_MAX_PENDING_QUERIES", 16))
+
+# Tool calls of one agent step run concurrently, up to a cap per request, and time out
+AGENT_MAX_CONCURRENT_TOOLS = int(os.getenv("AGENT_MAX_CONCURRENT_TOOLS", 4))
+AGENT_TOOL_TIMEOUT = float(os.getenv("AGENT_TOOL_TIMEOUT", 60))
+AGENT_SLOW_TOOL_TIMEOUT = float(os.getenv("AGENT_SLOW_TOOL_TIMEOUT", 300))
+
 FEATURE_PRICING = get_dict_from_env_var(
     "FEATURE_PRICING", 
     {
@@ -2,7 +2,9 @@ import logging
 from api.exceptions import LimitException
 
 from api.lib.database.purchases import SubscriptionType
-from .config import FEATURE_PRICING, FILE_COLLECTION_LIMITS
+from .config import FEATURE_PRICING, FILE_COLLECTION_LIMITS, RATE_LIMIT_BACKGROUND_FEATURES
+from .lib.rate_limiter import BACKGROUND, INTERACTIVE, priority_scope
+from .lib.feature_metrics import feature_run, mark_premium
 from .globals import (
     user_points_manager,
     subscription_manager,
@@ -11,9 +13,11 @@ from .globals import (
     global_chat_model,
     fallback_chat_models,
     get_model_and_fallback,
-    get_model
+    get_model,
+    semantic_llm_cache
 )
 from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
 from functools import wraps
 from langchain_community.callbacks.manager import get_openai_callback
 from typing import Callable, Any, Optional, Union
@@ -21,6 +25,10 @@ from inspect import isfunction
 import traceback
 
 
+def feature_priority(feature_key: str) -> str:
+    return BACKGROUND if feature_key in RATE_LIMIT_BACKGROUND_FEATURES else INTERACTIVE
+
+
 def deduct_points_for_feature(user_id: str, func, feature_key: str, usage_key: str = None, func_args: list = [], func_kwargs: dict = {}):
     logging.info(
         f"Checking points for feature: {feature_key} and user: {user_id}"
@@ -42,7 +50,9 @@ def deduct_points_for_feature(user_id: str, func, feature_key: str, usage_key: s
         f"Points decremented for user: {user_id} on feature: {feature_key}"
     )
     try:
-        with get_openai_callback() as cb:
+        with get_openai_callback() as cb, semantic_llm_cache.feature_scope(feature_key), priority_scope(
+            feature_priority(feature_key)
+        ), feature_run(feature_key):
             val = func(*func_args, **func_kwargs)
             logging.info(f"Total tokens used: {cb.total_tokens}")
             logging.info(f"Total cost: {cb.total_cost}")
@@ -99,8 +109,13 @@ def require_points_for_feature(feature_key: str, usage_key: str = None):
             )
 
             try:
-                with get_openai_callback() as cb:
+                with get_openai_callback() as cb, semantic_llm_cache.feature_scope(feature_key), priority_scope(
+                    feature_priority(feature_key)
+                ), feature_run(feature_key) as run:
                     val = func(*args, **kwargs)
+                    if isinstance(val, StreamingResponse):
+                        # The model runs while the response streams, after this scope ended
+                        val.body_iterator = run.meter(val.body_iterator)
                     logging.info(f"Total tokens used: {cb.total_tokens}")
                     logging.info(f"Total cost: {cb.total_cost}")
                     return val
@@ -150,6 +165,7 @@ def use_feature_with_premium_model_check(
     used, feature = use_feature(feature_name, user_id)
     if subscription_manager.get_subscription_type(user_id) == SubscriptionType.ELITE:
         used_gpt, model_name = use_feature("MODEL", user_id)
+        mark_premium(used_gpt)
         return model_name, used_gpt
     return None, False
 
@@ -157,6 +173,7 @@ def use_feature_with_premium_model_check(
 def can_use_premium_model(user_id: str) -> tuple[Optional[Union[str, int]], bool]:
     if subscription_manager.get_subscription_type(user_id) == SubscriptionType.ELITE:
         used_gpt, model_name = use_feature("MODEL", user_id)
+        mark_premium(used_gpt)
         return model_name, used_gpt
     return None, False
 
@@ -33,6 +33,7 @@ from .lib.knowledge_manager import (
     KnowledgeManager,
     ChatManagerRetrieval,
     ChatManagerNonRetrieval,
+    FirestoreVectorStoreModified,
 )
 from .lib.presentation_maker.database import (
     initialize_managers,
@@ -41,13 +42,28 @@ from .lib.presentation_maker.database import (
 )
 from .lib.maths_solver.python_exec_client import PythonClient, Urls
 from .lib.redis_cache import RedisCache
+from .lib.semantic_cache import SemanticCache
+from .lib.embedding_cache import CachedEmbeddings
+from .lib.vector_index import VectorIndexCache
+from .lib.ingestion_jobs import IngestionJobQueue
+from .lib.extraction_cache import ExtractionCache
+from .lib.retrieval_cache import RetrievalCache
+from .lib.subjects_summary import SubjectsSummaryCache
+from .lib.tool_index import ToolIndex
+from .lib.model_registry import ModelRegistry
+from .lib.streaming import StreamingEngine
+from .lib.single_flight import SingleFlight, SingleFlightCache
+from .lib.hedging import Hedger, HedgedRunnable
+from .lib.circuit_breaker import CircuitBreaker
+from .lib.rate_limiter import RateLimiter
+from .lib.prompt_router import PromptRouter
 from .lib.purchases_play_store import SubscriptionChecker
 from .lib.email_integrity_checker import EmailIntegrityChecker
 from .lib.mermaid_maker import MermaidClient
 from .lib.ocr import ImageOCR
 from .ai_model import AIModel
 
-from contextlib import suppress
+from typing import Optional
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_openai import AzureChatOpenAI, AzureOpenAIEmbeddings
 from langchain_openai.chat_models import ChatOpenAI
@@ -57,6 +73,7 @@ from langchain.chat_models.base import BaseChatModel
 
 import langchain
 import redis
+import redis.asyncio
 import logging
 import dotenv
 
@@ -66,9 +83,71 @@ dotenv.load_dotenv()
 langchain.verbose = False
 
 try:
-    langchain.llm_cache = RedisCache(redis_=redis.from_url(REDIS_URL), ttl=CACHE_TTL)
+    rate_limiter_redis = redis.from_url(REDIS_URL)
 except Exception:
+    rate_limiter_redis = None
+    logging.info("Fix redis rate limiter")
+
+rate_limiter = RateLimiter(
+    rate_limiter_redis,
+    RATE_LIMITS,
+    background_reserve=RATE_LIMIT_BACKGROUND_RESERVE,
+    max_wait=RATE_LIMIT_MAX_WAIT,
+    enabled=RATE_LIMIT_ENABLED,
+)
+model_registry = ModelRegistry(rate_limiter=rate_limiter)
+
+
+try:
+    embedding_cache_redis = redis.from_url(REDIS_URL)
+except Exception:
+    embedding_cache_redis = None
+    logging.info("Fix redis embedding cache")
+
+
+def make_embeddings() -> CachedEmbeddings:
+    return CachedEmbeddings(
+        AzureOpenAIEmbeddings(
+            **model_registry.shared_client_kwargs(AzureOpenAIEmbeddings),
+            api_version="2023-05-15",
+            azure_deployment="text-embedding-3-small",
+        ),
+        embedding_cache_redis,
+        model="text-embedding-3-small",
+        max_entries=EMBEDDING_CACHE_MAX_ENTRIES,
+        ttl=EMBEDDING_CACHE_TTL,
+        enabled=EMBEDDING_CACHE_ENABLED,
+    )
+
+
+try:
+    exact_llm_cache = RedisCache(redis_=redis.from_url(REDIS_URL), ttl=CACHE_TTL)
+except Exception:
+    exact_llm_cache = None
     logging.info("Fix redis cache")
+
+semantic_llm_cache = SemanticCache(
+    exact_llm_cache,
+    make_embeddings(),
+    features=SEMANTIC_CACHE_FEATURES,
+    threshold=SEMANTIC_CACHE_THRESHOLD,
+    ttl=SEMANTIC_CACHE_TTL,
+    max_bytes=SEMANTIC_CACHE_MAX_BYTES,
+    enabled=SEMANTIC_CACHE_ENABLED,
+)
+
+try:
+    single_flight = SingleFlight(
+        redis.from_url(REDIS_URL),
+        redis.asyncio.from_url(REDIS_URL),
+        lock_ttl=SINGLE_FLIGHT_LOCK_TTL,
+        wait_timeout=SINGLE_FLIGHT_WAIT_TIMEOUT,
+    )
+except Exception:
+    single_flight = SingleFlight(None)
+    logging.info("Fix redis single flight")
+
+langchain.llm_cache = SingleFlightCache(semantic_llm_cache, single_flight, enabled=SINGLE_FLIGHT_ENABLED)
     
 try:
     redis_cache_manager = RedisCacheManager(redis.from_url(REDIS_URL))
@@ -95,6 +174,20 @@ global_chat_model_alternative = AIModel(
     premium_args={"model_name": "gpt-4o-mini", "request_timeout": 60, "max_retries": 4},
 )
 
+# Used for turns the prompt router sends down the fast path
+fast_chat_model = AIModel(
+    regular_model=AzureChatOpenAI,
+    regular_args={
+        "api_version":"2024-08-01-preview",
+        "azure_deployment":FAST_CHAT_DEPLOYMENT,
+    },
+    premium_model=AzureChatOpenAI,
+    premium_args={
+        "api_version":"2024-08-01-preview",
+        "azure_deployment":FAST_CHAT_DEPLOYMENT,
+    },
+)
+
 fallback_chat_models = [
     AIModel(
         regular_model=ChatOpenAI,
@@ -106,19 +199,38 @@ fallback_chat_models = [
 
 
 
-def create_model(model_class: AIModel, premium: bool, model_kwargs: dict, json_mode: bool = False) -> BaseChatModel:
-    model_type = 'premium' if premium else 'regular'
+try:
+    circuit_breaker_redis = redis.from_url(REDIS_URL)
+except Exception:
+    circuit_breaker_redis = None
+    logging.info("Fix redis circuit breaker")
+
+circuit_breaker = CircuitBreaker(
+    circuit_breaker_redis,
+    error_threshold=CIRCUIT_ERROR_THRESHOLD,
+    min_requests=CIRCUIT_MIN_REQUESTS,
+    window=CIRCUIT_WINDOW,
+    open_seconds=CIRCUIT_OPEN_SECONDS,
+    slow_call_seconds=CIRCUIT_SLOW_CALL_SECONDS,
+    enabled=CIRCUIT_BREAKER_ENABLED,
+)
+
+
+def provider_name(model_class: AIModel, premium: bool) -> str:
+    model_type = "premium" if premium else "regular"
     args = getattr(model_class, f"{model_type}_args")
-    model =  getattr(model_class, f"{model_type}_model")(**args, **model_kwargs)
+    deployment = args.get("azure_deployment") or args.get("model_name") or args.get("model")
+    return f"{getattr(model_class, f'{model_type}_model').__name__}:{deployment}"
+
+
+def create_model(model_class: AIModel, premium: bool, model_kwargs: dict, json_mode: bool = False) -> BaseChatModel:
+    breaker_callback = circuit_breaker.handler(provider_name(model_class, premium))
+    callbacks = [*model_kwargs.get("callbacks", []), breaker_callback]
+    model = model_registry.get(model_class, premium, {**model_kwargs, "callbacks": callbacks})
     if json_mode:
         return set_json_mode(model)
     return model
 
-def set_model_attributes(model: BaseChatModel, attributes: dict):
-    for k, v in attributes.items():
-        with suppress(Exception):
-            setattr(model, k, v)
-
 def set_json_mode(model: BaseChatModel):
     if isinstance(model, ChatOpenAI):
         return model.bind(response_format={"type": "json_object"})
@@ -127,13 +239,14 @@ def set_json_mode(model: BaseChatModel):
     else:
         return model
     
-def set_fallbacks(model, fallbacks):
-    from langchain_core.runnables.fallbacks import RunnableWithFallbacks
-    return RunnableWithFallbacks(
+def set_fallbacks(model, fallbacks, feature: Optional[str] = None):
+    return HedgedRunnable(
         runnable=model,
         fallbacks=fallbacks,
         exceptions_to_handle=(Exception, ),
         exception_key=None,
+        hedger=hedger,
+        feature=feature,
     )
         
 
@@ -143,43 +256,70 @@ def get_model(
     is_premium: bool,
     alt: bool = False,
     cache: bool = True,
-    json_mode: bool = False
+    json_mode: bool = False,
+    feature: Optional[str] = None,
 ) -> BaseChatModel:
     args = {**model_kwargs, "streaming": stream, "cache": cache}
     model_class = global_chat_model_alternative if alt else global_chat_model
+    model_class, *fallback_classes = circuit_breaker.route(
+        [model_class, *fallback_chat_models], lambda candidate: provider_name(candidate, is_premium)
+    )
     model = create_model(model_class, is_premium, args, json_mode=json_mode)
-    set_model_attributes(model, args)
 
     fallbacks = []
-    for fallback in fallback_chat_models:
+    for fallback in fallback_classes:
         try:
             fallback_model = create_model(fallback, is_premium, args, json_mode=json_mode)
-            set_model_attributes(fallback_model, args)
             fallbacks.append(fallback_model)
         except Exception as e:
             logging.error(f"Error in fallback {e}")
 
-    return set_fallbacks(model, fallbacks)
+    return set_fallbacks(model, fallbacks, feature)
 
 def get_model_and_fallback(
-    model_kwargs: dict, stream: bool, is_premium: bool, alt: bool = False
+    model_kwargs: dict, stream: bool, is_premium: bool, alt: bool = False, fast: bool = False
 ):
     model_kwargs = {**model_kwargs, "streaming": stream}
-    model_class = global_chat_model_alternative if alt else global_chat_model
+    if fast:
+        model_class = fast_chat_model
+    else:
+        model_class = global_chat_model_alternative if alt else global_chat_model
     fallback_class = fallback_chat_models[-1]
+    model_class, fallback_class = circuit_breaker.route(
+        [model_class, fallback_class], lambda candidate: provider_name(candidate, is_premium)
+    )
 
     model = create_model(model_class, is_premium, model_kwargs)
     fallback_model = create_model(fallback_class, is_premium, model_kwargs)
 
-    set_model_attributes(model, model_kwargs)
-    set_model_attributes(fallback_model, model_kwargs)
-
     return model, fallback_model
 
 
 
 
 
+hedger = Hedger(
+    HEDGE_POLICIES,
+    default_delay=HEDGE_DEFAULT_DELAY,
+    min_delay=HEDGE_MIN_DELAY,
+    max_delay=HEDGE_MAX_DELAY,
+)
+
+prompt_router = PromptRouter(
+    PROMPT_ROUTER_WEIGHTS,
+    threshold=PROMPT_ROUTER_THRESHOLD,
+    enabled=PROMPT_ROUTER_ENABLED,
+)
+
+streaming_engine = StreamingEngine(
+    max_buffer=STREAM_MAX_BUFFER,
+    idle_timeout=STREAM_IDLE_TIMEOUT,
+    replay_chunk_size=STREAM_REPLAY_CHUNK_SIZE,
+    replay_delay=STREAM_REPLAY_DELAY,
+    single_flight=single_flight if SINGLE_FLIGHT_ENABLED else None,
+)
+
+
 # code runner
 client = PythonClient(
     Urls(
@@ -190,11 +330,24 @@ client = PythonClient(
     40,
 )
 
+try:
+    subjects_summary_redis = redis.from_url(REDIS_URL)
+except Exception:
+    subjects_summary_redis = None
+    logging.info("Fix redis subjects summary")
+
+subjects_summary_cache = SubjectsSummaryCache(
+    subjects_summary_redis,
+    ttl=SUBJECTS_SUMMARY_CACHE_TTL,
+    enabled=SUBJECTS_SUMMARY_CACHE_ENABLED,
+)
+
 # Database Managers
 collection_manager = CollectionDBManager(
     MONGODB_URL,
     DATABASE_NAME,
     cache_manager=RedisCacheManager(redis.from_url(REDIS_URL)),
+    summary_cache=subjects_summary_cache,
 )
 user_manager = UserDBManager(
     MONGODB_URL,
@@ -208,6 +361,8 @@ file_manager = FileDBManager(
     collection_manager,
     cache=RedisCacheManager(redis.from_url(REDIS_URL)),
 )
+file_manager.add_change_listener(subjects_summary_cache.invalidate)
+collection_manager.add_change_listener(subjects_summary_cache.invalidate)
 conversation_manager = MessageDBManager(
     MONGODB_URL,
     DATABASE_NAME,
@@ -254,37 +409,104 @@ user_location_db = UserLocationDB(
 ip_locator = IPLocator()
 
 
+ingestion_kwargs = {
+    "batch_size": INGEST_BATCH_SIZE,
+    "embed_workers": INGEST_EMBED_WORKERS,
+    "write_workers": INGEST_WRITE_WORKERS,
+    "max_attempts": INGEST_MAX_ATTEMPTS,
+}
+
+try:
+    vector_index_redis = redis.from_url(REDIS_URL)
+except Exception:
+    vector_index_redis = None
+    logging.info("Fix redis vector index")
+
+vector_index = VectorIndexCache(
+    FirestoreVectorStoreModified(collection="academi", embedding_service=make_embeddings()),
+    make_embeddings(),
+    vector_index_redis,
+    max_bytes=VECTOR_INDEX_MAX_BYTES,
+    hnsw_threshold=VECTOR_INDEX_HNSW_THRESHOLD,
+    enabled=VECTOR_INDEX_ENABLED,
+)
+file_manager.add_change_listener(vector_index.invalidate)
+collection_manager.add_change_listener(vector_index.invalidate)
+
+try:
+    retrieval_cache_redis = redis.from_url(REDIS_URL)
+except Exception:
+    retrieval_cache_redis = None
+    logging.info("Fix redis retrieval cache")
+
+retrieval_cache = RetrievalCache(
+    retrieval_cache_redis,
+    ttl=RETRIEVAL_CACHE_TTL,
+    enabled=RETRIEVAL_CACHE_ENABLED,
+)
+file_manager.add_change_listener(retrieval_cache.invalidate)
+# Deleting a subject removes its files through the collection manager's own file manager
+collection_manager.add_change_listener(retrieval_cache.invalidate)
+
+tool_index = ToolIndex(make_embeddings(), max_pending_queries=TOOL_INDEX_MAX_PENDING_QUERIES)
+
+try:
+    ingestion_jobs_redis = redis.from_url(REDIS_URL)
+except Exception:
+    ingestion_jobs_redis = None
+    logging.info("Fix redis ingestion jobs")
+
+ingestion_jobs = IngestionJobQueue(
+    ingestion_jobs_redis,
+    workers=INGEST_JOB_WORKERS,
+    stale_after=INGEST_JOB_STALE_AFTER,
+)
+
+try:
+    extraction_cache_redis = redis.from_url(REDIS_URL)
+except Exception:
+    extraction_cache_redis = None
+    logging.info("Fix redis extraction cache")
+
+extraction_cache = ExtractionCache(
+    extraction_cache_redis,
+    max_entries=EXTRACTION_CACHE_MAX_ENTRIES,
+    ttl=EXTRACTION_CACHE_TTL,
+    enabled=EXTRACTION_CACHE_ENABLED,
+)
+
 # OCR
 knowledge_manager = KnowledgeManager(
-    AzureOpenAIEmbeddings(
-        api_version="2023-05-15",
-        azure_deployment="text-embedding-3-small",
-    ),
+    make_embeddings(),
     chunk_size=520,
     ocr=ImageOCR(),
-    collection_name="academi"
+    collection_name="academi",
+    ingestion_kwargs=ingestion_kwargs,
+    vector_index=vector_index,
+    extraction_cache=extraction_cache,
+    retrieval_cache=retrieval_cache,
 )
 knowledge_manager_notes = KnowledgeManager(
-    AzureOpenAIEmbeddings(
-        api_version="2023-05-15",
-        azure_deployment="text-embedding-3-small",
-    ),
+    make_embeddings(),
     chunk_size=10000,
     ocr=ImageOCR(),
-    collection_name="academi-notes"
+    collection_name="academi-notes",
+    ingestion_kwargs=ingestion_kwargs,
+    extraction_cache=extraction_cache,
 )
 chat_manager = ChatManagerRetrieval(
-    AzureOpenAIEmbeddings(
-        api_version="2023-05-15",
-        azure_deployment="text-embedding-3-small",
-    ),
+    make_embeddings(),
     conversation_limit=2000,
     docs_limit=3700,
+    vector_index=vector_index,
+    retrieval_cache=retrieval_cache,
 )
 chat_manager_agent_non_retrieval = ChatManagerNonRetrieval(
     conversation_limit=2000,
     python_client=client,
     base_tools=[],
+    max_concurrent_tools=AGENT_MAX_CONCURRENT_TOOLS,
+    tool_timeout=AGENT_TOOL_TIMEOUT,
 )
 subscription_manager = SubscriptionManager(
     connection_string=MONGODB_URL,
@@ -338,7 +560,7 @@ subscription_manager = SubscriptionManager(
 )
 # Presentation
 template_manager, temp_knowledge_manager = initialize_managers(
-    template_json_path=DEFAULT_TEMPLATES_JSON, template_dir=DEFAULT_TEMPLATE_DIR
+    template_json_path=DEFAULT_TEMPLATES_JSON, template_dir=DEFAULT_TEMPLATE_DIR, embeddings=make_embeddings()
 )
 
 
@@ -0,0 +1,91 @@
+import asyncio
+import logging
+import time
+
+from typing import Dict, Optional
+from langchain.agents import AgentExecutor
+from langchain.pydantic_v1 import PrivateAttr
+from langchain_core.agents import AgentAction, AgentStep
+from langchain_core.callbacks import AsyncCallbackManagerForChainRun
+from langchain_core.tools import BaseTool
+from prometheus_client import Counter, Histogram
+
+
+logger = logging.getLogger(__name__)
+
+AGENT_TOOL_CALLS = Counter(
+    "agent_tool_calls_total",
+    "Agent tool calls by outcome",
+    ["tool", "result"],
+)
+AGENT_TOOL_SECONDS = Histogram(
+    "agent_tool_seconds",
+    "Time an agent tool call took, waiting for a free slot excluded",
+    ["tool"],
+)
+
+
+class ParallelAgentExecutor(AgentExecutor):
+    """AgentExecutor with bounded, timed tool calls.
+
+    On async runs LangChain already gathers the tool calls of a step, in the
+    order the model made them, but without a limit or a timeout. Here at
+    most `max_concurrent_tools` calls of the executor run at once, agents
+    are made per request so the cap is too, and a call running past its
+    timeout (`tool_timeouts` by tool name, else `default_tool_timeout`)
+    becomes an observation saying so, letting the model answer without it.
+    A sync tool that timed out keeps its thread until it returns. Sync runs
+    are unchanged.
+    """
+
+    max_concurrent_tools: int = 4
+    default_tool_timeout: Optional[float] = 60
+    tool_timeouts: Dict[str, float] = {}
+    _slots: Optional[asyncio.Semaphore] = PrivateAttr(default=None)
+
+    async def _aperform_agent_action(
+        self,
+        name_to_tool_map: Dict[str, BaseTool],
+        color_mapping: Dict[str, str],
+        agent_action: AgentAction,
+        run_manager: Optional[AsyncCallbackManagerForChainRun] = None,
+    ) -> AgentStep:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrent_tools)
+        timeout = self.tool_timeouts.get(agent_action.tool, self.default_tool_timeout)
+
+        # The "using a tool" status goes out once a slot is free and the tool starts
+        async with self._slots:
+            start = time.perf_counter()
+            try:
+                step = await asyncio.wait_for(
+                    super()._aperform_agent_action(name_to_tool_map, color_mapping, agent_action, run_manager),
+                    timeout,
+                )
+                AGENT_TOOL_CALLS.labels(tool=agent_action.tool, result="ok").inc()
+                return step
+            except asyncio.TimeoutError:
+                AGENT_TOOL_CALLS.labels(tool=agent_action.tool, result="timeout").inc()
+                logger.error(f"Tool {agent_action.tool} timed out after {timeout}s")
+                observation = f"The tool {agent_action.tool} timed out after {timeout:.0f} seconds. Answer without it."
+                await self._report_timeout(agent_action, observation, run_manager)
+                return AgentStep(action=agent_action, observation=observation)
+            finally:
+                AGENT_TOOL_SECONDS.labels(tool=agent_action.tool).observe(time.perf_counter() - start)
+
+    @staticmethod
+    async def _report_timeout(
+        agent_action: AgentAction,
+        observation: str,
+        run_manager: Optional[AsyncCallbackManagerForChainRun],
+    ) -> None:
+        """Closes the cancelled call as a tool error, so callbacks see every tool end."""
+        if run_manager is None:
+            return
+        try:
+            tool_run = await run_manager.get_child().on_tool_start(
+                {"name": agent_action.tool}, str(agent_action.tool_input)
+            )
+            await tool_run.on_tool_error(TimeoutError(observation))
+        except Exception as e:
+            logger.error(f"Failed to report tool timeout: {e}")
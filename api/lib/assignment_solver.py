@@ -16,7 +16,8 @@ from langchain.prompts import (
     ChatPromptTemplate,
     MessagesPlaceholder
 )
-from langchain.output_parsers import PydanticOutputParser, OutputFixingParser
+from .structured_output import StructuredOutput
+from .extraction_cache import ExtractionCache, file_digest
 from langchain.schema import SystemMessage, HumanMessage
 from langchain.pydantic_v1 import BaseModel, Field, validator
 from docx.shared import RGBColor
@@ -62,11 +63,19 @@ class Solution(BaseModel):
         return v  # Return original if no code blocks are found
     
 class AssignmentSolver:
-    def __init__(self, llm_extractor: BaseChatModel, llm_solver: BaseChatModel, solver_tools: list, last_page: int = 3) -> None:
+    def __init__(
+        self,
+        llm_extractor: BaseChatModel,
+        llm_solver: BaseChatModel,
+        solver_tools: list,
+        last_page: int = 3,
+        extraction_cache: Optional[ExtractionCache] = None,
+    ) -> None:
         self.llm_extractor = llm_extractor
         self.last_page = last_page
         self.llm_solver = llm_solver
         self.solver_tools = solver_tools
+        self.extraction_cache = extraction_cache
         
     def set_tools(self, tools: list):
         self.solver_tools = tools
@@ -195,6 +204,20 @@ FOLLOW ALL ABOVE RULES!
         return file_obj.read()
 
     def extract_questions(self, doc_path: str) -> tuple[Questions, list[str]]:
+        """Like `_extract_questions`, reusing the result for a file that was extracted before."""
+        if self.extraction_cache is None or not self.extraction_cache.enabled:
+            return self._extract_questions(doc_path)
+
+        def extract() -> dict:
+            questions, images = self._extract_questions(doc_path)
+            return {"questions": questions.dict(), "images": images}
+
+        cached = self.extraction_cache.get_or_compute(
+            file_digest(doc_path), f"assignment_questions:{self.last_page}", extract
+        )
+        return Questions.parse_obj(cached["questions"]), cached["images"]
+
+    def _extract_questions(self, doc_path: str) -> tuple[Questions, list[str]]:
         with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_pdf_file:
             temp_pdf_path = temp_pdf_file.name
         
@@ -214,9 +237,6 @@ FOLLOW ALL ABOVE RULES!
                 for image in base64_images
             ]
             
-            output_parser = OutputFixingParser.from_llm(
-                parser=PydanticOutputParser(pydantic_object=Questions), llm=self.llm_extractor
-            )
             human_message = HumanMessage(
                 content=[
                     *formatted_images, 
@@ -235,9 +255,8 @@ Only extract the questions/Tasks if they are mentioned explictly (Important)
                     MessagesPlaceholder(variable_name='input'),
                 ]
             )
-            runnable = prompt | self.llm_extractor.with_structured_output(schema=Questions)
-            return runnable.invoke({"input": [human_message]}), base64_images
-            #return output_parser.parse(runnable.invoke({"input": [human_message]}).content), base64_images
+            structured_llm = StructuredOutput(self.llm_extractor, Questions)
+            return structured_llm.invoke(prompt.format_messages(input=[human_message])), base64_images
         finally:
             os.remove(temp_pdf_path)
 
@@ -0,0 +1,135 @@
+import copy
+import tiktoken
+
+from functools import lru_cache
+from typing import Iterable, List, Tuple
+from langchain.schema import Document
+
+# Bytes 0x80-0xBF continue a UTF-8 character, every other byte starts one
+_CONTINUATION_BYTES = bytes(range(0x80, 0xC0))
+_SENTENCE_ENDS = (b".", b"!", b"?", b"\n", b".\"", b".)")
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str) -> tiktoken.Encoding:
+    return tiktoken.get_encoding(encoding_name)
+
+
+@lru_cache(maxsize=None)
+def _sentence_end_tokens(encoding_name: str) -> frozenset:
+    encoding = get_encoding(encoding_name)
+    ends = set()
+    for token in range(encoding.n_vocab):
+        try:
+            data = encoding.decode_single_token_bytes(token)
+        except KeyError:
+            continue
+        if data.rstrip(b" ").endswith(_SENTENCE_ENDS):
+            ends.add(token)
+    return frozenset(ends)
+
+
+def count_tokens(text: str, encoding_name: str = "cl100k_base") -> int:
+    return len(get_encoding(encoding_name).encode_ordinary(text))
+
+
+class TokenChunker:
+    """Drop in replacement for langchain's TokenTextSplitter that encodes each text once.
+
+    Chunk boundaries are computed on the token ids and mapped back to
+    character offsets of the original text, so chunks are slices of the input
+    rather than decoded token windows. Characters split between two tokens
+    are kept whole. With `sentence_aware` a chunk ends after the last
+    sentence ending token in its final `sentence_window` fraction, if any.
+    Defaults match TokenTextSplitter, so existing chunks keep their size.
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 4000,
+        chunk_overlap: int = 200,
+        encoding_name: str = "gpt2",
+        sentence_aware: bool = False,
+        sentence_window: float = 0.2,
+    ) -> None:
+        if chunk_overlap >= chunk_size:
+            raise ValueError(
+                f"Chunk overlap ({chunk_overlap}) must be smaller than the chunk size ({chunk_size})."
+            )
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoding_name = encoding_name
+        self.encoding = get_encoding(encoding_name)
+        self.sentence_aware = sentence_aware
+        self.sentence_window = max(1, int(chunk_size * sentence_window))
+
+    def token_spans(self, tokens: List[int]) -> List[Tuple[int, int]]:
+        """(start, end) token index of every chunk."""
+        spans = []
+        sentence_ends = _sentence_end_tokens(self.encoding_name) if self.sentence_aware else frozenset()
+        start, n = 0, len(tokens)
+        while start < n:
+            end = min(start + self.chunk_size, n)
+            if sentence_ends and end < n:
+                lowest = max(end - self.sentence_window, start + self.chunk_overlap + 1)
+                for i in range(end - 1, lowest - 1, -1):
+                    if tokens[i] in sentence_ends:
+                        end = i + 1
+                        break
+            spans.append((start, end))
+            if end == n:
+                break
+            start = end - self.chunk_overlap
+        return spans
+
+    def _char_offsets(self, tokens: List[int], positions: Iterable[int]) -> dict:
+        """Character offset of each token position, decoding every token once."""
+        offsets = {}
+        chars, previous = 0, 0
+        for position in sorted(set(positions)):
+            if position > previous:
+                chars += len(self.encoding.decode_bytes(tokens[previous:position]).translate(None, _CONTINUATION_BYTES))
+                previous = position
+            offsets[position] = chars
+        return offsets
+
+    def _starts_mid_character(self, token: int) -> bool:
+        first = self.encoding.decode_single_token_bytes(token)[:1]
+        return bool(first) and 0x80 <= first[0] < 0xC0
+
+    def split_text_with_counts(self, text: str) -> List[Tuple[str, int]]:
+        """Chunks with their token counts, which come for free from the boundaries."""
+        if not text:
+            return []
+        tokens = self.encoding.encode_ordinary(text)
+        spans = self.token_spans(tokens)
+        offsets = self._char_offsets(tokens, [position for span in spans for position in span])
+        chunks = []
+        for start, end in spans:
+            first = offsets[start]
+            if start and self._starts_mid_character(tokens[start]):
+                first -= 1
+            chunks.append((text[first : offsets[end]], end - start))
+        return chunks
+
+    def split_text(self, text: str) -> List[str]:
+        return [chunk for chunk, _ in self.split_text_with_counts(text)]
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        return [
+            Document(page_content=chunk, metadata=copy.deepcopy(document.metadata))
+            for document in documents
+            for chunk in self.split_text(document.page_content)
+        ]
+
+
+@lru_cache(maxsize=64)
+def get_chunker(
+    chunk_size: int,
+    chunk_overlap: int = 200,
+    encoding_name: str = "gpt2",
+    sentence_aware: bool = False,
+) -> TokenChunker:
+    """Shared chunker per configuration, chunkers are stateless."""
+    return TokenChunker(chunk_size, chunk_overlap, encoding_name, sentence_aware)
+
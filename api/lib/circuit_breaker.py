@@ -0,0 +1,301 @@
+import logging
+import threading
+import time
+
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from openai import APIConnectionError, APIStatusError, APITimeoutError
+from prometheus_client import Counter, Gauge
+from redis import Redis
+from .single_flight import is_cached
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+CIRCUIT_STATE = Gauge(
+    "llm_circuit_state",
+    "Circuit state per provider deployment (0 closed, 1 half open, 2 open)",
+    ["provider"],
+)
+PROVIDER_HEALTH = Gauge(
+    "llm_provider_health_score",
+    "Share of recent calls that succeeded within the slow call threshold",
+    ["provider"],
+)
+CIRCUIT_DECISIONS = Counter(
+    "llm_circuit_decisions_total",
+    "Routing decisions taken by the circuit breaker",
+    ["provider", "decision"],
+)
+CIRCUIT_TRANSITIONS = Counter(
+    "llm_circuit_transitions_total",
+    "Circuit state changes",
+    ["provider", "state"],
+)
+
+
+def is_provider_failure(error: BaseException) -> bool:
+    """Rate limits, server errors and timeouts count against the provider, bad requests do not."""
+    if isinstance(error, (APITimeoutError, APIConnectionError, TimeoutError)):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if isinstance(error, APIStatusError) or status_code is not None:
+        return status_code == 429 or (status_code or 0) >= 500
+    return "timeout" in type(error).__name__.lower()
+
+
+@dataclass
+class _Call:
+    started: float
+    probe: bool
+    first_token: Optional[float] = None
+
+
+@dataclass
+class _Provider:
+    samples: Deque[Tuple[float, bool]] = field(default_factory=deque)
+    state: str = CLOSED
+    opened_at: float = 0
+    probes: int = 0
+    probed_at: float = 0
+    synced_at: float = 0
+    calls: Dict[UUID, _Call] = field(default_factory=dict)
+
+
+class CircuitBreaker:
+    """Error rate and latency based circuit breaker per provider deployment.
+
+    Outcomes are collected in process through `handler(provider)`, a callback
+    attached to every model. A tripped circuit is also written to Redis, so
+    all workers skip the provider until `open_seconds` passed, after which a
+    few half open probes decide whether it is closed again.
+    """
+
+    def __init__(
+        self,
+        redis_: Optional[Redis] = None,
+        *,
+        error_threshold: float = 0.5,
+        min_requests: int = 10,
+        window: float = 60,
+        open_seconds: float = 30,
+        slow_call_seconds: float = 30,
+        half_open_probes: int = 2,
+        sync_interval: float = 1,
+        prefix: str = "circuit",
+        enabled: bool = True,
+    ) -> None:
+        self.redis = redis_
+        self.error_threshold = error_threshold
+        self.min_requests = min_requests
+        self.window = window
+        self.open_seconds = open_seconds
+        self.slow_call_seconds = slow_call_seconds
+        self.half_open_probes = half_open_probes
+        self.sync_interval = sync_interval
+        self.prefix = prefix
+        self.enabled = enabled
+        self._providers: Dict[str, _Provider] = {}
+        self._handlers: Dict[str, "CircuitBreakerCallback"] = {}
+        self._lock = threading.Lock()
+
+    def _provider(self, name: str) -> _Provider:
+        if (provider := self._providers.get(name)) is None:
+            provider = self._providers.setdefault(name, _Provider())
+            CIRCUIT_STATE.labels(provider=name).set(0)
+            PROVIDER_HEALTH.labels(provider=name).set(1)
+        return provider
+
+    def _open_key(self, name: str) -> str:
+        return f"{self.prefix}:open:{name}"
+
+    def _set_state(self, name: str, provider: _Provider, state: str) -> None:
+        if provider.state == state:
+            return
+        logger.warning(f"Circuit for {name} is now {state}")
+        provider.state = state
+        provider.probes = 0
+        if state == OPEN:
+            provider.opened_at = time.monotonic()
+        if state == CLOSED:
+            provider.samples.clear()
+            PROVIDER_HEALTH.labels(provider=name).set(1)
+        CIRCUIT_STATE.labels(provider=name).set(_STATE_VALUES[state])
+        CIRCUIT_TRANSITIONS.labels(provider=name, state=state).inc()
+
+    def _sync(self, name: str, provider: _Provider) -> None:
+        """Picks up circuits tripped by other workers."""
+        now = time.monotonic()
+        if self.redis is None or now - provider.synced_at < self.sync_interval:
+            return
+        provider.synced_at = now
+        try:
+            ttl = self.redis.pttl(self._open_key(name))
+        except Exception as e:
+            logger.error(f"Failed to read circuit state: {e}")
+            return
+        if ttl and ttl > 0 and provider.state != OPEN:
+            self._set_state(name, provider, OPEN)
+            # Align with the remaining time of the worker that tripped it
+            provider.opened_at = now - (self.open_seconds - ttl / 1000)
+
+    def state(self, name: str) -> str:
+        with self._lock:
+            provider = self._provider(name)
+            self._sync(name, provider)
+            if provider.state == OPEN and time.monotonic() - provider.opened_at >= self.open_seconds:
+                self._set_state(name, provider, HALF_OPEN)
+            return provider.state
+
+    def _probes_left(self, provider: _Provider) -> bool:
+        # Probes that never reported back (e.g. cancelled) are given up on
+        if time.monotonic() - provider.probed_at > self.slow_call_seconds:
+            provider.probes = 0
+        return provider.probes < self.half_open_probes
+
+    def allow(self, name: str) -> bool:
+        """Whether a new request should go to the provider right now, nothing is reserved."""
+        if not self.enabled:
+            return True
+        state = self.state(name)
+        if state == HALF_OPEN:
+            with self._lock:
+                return self._probes_left(self._provider(name))
+        return state == CLOSED
+
+    def route(self, candidates: List[T], name_of: Callable[[T], str]) -> List[T]:
+        """Orders candidates so providers with an open circuit are only tried last.
+
+        Half open probes are only taken when a call is actually sent, see `_started`.
+        """
+        allowed, skipped = [], []
+        for candidate in candidates:
+            (allowed if self.allow(name_of(candidate)) else skipped).append(candidate)
+        return allowed + skipped
+
+    def record(self, name: str, failed: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            provider = self._provider(name)
+            if provider.state == HALF_OPEN:
+                if failed:
+                    self._trip(name, provider)
+                else:
+                    self._set_state(name, provider, CLOSED)
+                    self._clear_redis(name)
+                return
+
+            provider.samples.append((now, failed))
+            while provider.samples and now - provider.samples[0][0] > self.window:
+                provider.samples.popleft()
+            failures = sum(1 for _, sample_failed in provider.samples if sample_failed)
+            total = len(provider.samples)
+            PROVIDER_HEALTH.labels(provider=name).set(1 - failures / total)
+            if provider.state == CLOSED and total >= self.min_requests and failures / total >= self.error_threshold:
+                self._trip(name, provider)
+
+    def _trip(self, name: str, provider: _Provider) -> None:
+        self._set_state(name, provider, OPEN)
+        if self.redis is None:
+            return
+        try:
+            self.redis.set(self._open_key(name), 1, px=int(self.open_seconds * 1000))
+        except Exception as e:
+            logger.error(f"Failed to share circuit state: {e}")
+
+    def _clear_redis(self, name: str) -> None:
+        if self.redis is None:
+            return
+        try:
+            self.redis.delete(self._open_key(name))
+        except Exception as e:
+            logger.error(f"Failed to share circuit state: {e}")
+
+    def _started(self, name: str, run_id: UUID) -> None:
+        state = self.state(name)
+        now = time.monotonic()
+        with self._lock:
+            provider = self._provider(name)
+            probe = state == HALF_OPEN
+            if probe:
+                self._probes_left(provider)
+                provider.probes += 1
+                provider.probed_at = now
+            decision = {CLOSED: "allowed", HALF_OPEN: "probe", OPEN: "last_resort"}[state]
+            CIRCUIT_DECISIONS.labels(provider=name, decision=decision).inc()
+            # Cancelled runs never report back
+            for stale in [run for run, call in provider.calls.items() if now - call.started > 10 * self.slow_call_seconds]:
+                del provider.calls[stale]
+            provider.calls[run_id] = _Call(now, probe)
+
+    def _first_token(self, name: str, run_id: UUID) -> None:
+        call = self._providers[name].calls.get(run_id) if name in self._providers else None
+        if call is not None and call.first_token is None:
+            call.first_token = time.monotonic()
+
+    def _finished(self, name: str, run_id: UUID, error: Optional[BaseException], cached: bool = False) -> None:
+        with self._lock:
+            provider = self._provider(name)
+            call = provider.calls.pop(run_id, None)
+            if cached:
+                # Answered by the LLM cache, the provider was never asked
+                if call is not None and call.probe and provider.probes:
+                    provider.probes -= 1
+                return
+        # Time to first token, a long streamed answer is not a slow provider
+        slow = call is not None and (call.first_token or time.monotonic()) - call.started > self.slow_call_seconds
+        self.record(name, failed=slow or (error is not None and is_provider_failure(error)))
+
+    def handler(self, name: str) -> "CircuitBreakerCallback":
+        with self._lock:
+            if name not in self._handlers:
+                self._handlers[name] = CircuitBreakerCallback(self, name)
+            return self._handlers[name]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {
+                name: {
+                    "state": provider.state,
+                    "requests": len(provider.samples),
+                    "failures": sum(1 for _, failed in provider.samples if failed),
+                }
+                for name, provider in self._providers.items()
+            }
+
+
+class CircuitBreakerCallback(BaseCallbackHandler):
+    """Reports the outcome of every call of one provider to the circuit breaker.
+
+    Runs answered from the LLM cache are not reported.
+    """
+
+    run_inline = True
+
+    def __init__(self, breaker: CircuitBreaker, name: str) -> None:
+        self.breaker = breaker
+        self.name = name
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self.breaker._started(self.name, run_id)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[Any], *, run_id: UUID, **kwargs: Any) -> None:
+        self.breaker._started(self.name, run_id)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        self.breaker._first_token(self.name, run_id)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        self.breaker._finished(self.name, run_id, None, cached=is_cached(response))
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        self.breaker._finished(self.name, run_id, error)
@@ -6,6 +6,7 @@ from pydub import AudioSegment
 from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_openai import ChatOpenAI
+from .structured_output import StructuredOutput
 from deepgram import DeepgramClient, SpeakOptions
 import tenacity
 import io
@@ -118,9 +119,8 @@ The conversation must be of around {minutes} minutes.
             ("human", "Generate a conversation fot the following piece of text data: {data}"),
         ]
         chat_prompt = ChatPromptTemplate.from_messages(messages)
-        structured_llm = self.llm.with_structured_output(schema=Conversation)
-        chain = chat_prompt | structured_llm
-        return chain.invoke({"num_people": num_people, "minutes" : minutes, "data" : data})
+        structured_llm = StructuredOutput(self.llm, Conversation)
+        return structured_llm.invoke(chat_prompt.format_messages(num_people=num_people, minutes=minutes, data=data))
 
     def add_drama(self, convo: Conversation) -> Conversation:
         system_message = """You are an AI designed to help make educational podcast like conversations.
@@ -133,9 +133,8 @@ Only use text in the conversation, No special symbols or emojis or anything else
             ("human", "Make the following conversation more fun and dramatic: {data}"),
         ]
         chat_prompt = ChatPromptTemplate.from_messages(messages)
-        structured_llm = self.llm.with_structured_output(schema=Conversation)
-        chain = chat_prompt | structured_llm
-        return chain.invoke({"data" : convo})
+        structured_llm = StructuredOutput(self.llm, Conversation)
+        return structured_llm.invoke(chat_prompt.format_messages(data=convo))
 
     def run(self, num_people: int, minutes: int, data: str) -> AudioSegment:
         conversation = self.add_drama(self.generate_conversation(num_people, minutes, data))
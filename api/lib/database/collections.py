@@ -1,11 +1,12 @@
 import logging
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional
 from pymongo import MongoClient
 from pymongo.collection import Collection
 from .files import FileDBManager
 from typing import List, Optional
 from pydantic import BaseModel
 from .cache_manager import CacheProtocol
+from ..subjects_summary import SubjectsSummaryCache
 import redis
 
 
@@ -25,6 +26,7 @@ class CollectionDBManager:
         database_name: str,
         file_manager: FileDBManager = None,
         cache_manager: CacheProtocol = None,
+        summary_cache: SubjectsSummaryCache = None,
     ) -> None:
         self.client = MongoClient(connection_string)
         self.db = self.client[database_name]
@@ -40,6 +42,19 @@ class CollectionDBManager:
             self.file_manager = file_manager
 
         self.cache_manager = cache_manager
+        self.summary_cache = summary_cache
+        # Called with (user_id, collection_name) after a subject is added, updated or deleted
+        self.change_listeners: List[Callable[[str, str], None]] = []
+
+    def add_change_listener(self, listener: Callable[[str, str], None]) -> None:
+        self.change_listeners.append(listener)
+
+    def _notify_change(self, user_id: str, collection_name: str) -> None:
+        for listener in self.change_listeners:
+            try:
+                listener(user_id, collection_name)
+            except Exception as e:
+                logging.error(f"Collection change listener failed: {e}")
 
     def get_collection_name_by_uid(self, collection_uid: str) -> Optional[str]:
         if doc := self.collection_collection.find_one(
@@ -50,6 +65,17 @@ class CollectionDBManager:
         return None
 
 
+    def get_collection_names_by_uids(self, collection_uids: List[str]) -> Dict[str, str]:
+        """Names of many collections in one query, missing ones are left out."""
+        if not collection_uids:
+            return {}
+        return {
+            doc["collection_uid"]: doc["name"]
+            for doc in self.collection_collection.find(
+                {"collection_uid": {"$in": list(set(collection_uids))}}, {"collection_uid": 1, "name": 1}
+            )
+        }
+
     def resolve_collection_uid(self, name: str, user_id: str) -> Optional[str]:
         if doc := self.collection_collection.find_one(
             {"name": name, "user_uid": user_id}
@@ -73,6 +99,7 @@ class CollectionDBManager:
     def add_collection(self, collection_model: CollectionModel) -> CollectionModel:
         if not self.collection_exists(collection_model.name, collection_model.user_uid):
             self.collection_collection.insert_one(collection_model.model_dump())
+            self._notify_change(collection_model.user_uid, collection_model.name)
             return collection_model
         else:
             raise ValueError("Subject already exists")
@@ -100,6 +127,15 @@ class CollectionDBManager:
         return CollectionModel(**collection_data)
         
     def get_all_files_for_user_as_string(self, user_id: str) -> str:
+        try:
+            if self.summary_cache:
+                return self.summary_cache.get_or_build(user_id, lambda: self._build_files_summary(user_id))
+            return self._build_files_summary(user_id)
+        except Exception as e:
+            logging.error(f"Error occurred building subjects summary: {e}")
+            return "An error occurred while fetching data."
+
+    def _build_files_summary(self, user_id: str) -> str:
         pipeline = [
             {"$match": {"user_uid": user_id}},
             {
@@ -131,26 +167,20 @@ class CollectionDBManager:
             }
         ]
 
+        data = list(self.collection_collection.aggregate(pipeline))
+        if not data:
+            return "No subjects or files found, You can create a subject for the user."
+        parts = []
+        for subject in data:
+            subject_name = subject['name']
+            parts.append(f"Subject name: '{subject_name}'\nFiles:\n")
+            for file in subject['files']:
+                parts.append(f"- Filename: '{file['friendly_filename']}' Filetype: '({file.get('filetype', 'No type')})' Description: '{file.get('description', 'No desc')}')\n")
+            if not subject['files']:
+                parts.append(f"- This subject has no files, ask the user to upload a file in the app or help with your knowledge. You can also create files from youtube or web links. Documents have to be added manually ")
+            parts.append("\n")  # Add extra newline for separation between subjects
+        return "".join(parts)
 
-        try:
-            data = list(self.collection_collection.aggregate(pipeline))
-            output_string = ""
-            if not data:
-                return "No subjects or files found, You can create a subject for the user."
-            for subject in data:
-                subject_name = subject['name']
-                output_string += f"Subject name: '{subject_name}'\nFiles:\n"
-                for file in subject['files']:
-                    output_string += f"- Filename: '{file['friendly_filename']}' Filetype: '({file.get('filetype', 'No type')})' Description: '{file.get('description', 'No desc')}')\n"
-                if not subject['files']:
-                    output_string += f"- This subject has no files, ask the user to upload a file in the app or help with your knowledge. You can also create files from youtube or web links. Documents have to be added manually "
-                output_string += "\n"  # Add extra newline for separation between subjects
-
-            return output_string
-        except Exception as e:
-            print(f"Error occurred: {e} {data}")
-            return "An error occurred while fetching data."
-        
     def get_all_by_user(self, user_id: str, dict: bool = False) -> List[CollectionModel] | List[Dict]:
         pipeline = [
             {"$match": {"user_uid": user_id}},
@@ -185,12 +215,14 @@ class CollectionDBManager:
         result = self.collection_collection.update_one(
             {"collection_uid": collection_uid}, {"$set": kwargs}
         )
+        self._notify_change(user_id, collection_name)
         return result.modified_count
 
     def delete_collection(self, user_id: str, collection_name: str) -> int:
         collection_uid = self.resolve_collection_uid(collection_name, user_id)
         deleted_count = self.file_manager.delete_many_files(user_id, collection_name)
         result = self.collection_collection.delete_one({"collection_uid": collection_uid})
+        self._notify_change(user_id, collection_name)
         return result.deleted_count
 
     def delete_all(self, user_id: str) -> int:
@@ -202,5 +234,7 @@ class CollectionDBManager:
             total_deleted_count += deleted_count
 
         result = self.collection_collection.delete_many({"user_uid": user_id})
+        for collection in collections:
+            self._notify_change(user_id, collection.name)
         logging.info(f"Deleted {result.deleted_count} files")
         return result.deleted_count
@@ -1,4 +1,8 @@
-from typing import Dict, List, Optional
+import logging
+import shutil
+
+from typing import BinaryIO, Callable, Dict, Iterable, List, Optional, Set, Tuple
+from bson import ObjectId
 from pymongo import MongoClient
 from pymongo.collection import Collection
 from gridfs import GridFS, NoFile
@@ -31,27 +35,70 @@ class FileDBManager:
         self.file_collection: Collection = self.db["files"]
         self.fs = GridFS(self.db)
         self.cache = cache
+        # Called with (user_id, collection_name) whenever files of a subject change
+        self.change_listeners: List[Callable[[str, str], None]] = []
 
         # Create unique index
         self.file_collection.create_index(
             [("user_id", 1), ("collection_uid", 1), ("filename", 1)], unique=True
         )
+        # Uploads are only deleted while no file references them
+        self.file_collection.create_index("file_id")
 
     def resolve_collection_uid(self, user_id: str, collection_name: str) -> str:
         return self.collection_manager.resolve_collection_uid(collection_name, user_id)
 
-    def add_file(self, file_model: FileModel) -> FileModel:
+    def add_change_listener(self, listener: Callable[[str, str], None]) -> None:
+        self.change_listeners.append(listener)
+
+    def _notify_change(self, user_id: str, collection_name: str) -> None:
+        for listener in self.change_listeners:
+            try:
+                listener(user_id, collection_name)
+            except Exception as e:
+                logging.error(f"File change listener failed: {e}")
+
+    def put_upload(self, file_stream: BinaryIO, filename: str) -> str:
+        """Stores raw upload bytes in GridFS without a file record, see `add_file(upload_id=...)`."""
+        return str(self.fs.put(file_stream, filename=filename))
+
+    def read_upload(self, upload_id: str, target: BinaryIO, buffer_size: int = 1024 * 1024) -> None:
+        shutil.copyfileobj(self.fs.get(ObjectId(upload_id)), target, buffer_size)
+
+    def delete_upload(self, upload_id: str) -> bool:
+        """Deletes an upload no file record references, returns whether it did."""
+        if self.file_collection.find_one({"file_id": ObjectId(upload_id)}, {"_id": 1}) is not None:
+            return False
+        self.fs.delete(ObjectId(upload_id))
+        return True
+
+    def add_file(
+        self,
+        file_model: FileModel,
+        file_stream: Optional[BinaryIO] = None,
+        upload_id: Optional[str] = None,
+    ) -> FileModel:
+        """Stores the file, reading its contents from `file_stream` instead of `file_bytes` when given.
+
+        With `upload_id` the contents were already stored by `put_upload` and are only referenced.
+        """
         collection_uid = self.resolve_collection_uid(
             file_model.user_id, file_model.collection_name
         )
         if self.file_exists(file_model.user_id, collection_uid, file_model.filename):
             raise ValueError("File already exists")
 
-        file_id = self.fs.put(file_model.file_bytes, filename=file_model.filename)
+        if upload_id is not None:
+            file_id = ObjectId(upload_id)
+        else:
+            file_id = self.fs.put(
+                file_stream if file_stream is not None else file_model.file_bytes, filename=file_model.filename
+            )
         file_data = file_model.model_dump(exclude={"file_bytes"})
         file_data["file_id"] = file_id
         file_data["collection_uid"] = collection_uid  # Use collection_uid
         self.file_collection.insert_one(file_data)
+        self._notify_change(file_model.user_id, file_model.collection_name)
         return file_model
 
     def get_file_by_name(
@@ -90,6 +137,22 @@ class FileDBManager:
             > 0
         )
 
+    def find_existing_files(self, user_id: str, files: Iterable[Tuple[str, str]]) -> Set[Tuple[str, str]]:
+        """The (collection_uid, filename) pairs of `files` that exist, in one query."""
+        files = set(files)
+        if not files:
+            return set()
+        return {
+            (doc["collection_uid"], doc["filename"])
+            for doc in self.file_collection.find(
+                {
+                    "user_id": user_id,
+                    "$or": [{"collection_uid": uid, "filename": filename} for uid, filename in files],
+                },
+                {"collection_uid": 1, "filename": 1},
+            )
+        }
+
     def update_file(
         self,
         user_id: str,
@@ -133,6 +196,7 @@ class FileDBManager:
             },
             {"$set": kwargs},
         )
+        self._notify_change(user_id, collection_name)
         return result.modified_count
 
     def count_files_in_collection(self, user_id: str, collection_name: str) -> int:
@@ -160,6 +224,7 @@ class FileDBManager:
                     "filename": filename,
                 }
             )
+            self._notify_change(user_id, collection_name)
             return 1
 
         return 0
@@ -175,6 +240,7 @@ class FileDBManager:
             self.fs.delete(doc["file_id"])
 
         result = self.file_collection.delete_many(query)
+        self._notify_change(user_id, collection_name)
         return result.deleted_count
 
     def get_all_files(
@@ -1,5 +1,8 @@
+import logging
+import threading
+
 from typing import List, Optional
-from pymongo import MongoClient
+from pymongo import ASCENDING, DESCENDING, MongoClient, ReturnDocument, UpdateOne
 from pymongo.collection import Collection
 from enum import Enum
 from pydantic import BaseModel, Field
@@ -48,12 +51,27 @@ class LatestConversation(BaseModel):
     latest_message: Optional[MessagePair]
     conversation_id: str
 
+class MessagesPage(BaseModel):
+    messages: List[MessagePair] = Field(default_factory=list)  # oldest first
+    next_cursor: Optional[int] = None  # pass back as `cursor` for older messages, None when there are none
+
+
 class UserLatestConversations(BaseModel):
     user_id: str
     conversations: List[LatestConversation] = Field(default_factory=list)
 
 
 class MessageDBManager:
+    """Conversations and their messages, one document each.
+
+    A conversation document carries its metadata, message count and latest
+    message, messages are numbered by `seq` within their conversation, so
+    listing conversations never loads messages and history pages are index
+    range scans. Users still in the legacy `messages` collection, with every
+    conversation in one document, are copied over on first access, see
+    `migrate_user` and scripts/migrate_conversations.py.
+    """
+
     def __init__(
         self,
         connection_string: str,
@@ -64,23 +82,91 @@ class MessageDBManager:
     ) -> None:
         self.client = MongoClient(connection_string)
         self.db = self.client[database_name]
+        # Legacy, one document per user with all conversations
         self.message_collection: Collection = self.db["messages"]
         self.message_collection.create_index("user_id", unique=False)
+        self.conversation_collection: Collection = self.db["conversations"]
+        self.conversation_collection.create_index("conversation_id", unique=True)
+        self.conversation_collection.create_index([("user_id", ASCENDING), ("_id", ASCENDING)])
+        self.conversation_message_collection: Collection = self.db["conversation_messages"]
+        self.conversation_message_collection.create_index(
+            [("conversation_id", ASCENDING), ("seq", DESCENDING)], unique=True
+        )
+        self.conversation_message_collection.create_index("user_id", unique=False)
         self.collection_dbmanager = collection_dbmanager
         self.file_dbmanager = file_dbmanager
         self.cache_manager = cache_manager
-        
+        self._migrated_users = set()
+        self._migrated_lock = threading.Lock()
+
+    def migrate_user(self, user_id: str) -> int:
+        """Copies a user's legacy conversations, returns how many. Safe to repeat or run concurrently.
+
+        Everything is written with $setOnInsert, so a copy never overwrites a
+        conversation that was already copied and has changed since.
+        """
+        legacy = self.message_collection.find_one({"user_id": user_id}, {"conversations": 1})
+        if not legacy:
+            return 0
+
+        now = datetime.utcnow()
+        conversations = legacy.get("conversations") or {}
+        for conversation_id, conversation in conversations.items():
+            messages = conversation.get("messages") or []
+            self.conversation_collection.update_one(
+                {"conversation_id": conversation_id},
+                {
+                    "$setOnInsert": {
+                        "user_id": user_id,
+                        "metadata": conversation.get("metadata") or {},
+                        "message_count": len(messages),
+                        "latest_message": messages[-1] if messages else None,
+                        "updated_at": now,
+                    }
+                },
+                upsert=True,
+            )
+            if messages:
+                self.conversation_message_collection.bulk_write(
+                    [
+                        UpdateOne(
+                            {"conversation_id": conversation_id, "seq": seq},
+                            {"$setOnInsert": {"user_id": user_id, **message}},
+                            upsert=True,
+                        )
+                        for seq, message in enumerate(messages, start=1)
+                    ],
+                    ordered=False,
+                )
+        self.message_collection.update_one({"_id": legacy["_id"]}, {"$set": {"migrated_at": now}})
+        logging.info(f"Migrated {len(conversations)} conversations of {user_id}")
+        return len(conversations)
+
+    def _ensure_migrated(self, user_id: str) -> None:
+        if user_id in self._migrated_users:
+            return
+        if self.message_collection.find_one(
+            {"user_id": user_id, "migrated_at": {"$exists": False}}, {"_id": 1}
+        ):
+            self.migrate_user(user_id)
+        with self._migrated_lock:
+            if len(self._migrated_users) > 100_000:
+                self._migrated_users.clear()
+            self._migrated_users.add(user_id)
+
     def add_conversation(self, user_id: str, metadata: ConversationMetadata) -> str:
+        self._ensure_migrated(user_id)
         conversation_id = str(uuid.uuid4())
-        conversation = Conversation(metadata=metadata)
-        self.message_collection.update_one(
-            {"user_id": user_id},
+        conversation = Conversation(metadata=metadata).custom_model_dump()
+        self.conversation_collection.insert_one(
             {
-                "$set": {
-                    f"conversations.{conversation_id}": conversation.custom_model_dump()
-                }
-            },
-            upsert=True,
+                "conversation_id": conversation_id,
+                "user_id": user_id,
+                "metadata": conversation["metadata"],
+                "message_count": 0,
+                "latest_message": None,
+                "updated_at": datetime.utcnow(),
+            }
         )
         self.cache_manager.delete(f"messages:{user_id}:{conversation_id}")
         return conversation_id
@@ -88,70 +174,118 @@ class MessageDBManager:
     def add_message(
         self, user_id: str, conversation_id: str, human_message: str, bot_response: str
     ) -> None:
+        self._ensure_migrated(user_id)
         message_pair = MessagePair(
             human_message=human_message, bot_response=bot_response
+        ).model_dump()
+        # Claims the next sequence number and updates the latest message in one write
+        conversation = self.conversation_collection.find_one_and_update(
+            {"conversation_id": conversation_id, "user_id": user_id},
+            {
+                "$inc": {"message_count": 1},
+                "$set": {"latest_message": message_pair, "updated_at": datetime.utcnow()},
+            },
+            projection={"message_count": 1},
+            return_document=ReturnDocument.AFTER,
         )
-        # Before updating, check if the conversation exists
-        if not self.message_collection.count_documents(
-            {"user_id": user_id, f"conversations.{conversation_id}": {"$exists": True}},
-            limit=1,
-        ):
+        if not conversation:
             raise ValueError(
                 f"No conversation found with conversation_id: {conversation_id} for user_id: {user_id}"
             )
-        
-        self.message_collection.update_one(
-            {"user_id": user_id},
+
+        self.conversation_message_collection.insert_one(
             {
-                "$push": {
-                    f"conversations.{conversation_id}.messages": message_pair.model_dump()
-                }
-            },
+                "conversation_id": conversation_id,
+                "user_id": user_id,
+                "seq": conversation["message_count"],
+                **message_pair,
+            }
         )
         # Invalidate cache
         self.cache_manager.delete(f"messages:{user_id}:{conversation_id}")
 
+    def _find_messages(
+        self, user_id: str, conversation_id: str, before: Optional[int], limit: Optional[int]
+    ) -> List[dict]:
+        """Newest first."""
+        query = {"conversation_id": conversation_id, "user_id": user_id}
+        if before is not None:
+            query["seq"] = {"$lt": before}
+        cursor = self.conversation_message_collection.find(
+            query, {"_id": 0, "seq": 1, "human_message": 1, "bot_response": 1}
+        ).sort("seq", DESCENDING)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
 
     def get_messages(
-        self, user_id: str, conversation_id: str
+        self, user_id: str, conversation_id: str, limit: Optional[int] = None
     ) -> Optional[List[MessagePair]]:
-        cached_data = self.cache_manager.get(f"messages:{user_id}:{conversation_id}")
-        
-        if cached_data is not None:
-            return [MessagePair(**message) for message in cached_data]
+        """All messages oldest first, or only the latest `limit`."""
+        self._ensure_migrated(user_id)
+        if limit is None:
+            cached_data = self.cache_manager.get(f"messages:{user_id}:{conversation_id}")
+            if cached_data is not None:
+                return [MessagePair(**message) for message in cached_data]
 
-        if user_data := self.message_collection.find_one(
-            {"user_id": user_id}, {"conversations": {conversation_id: 1}}
-        ):
-            messages = (
-                user_data.get("conversations", {})
-                .get(conversation_id, {})
-                .get("messages", [])
-            )
+        messages = [
+            {"human_message": message["human_message"], "bot_response": message["bot_response"]}
+            for message in reversed(self._find_messages(user_id, conversation_id, None, limit))
+        ]
+        if not messages and not self.conversation_exists(user_id, conversation_id):
+            return None
+        if limit is None:
             self.cache_manager.set(f"messages:{user_id}:{conversation_id}", messages)
-            return [MessagePair(**message) for message in messages]
-        else:
+        return [MessagePair(**message) for message in messages]
+
+    def get_messages_page(
+        self, user_id: str, conversation_id: str, cursor: Optional[int] = None, limit: int = 50
+    ) -> Optional[MessagesPage]:
+        """`limit` messages older than `cursor`, the latest ones without a cursor."""
+        self._ensure_migrated(user_id)
+        messages = self._find_messages(user_id, conversation_id, cursor, limit + 1)
+        if not messages and not self.conversation_exists(user_id, conversation_id):
             return None
+        has_more = len(messages) > limit
+        messages = list(reversed(messages[:limit]))
+        return MessagesPage(
+            messages=[MessagePair(**message) for message in messages],
+            next_cursor=messages[0]["seq"] if has_more else None,
+        )
 
     def get_all_conversations(self, user_id: str) -> Optional[List[LatestConversation]]:
-        if not (
-            user_data := self.message_collection.find_one(
-                {"user_id": user_id}, {"conversations": 1}
-            )
-        ):
+        self._ensure_migrated(user_id)
+        conversations = list(
+            self.conversation_collection.find(
+                {"user_id": user_id}, {"conversation_id": 1, "metadata": 1, "latest_message": 1}
+            ).sort("_id", ASCENDING)
+        )
+        if not conversations:
             return None
+
+        metadatas = [ConversationMetadata.model_validate(conv.get("metadata") or {}) for conv in conversations]
+        # Names and files of all conversations resolved in two queries
+        collection_names = self.collection_dbmanager.get_collection_names_by_uids(
+            [metadata.collection_uid for metadata in metadatas if metadata.collection_uid]
+        )
+        existing_files = self.file_dbmanager.find_existing_files(
+            user_id,
+            [
+                (metadata.collection_uid, metadata.file_name)
+                for metadata in metadatas
+                if metadata.chat_type == ChatType.FILE and metadata.collection_uid and metadata.file_name
+            ],
+        )
+
         latest_conversations = []
-        for conv_id, conv_data in user_data.get("conversations", {}).items():
+        for conv, metadata in zip(conversations, metadatas):
             latest_message = (
-                MessagePair(**conv_data["messages"][-1])
-                if conv_data["messages"]
+                MessagePair(**conv["latest_message"])
+                if conv.get("latest_message")
                 else None
             )
 
-            metadata = ConversationMetadata.model_validate(conv_data.get("metadata"))
-            collection_name = self.collection_dbmanager.get_collection_name_by_uid(
-                metadata.collection_uid
-            )
+            collection_name = collection_names.get(metadata.collection_uid)
             if not collection_name and metadata.chat_type in {
                 ChatType.FILE,
                 ChatType.COLLECTION,
@@ -160,9 +294,7 @@ class MessageDBManager:
                 metadata.chat_type = ChatType.DELETED
 
             if (
-                self.file_dbmanager.file_exists(
-                    user_id, metadata.collection_uid, metadata.file_name
-                )
+                (metadata.collection_uid, metadata.file_name) in existing_files
                 or metadata.chat_type != ChatType.FILE
             ):
                 file_name = metadata.file_name
@@ -171,7 +303,7 @@ class MessageDBManager:
                 metadata.chat_type = ChatType.DELETED
 
             latest_conversation = LatestConversation(
-                conversation_id=conv_id,
+                conversation_id=conv["conversation_id"],
                 metadata=ConversationResponse(
                     collection_name=collection_name,
                     file_name=file_name,
@@ -184,17 +316,29 @@ class MessageDBManager:
         return latest_conversations
 
     def delete_conversation(self, user_id: str, conversation_id: str) -> int:
-        result = self.message_collection.update_one(
-            {"user_id": user_id}, {"$unset": {f"conversations.{conversation_id}": 1}}
+        self._ensure_migrated(user_id)
+        result = self.conversation_collection.delete_one(
+            {"conversation_id": conversation_id, "user_id": user_id}
         )
+        if result.deleted_count:
+            self.conversation_message_collection.delete_many({"conversation_id": conversation_id})
         self.cache_manager.delete(f"messages:{user_id}:{conversation_id}")
-        return result.modified_count
+        return result.deleted_count
 
     def delete_all_conversations(self, user_id: str) -> int:
-        result = self.message_collection.update_one(
-            {"user_id": user_id}, {"$set": {"conversations": {}}}
+        conversation_ids = [
+            conv["conversation_id"]
+            for conv in self.conversation_collection.find({"user_id": user_id}, {"conversation_id": 1})
+        ]
+        result = self.conversation_collection.delete_many({"user_id": user_id})
+        self.conversation_message_collection.delete_many({"user_id": user_id})
+        # Legacy conversations go too, whether they were copied or not
+        self.message_collection.update_one(
+            {"user_id": user_id}, {"$set": {"conversations": {}, "migrated_at": datetime.utcnow()}}
         )
-        return result.modified_count
+        for conversation_id in conversation_ids:
+            self.cache_manager.delete(f"messages:{user_id}:{conversation_id}")
+        return result.deleted_count
 
     def conversation_exists(self, user_id: str, conversation_id: str) -> bool:
         """
@@ -207,8 +351,9 @@ class MessageDBManager:
         Returns:
             bool: True if the conversation exists, False otherwise.
         """
-        exists = self.message_collection.find_one(
-            {"user_id": user_id, f"conversations.{conversation_id}": {"$exists": True}},
+        self._ensure_migrated(user_id)
+        exists = self.conversation_collection.find_one(
+            {"conversation_id": conversation_id, "user_id": user_id},
             {"_id": 1},
         )
         return exists is not None
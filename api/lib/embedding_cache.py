@@ -0,0 +1,134 @@
+import hashlib
+import logging
+import re
+import time
+import unicodedata
+import numpy as np
+
+from typing import Dict, List, Optional
+from langchain.embeddings.base import Embeddings
+from prometheus_client import Counter
+from redis import Redis
+
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_REQUESTS = Counter(
+    "embedding_cache_requests_total",
+    "Texts looked up in the embedding cache",
+    ["kind", "result"],
+)
+EMBEDDING_CACHE_EVICTIONS = Counter(
+    "embedding_cache_evictions_total",
+    "Embeddings evicted to keep the cache within its size bound",
+)
+
+
+def normalize_chunk(text: str) -> str:
+    """Unicode and whitespace normalization, so re-extracted copies of a chunk share a key."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", text)).strip()
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeddings wrapper that reuses vectors across users by content hash.
+
+    Vectors are stored as float16 bytes in Redis under (model, sha256 of the
+    normalized text) and nothing else, per user metadata never leaves the
+    vector store. A sorted set of last access times bounds the cache to
+    `max_entries`, evicting the least recently used vectors first.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        redis_: Optional[Redis],
+        model: str,
+        max_entries: int = 100_000,
+        ttl: int = 30 * 24 * 60 * 60,
+        prefix: str = "emb",
+        enabled: bool = True,
+    ) -> None:
+        self.embeddings = embeddings
+        self.redis = redis_
+        self.model = model
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.prefix = prefix
+        self.enabled = enabled and redis_ is not None
+        self._index_key = f"{prefix}:{model}:lru"
+
+    def _key(self, text: str) -> str:
+        digest = hashlib.sha256(normalize_chunk(text).encode()).hexdigest()
+        return f"{self.prefix}:{self.model}:{digest}"
+
+    @staticmethod
+    def _pack(vector: List[float]) -> bytes:
+        return np.asarray(vector, dtype=np.float16).tobytes()
+
+    @staticmethod
+    def _unpack(data: bytes) -> List[float]:
+        return np.frombuffer(data, dtype=np.float16).astype(np.float32).tolist()
+
+    def _lookup(self, keys: List[str]) -> List[Optional[bytes]]:
+        try:
+            values = self.redis.mget(keys)
+            if hits := [key for key, value in zip(keys, values) if value is not None]:
+                self.redis.zadd(self._index_key, {key: time.time() for key in hits})
+            return values
+        except Exception as e:
+            logger.error(f"Embedding cache lookup failed: {e}")
+            return [None] * len(keys)
+
+    def _store(self, entries: Dict[str, bytes]) -> None:
+        try:
+            now = time.time()
+            pipe = self.redis.pipeline(transaction=False)
+            for key, value in entries.items():
+                pipe.set(key, value, ex=self.ttl)
+            pipe.zadd(self._index_key, {key: now for key in entries})
+            pipe.zcard(self._index_key)
+            size = pipe.execute()[-1]
+            if size > self.max_entries:
+                self._evict(size - self.max_entries)
+        except Exception as e:
+            logger.error(f"Embedding cache update failed: {e}")
+
+    def _evict(self, count: int) -> None:
+        evicted = [key for key, _ in self.redis.zpopmin(self._index_key, count)]
+        if evicted:
+            self.redis.delete(*evicted)
+            EMBEDDING_CACHE_EVICTIONS.inc(len(evicted))
+
+    def _embed(self, texts: List[str], kind: str, embed) -> List[List[float]]:
+        if not self.enabled or not texts:
+            return embed(texts)
+
+        keys = [self._key(text) for text in texts]
+        cached = self._lookup(keys)
+        vectors: List[Optional[List[float]]] = [self._unpack(value) if value else None for value in cached]
+
+        # Identical chunks within one upload are embedded once
+        missing: Dict[str, List[int]] = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+        EMBEDDING_CACHE_REQUESTS.labels(kind=kind, result="hit").inc(len(texts) - sum(map(len, missing.values())))
+        EMBEDDING_CACHE_REQUESTS.labels(kind=kind, result="miss").inc(sum(map(len, missing.values())))
+        if not missing:
+            return vectors
+
+        new_vectors = embed([texts[positions[0]] for positions in missing.values()])
+        entries = {}
+        for (key, positions), vector in zip(missing.items(), new_vectors):
+            entries[key] = self._pack(vector)
+            # Return what a later hit would return, so results do not depend on cache state
+            for i in positions:
+                vectors[i] = self._unpack(entries[key])
+        self._store(entries)
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, "document", self.embeddings.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], "query", lambda texts: [self.embeddings.embed_query(texts[0])])[0]
@@ -0,0 +1,194 @@
+import hashlib
+import json
+import logging
+import time
+import zlib
+
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+from langchain.schema import Document
+from prometheus_client import Counter
+from redis import Redis
+
+
+logger = logging.getLogger(__name__)
+
+EXTRACTION_CACHE_REQUESTS = Counter(
+    "extraction_cache_requests_total",
+    "File extraction results looked up in the cache",
+    ["mode", "result"],
+)
+
+
+def file_digest(path: str, buffer_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(buffer_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """Extraction results (text, pages, OCR output) keyed by file sha256 and extraction mode.
+
+    The same file uploaded again, by anyone, skips extraction and LLM OCR.
+    Values are JSON compressed with zlib. A sorted set of last access times
+    bounds the cache to `max_entries`, least recently used first, and values
+    larger than `max_value_bytes` after compression are not stored. Reads
+    renew the TTL, so entries expire `ttl` after their last access and are
+    dropped from the sorted set and the size hash by that score.
+    """
+
+    def __init__(
+        self,
+        redis_: Optional[Redis],
+        max_entries: int = 20_000,
+        max_value_bytes: int = 4 * 1024 * 1024,
+        ttl: int = 30 * 24 * 60 * 60,
+        prefix: str = "extract",
+        enabled: bool = True,
+    ) -> None:
+        self.redis = redis_
+        self.max_entries = max_entries
+        self.max_value_bytes = max_value_bytes
+        self.ttl = ttl
+        self.prefix = prefix
+        self.enabled = enabled and redis_ is not None
+        self._index_key = f"{prefix}:lru"
+        self._stats_key = f"{prefix}:stats"
+        self._sizes_key = f"{prefix}:sizes"
+
+    def _key(self, digest: str, mode: str) -> str:
+        return f"{self.prefix}:{mode}:{digest}"
+
+    def _count(self, mode: str, result: str, **fields: int) -> None:
+        EXTRACTION_CACHE_REQUESTS.labels(mode=mode, result=result).inc()
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.hincrby(self._stats_key, result, 1)
+            for name, value in fields.items():
+                pipe.hincrby(self._stats_key, name, value)
+            pipe.execute()
+        except Exception as e:
+            logger.error(f"Extraction cache stats update failed: {e}")
+
+    def get(self, digest: str, mode: str) -> Optional[Any]:
+        if not self.enabled:
+            return None
+        key = self._key(digest, mode)
+        try:
+            data = self.redis.get(key)
+            if data is None:
+                self._count(mode, "miss")
+                return None
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zadd(self._index_key, {key: time.time()})
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+            value = json.loads(zlib.decompress(data))
+        except Exception as e:
+            logger.error(f"Extraction cache lookup failed: {e}")
+            return None
+        self._count(mode, "hit")
+        return value
+
+    def put(self, digest: str, mode: str, value: Any) -> None:
+        if not self.enabled or not value:
+            return
+        key = self._key(digest, mode)
+        try:
+            data = zlib.compress(json.dumps(value).encode(), 6)
+            if len(data) > self.max_value_bytes:
+                return
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.set(key, data, ex=self.ttl)
+            pipe.zadd(self._index_key, {key: time.time()})
+            # Replaces the size of an overwritten value
+            pipe.hset(self._sizes_key, key, len(data))
+            pipe.execute()
+            self._drop_expired()
+            size = self.redis.zcard(self._index_key)
+            if size > self.max_entries:
+                self._evict(size - self.max_entries)
+        except Exception as e:
+            logger.error(f"Extraction cache update failed: {e}")
+
+    def _drop_expired(self) -> None:
+        """Forgets entries Redis expired, their last access is older than the TTL."""
+        if expired := self.redis.zrangebyscore(self._index_key, "-inf", time.time() - self.ttl):
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zrem(self._index_key, *expired)
+            pipe.hdel(self._sizes_key, *expired)
+            pipe.execute()
+
+    def _evict(self, count: int) -> None:
+        if evicted := [key for key, _ in self.redis.zpopmin(self._index_key, count)]:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.delete(*evicted)
+            pipe.hdel(self._sizes_key, *evicted)
+            pipe.hincrby(self._stats_key, "evictions", len(evicted))
+            pipe.execute()
+
+    def get_or_compute(
+        self, digest: str, mode: str, compute: Callable[[], Any], cacheable: Optional[Callable[[Any], bool]] = None
+    ) -> Any:
+        """Cached value, or the result of `compute` which must be JSON serializable.
+
+        Results `cacheable` rejects, e.g. partial ones, are returned but not stored.
+        """
+        if (value := self.get(digest, mode)) is not None:
+            return value
+        value = compute()
+        if cacheable is None or cacheable(value):
+            self.put(digest, mode, value)
+        else:
+            EXTRACTION_CACHE_REQUESTS.labels(mode=mode, result="uncacheable").inc()
+        return value
+
+    def documents(
+        self,
+        digest: str,
+        mode: str,
+        load: Callable[[], List[Document]],
+        cacheable: Optional[Callable[[List[Document]], bool]] = None,
+    ) -> List[Document]:
+        pages = self.get_or_compute(
+            digest,
+            mode,
+            lambda: [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in load()],
+            (lambda pages: cacheable([Document(**page) for page in pages])) if cacheable else None,
+        )
+        return [Document(**page) for page in pages]
+
+    def stream(self, digest: str, mode: str, blocks: Callable[[], Iterable[str]]) -> Iterator[str]:
+        """Replays cached text, or passes `blocks` through and stores them once exhausted."""
+        if (text := self.get(digest, mode)) is not None:
+            yield text
+            return
+        seen: List[str] = []
+        for block in blocks():
+            seen.append(block)
+            yield block
+        self.put(digest, mode, "".join(seen))
+
+    def stats(self) -> Dict[str, Any]:
+        if not self.enabled:
+            return {"enabled": False}
+        try:
+            self._drop_expired()
+            counters = {name.decode(): int(value) for name, value in self.redis.hgetall(self._stats_key).items()}
+            entries = self.redis.zcard(self._index_key)
+            stored_bytes = sum(int(size) for size in self.redis.hvals(self._sizes_key))
+        except Exception as e:
+            logger.error(f"Failed to read extraction cache stats: {e}")
+            return {"enabled": True, "error": str(e)}
+        hits, misses = counters.get("hit", 0), counters.get("miss", 0)
+        return {
+            "enabled": True,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "stored_bytes": stored_bytes,
+        }
@@ -0,0 +1,258 @@
+import logging
+import threading
+import time
+
+from collections import defaultdict
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+from uuid import UUID
+from langchain_community.callbacks.openai_info import get_openai_token_cost_for_model
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+from prometheus_client import Counter, Histogram
+
+
+logger = logging.getLogger(__name__)
+
+_current_run: ContextVar[Optional["FeatureRun"]] = ContextVar("feature_metrics_run", default=None)
+# Attaches the current run to every LLM call made in its scope, like get_openai_callback
+register_configure_hook(_current_run, inheritable=True)
+
+FEATURE_TOKENS = Counter(
+    "llm_feature_tokens_total",
+    "Prompt and completion tokens per feature",
+    ["feature", "model", "premium", "cache", "kind"],
+)
+FEATURE_COST = Counter(
+    "llm_feature_cost_usd_total",
+    "Estimated model spend per feature",
+    ["feature", "model", "premium", "cache"],
+)
+FEATURE_DURATION = Histogram(
+    "feature_duration_seconds",
+    "Wall time of a feature request, including streamed responses",
+    ["feature", "premium", "cache", "status"],
+    buckets=(0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300),
+)
+FEATURE_LLM_CALL_SECONDS = Histogram(
+    "llm_feature_call_seconds",
+    "Latency of single model calls per feature",
+    ["feature", "model", "premium"],
+    buckets=(0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120),
+)
+FEATURE_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_feature_first_token_seconds",
+    "Time to the first streamed token per feature",
+    ["feature", "model", "premium"],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30),
+)
+FEATURE_RETRIES = Counter(
+    "llm_feature_retries_total",
+    "Provider requests beyond one per model call (client retries)",
+    ["feature", "premium"],
+)
+
+_encoding = None
+
+
+def _count_tokens(text: str) -> int:
+    """Fallback for streamed answers, which come without usage data."""
+    global _encoding
+    try:
+        if _encoding is None:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text, disallowed_special=()))
+    except Exception:
+        return len(text) // 4
+
+
+def _cost(model: str, tokens: int, is_completion: bool) -> float:
+    try:
+        return get_openai_token_cost_for_model(model, tokens, is_completion=is_completion)
+    except Exception:
+        return 0.0
+
+
+class FeatureRun(BaseCallbackHandler):
+    """Collects what one feature request spent on models and reports it when finished."""
+
+    run_inline = True
+
+    def __init__(self, feature: str) -> None:
+        self.feature = feature
+        self.premium = False
+        self.started = time.monotonic()
+        self.deferred = False
+        self.finished = False
+        self.llm_calls = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.http_requests = 0
+        self.retries = 0
+        self.tokens: Dict[str, Dict[str, int]] = defaultdict(lambda: {"prompt": 0, "completion": 0})
+        self._calls: Dict[UUID, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def premium_label(self) -> str:
+        return str(bool(self.premium)).lower()
+
+    def cache_label(self) -> str:
+        if self.cache_hits and not self.cache_misses:
+            return "hit"
+        if self.cache_hits:
+            return "partial"
+        return "miss"
+
+    def _start(self, run_id: UUID, prompt: str, kwargs: Dict[str, Any]) -> None:
+        params = kwargs.get("invocation_params") or {}
+        model = params.get("model_name") or params.get("model") or params.get("deployment_name") or "unknown"
+        with self._lock:
+            self.llm_calls += 1
+            self._calls[run_id] = {
+                "model": model,
+                "started": time.monotonic(),
+                "prompt": prompt,
+                "first_token": None,
+                "streamed": [],
+                "cache_hits": self.cache_hits,
+            }
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str], *, run_id: UUID, **kwargs: Any) -> None:
+        self._start(run_id, "\n".join(prompts), kwargs)
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], *, run_id: UUID, **kwargs: Any) -> None:
+        prompt = "\n".join(str(message.content) for batch in messages for message in batch)
+        self._start(run_id, prompt, kwargs)
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            if (call := self._calls.get(run_id)) is None:
+                return
+            call["streamed"].append(token)
+            if call["first_token"] is None:
+                call["first_token"] = time.monotonic()
+                FEATURE_FIRST_TOKEN_SECONDS.labels(
+                    feature=self.feature, model=call["model"], premium=self.premium_label
+                ).observe(call["first_token"] - call["started"])
+
+    def on_retry(self, retry_state: Any, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            call = self._calls.pop(run_id, None)
+        if call is None:
+            return
+        llm_output = response.llm_output or {}
+        model = llm_output.get("model_name") or call["model"]
+        usage = llm_output.get("token_usage") or {}
+        if usage:
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+        elif self.cache_hits > call["cache_hits"] and not call["streamed"]:
+            # Served from the LLM cache, the lookup happens after the start callback
+            return
+        else:
+            completion = "".join(call["streamed"]) or "".join(
+                generation.text for generations in response.generations for generation in generations
+            )
+            prompt_tokens = _count_tokens(call["prompt"])
+            completion_tokens = _count_tokens(completion)
+
+        FEATURE_LLM_CALL_SECONDS.labels(feature=self.feature, model=model, premium=self.premium_label).observe(
+            time.monotonic() - call["started"]
+        )
+        with self._lock:
+            self.tokens[model]["prompt"] += prompt_tokens
+            self.tokens[model]["completion"] += completion_tokens
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any) -> None:
+        with self._lock:
+            self._calls.pop(run_id, None)
+
+    def finish(self, status: str = "ok") -> None:
+        with self._lock:
+            if self.finished:
+                return
+            self.finished = True
+            tokens = {model: dict(counts) for model, counts in self.tokens.items()}
+        cache = self.cache_label()
+        premium = self.premium_label
+        total_cost = 0.0
+        for model, counts in tokens.items():
+            for kind, count in counts.items():
+                FEATURE_TOKENS.labels(
+                    feature=self.feature, model=model, premium=premium, cache=cache, kind=kind
+                ).inc(count)
+            cost = _cost(model, counts["prompt"], False) + _cost(model, counts["completion"], True)
+            FEATURE_COST.labels(feature=self.feature, model=model, premium=premium, cache=cache).inc(cost)
+            total_cost += cost
+        # Every model call that missed the cache makes one provider request, anything beyond that was retried
+        retries = max(self.retries, self.http_requests - (self.llm_calls - self.cache_hits))
+        if retries > 0:
+            FEATURE_RETRIES.labels(feature=self.feature, premium=premium).inc(retries)
+        FEATURE_DURATION.labels(feature=self.feature, premium=premium, cache=cache, status=status).observe(
+            time.monotonic() - self.started
+        )
+        logger.info(
+            f"Feature {self.feature}: {sum(c['prompt'] + c['completion'] for c in tokens.values())} tokens, "
+            f"${total_cost:.5f}, cache {cache}, {retries} retries"
+        )
+
+    async def meter(self, iterator: AsyncIterator[Any]) -> AsyncIterator[Any]:
+        """Keeps the run open for a streamed response and finishes it once the stream ends."""
+        self.deferred = True
+        token = _current_run.set(self)
+        status = "error"
+        try:
+            async for chunk in iterator:
+                yield chunk
+            status = "ok"
+        finally:
+            self.finish(status)
+            with suppress(ValueError):
+                _current_run.reset(token)
+
+
+def current_run() -> Optional[FeatureRun]:
+    return _current_run.get()
+
+
+@contextmanager
+def feature_run(feature: str) -> Iterator[FeatureRun]:
+    run = FeatureRun(feature)
+    token = _current_run.set(run)
+    status = "error"
+    try:
+        yield run
+        status = "ok"
+    finally:
+        _current_run.reset(token)
+        if not run.deferred or status == "error":
+            run.finish(status)
+
+
+def mark_premium(premium: bool) -> None:
+    if run := _current_run.get():
+        run.premium = premium
+
+
+def record_cache_lookup(hit: bool) -> None:
+    if run := _current_run.get():
+        with run._lock:
+            if hit:
+                run.cache_hits += 1
+            else:
+                run.cache_misses += 1
+
+
+def record_provider_request() -> None:
+    if run := _current_run.get():
+        with run._lock:
+            run.http_requests += 1
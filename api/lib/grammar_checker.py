@@ -3,13 +3,12 @@ from typing import List
 from langchain.chat_models.base import BaseChatModel
 from langchain.chains import LLMChain
 from pydantic import BaseModel, Field
-from langchain.output_parsers import PydanticOutputParser
 from langchain.prompts import (
     ChatPromptTemplate,
     SystemMessagePromptTemplate,
     HumanMessagePromptTemplate,
 )
-from langchain.output_parsers import PydanticOutputParser, OutputFixingParser, RetryWithErrorOutputParser
+from .structured_output import RepairingOutputParser
 
 
 class GrammarIssue(BaseModel):
@@ -26,8 +25,7 @@ class GrammarChecker:
         self.llm = llm
         
     def check_grammar(self, text: str) -> dict:
-        parser = PydanticOutputParser(pydantic_object=GrammarIssues)
-        parser = OutputFixingParser.from_llm(parser=parser, llm=self.llm)
+        parser = RepairingOutputParser.from_llm(GrammarIssues, self.llm)
 
         prompt = ChatPromptTemplate(
             messages=[
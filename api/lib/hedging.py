@@ -0,0 +1,414 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+import numpy as np
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple, Type, TypeVar
+from langchain_core.runnables import RunnableConfig
+from langchain_core.runnables.fallbacks import RunnableWithFallbacks
+from prometheus_client import Counter, Histogram
+from .semantic_cache import SemanticCache
+from .single_flight import SingleFlightCache
+from .streaming import Producer, StreamChannel
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+HEDGED_REQUESTS = Counter(
+    "llm_hedged_requests_total",
+    "Requests that went through the hedging policy, by outcome",
+    ["feature", "outcome"],
+)
+HEDGE_DELAY_SECONDS = Histogram(
+    "llm_hedge_delay_seconds",
+    "Latency budget the primary got before the fallback was started",
+    ["feature"],
+)
+
+
+class LatencyTracker:
+    """Rolling window of observed latencies per key."""
+
+    def __init__(self, window: int = 200) -> None:
+        self.window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, key: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(key, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, key: str, quantile: float, min_samples: int) -> Optional[float]:
+        with self._lock:
+            samples = list(self._samples.get(key, ()))
+        if len(samples) < min_samples:
+            return None
+        return float(np.quantile(samples, quantile))
+
+
+class Hedger:
+    """Starts the fallback provider when the primary is slower than its usual tail latency.
+
+    `policies` maps a feature (as used by `require_points_for_feature`) to the
+    latency quantile of the primary after which the fallback is started,
+    features without a policy keep the sequential fallback behaviour.
+    """
+
+    def __init__(
+        self,
+        policies: Dict[str, float],
+        *,
+        default_delay: float = 8,
+        min_delay: float = 1,
+        max_delay: float = 20,
+        min_samples: int = 20,
+        window: int = 200,
+        max_workers: int = 32,
+    ) -> None:
+        self.policies = {feature.upper(): quantile for feature, quantile in policies.items()}
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.min_samples = min_samples
+        self.tracker = LatencyTracker(window)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def delay_for(self, feature: Optional[str], kind: str = "response") -> Optional[float]:
+        """Latency budget for the primary, None if the feature is not hedged."""
+        if feature is None or (quantile := self.policies.get(feature.upper())) is None:
+            return None
+        observed = self.tracker.quantile(f"{feature.upper()}:{kind}", quantile, self.min_samples)
+        if observed is None:
+            return self.default_delay
+        return min(max(observed, self.min_delay), self.max_delay)
+
+    def _observe(self, feature: str, kind: str, started: float) -> None:
+        self.tracker.observe(f"{feature.upper()}:{kind}", time.monotonic() - started)
+
+    def _submit(self, func: Callable[[], T]) -> Future:
+        # Keeps the feature scope and the token counting callback of the caller
+        context = contextvars.copy_context()
+        return self.executor.submit(context.run, func)
+
+    def run(self, feature: str, primary: Callable[[], T], backup: Callable[[], T], delay: float) -> T:
+        """Runs `primary`, starting `backup` too if it takes longer than `delay`.
+
+        Model calls in worker threads cannot be interrupted, the losing call is
+        abandoned and its result discarded, so only hedge features with short
+        sync calls. When the fallback wins, the time until then is recorded as
+        the primary's latency, a lower bound of it.
+        """
+        started = time.monotonic()
+        primary_future = self._submit(primary)
+        done, _ = wait([primary_future], timeout=delay)
+        if done:
+            if primary_future.exception() is None:
+                self._observe(feature, "response", started)
+                HEDGED_REQUESTS.labels(feature=feature, outcome="primary").inc()
+                return primary_future.result()
+            logger.error(f"Primary model failed for {feature}, falling back: {primary_future.exception()}")
+            HEDGED_REQUESTS.labels(feature=feature, outcome="primary_failed").inc()
+            return backup()
+
+        HEDGE_DELAY_SECONDS.labels(feature=feature).observe(delay)
+        backup_future = self._submit(backup)
+        pending = {primary_future: "hedged_primary", backup_future: "hedged_fallback"}
+        error: Optional[BaseException] = None
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcome = pending.pop(future)
+                if future.exception() is not None:
+                    error = future.exception()
+                    continue
+                # A losing primary took at least this long, leaving it out would bias the quantile down
+                if future is primary_future or primary_future in pending:
+                    self._observe(feature, "response", started)
+                # Only calls that did not start yet can be cancelled, a running loser finishes in its thread
+                for loser in pending:
+                    loser.cancel()
+                HEDGED_REQUESTS.labels(feature=feature, outcome=outcome).inc()
+                return future.result()
+        HEDGED_REQUESTS.labels(feature=feature, outcome="failed").inc()
+        raise error
+
+    async def arun(
+        self,
+        feature: str,
+        primary: Callable[[], Awaitable[T]],
+        backup: Callable[[], Awaitable[T]],
+        delay: float,
+    ) -> T:
+        started = time.monotonic()
+        primary_task = asyncio.ensure_future(primary())
+        try:
+            done, _ = await asyncio.wait({primary_task}, timeout=delay)
+        except asyncio.CancelledError:
+            primary_task.cancel()
+            raise
+        if done:
+            if primary_task.exception() is None:
+                self._observe(feature, "response", started)
+                HEDGED_REQUESTS.labels(feature=feature, outcome="primary").inc()
+                return primary_task.result()
+            logger.error(f"Primary model failed for {feature}, falling back: {primary_task.exception()}")
+            HEDGED_REQUESTS.labels(feature=feature, outcome="primary_failed").inc()
+            return await backup()
+
+        HEDGE_DELAY_SECONDS.labels(feature=feature).observe(delay)
+        backup_task = asyncio.ensure_future(backup())
+        pending = {primary_task: "hedged_primary", backup_task: "hedged_fallback"}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    outcome = pending.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                        continue
+                    # A losing primary took at least this long, leaving it out would bias the quantile down
+                    if task is primary_task or primary_task in pending:
+                        self._observe(feature, "response", started)
+                    HEDGED_REQUESTS.labels(feature=feature, outcome=outcome).inc()
+                    return task.result()
+        finally:
+            for task in pending:
+                task.cancel()
+        HEDGED_REQUESTS.labels(feature=feature, outcome="failed").inc()
+        raise error
+
+    def producer(
+        self,
+        feature: str,
+        primary: Producer,
+        backup: Producer,
+        exceptions_to_handle: Tuple[Type[BaseException], ...] = (Exception,),
+    ) -> Producer:
+        """Combines two streaming producers, the first one to emit a token wins.
+
+        Without a policy for `feature` the backup only runs if the primary
+        failed before sending anything.
+        """
+
+        async def run(channel: StreamChannel) -> None:
+            delay = self.delay_for(feature, "first_token")
+            if delay is None:
+                sent = _SentTracker(channel)
+                try:
+                    await primary(sent)
+                except exceptions_to_handle as e:
+                    if sent.count:
+                        raise
+                    logger.error(f"Primary model failed for {feature}, falling back: {e}")
+                    await backup(channel)
+                return
+            await self._race(feature, channel, primary, backup, delay, exceptions_to_handle)
+
+        return run
+
+    async def _race(
+        self,
+        feature: str,
+        channel: StreamChannel,
+        primary: Producer,
+        backup: Producer,
+        delay: float,
+        exceptions_to_handle: Tuple[Type[BaseException], ...],
+    ) -> None:
+        started = time.monotonic()
+        candidates: List[_Candidate] = [_Candidate(primary, channel, exceptions_to_handle)]
+        try:
+            first = await candidates[0].first(timeout=delay)
+            if first is _NO_TOKEN_YET:
+                HEDGE_DELAY_SECONDS.labels(feature=feature).observe(delay)
+                candidates.append(_Candidate(backup, channel, exceptions_to_handle))
+                winner, first = await _first_of(candidates)
+            else:
+                winner = candidates[0]
+                if winner.failed:
+                    HEDGED_REQUESTS.labels(feature=feature, outcome="primary_failed").inc()
+                    candidates.append(_Candidate(backup, channel, exceptions_to_handle))
+                    winner, first = await _first_of(candidates[1:])
+        except asyncio.CancelledError:
+            for candidate in candidates:
+                candidate.task.cancel()
+            raise
+
+        for candidate in candidates:
+            if candidate is not winner:
+                candidate.task.cancel()
+        if winner.failed:
+            HEDGED_REQUESTS.labels(feature=feature, outcome="failed").inc()
+            raise winner.error
+
+        # A losing primary took at least this long, leaving it out would bias the quantile down
+        if winner is candidates[0] or not candidates[0].failed:
+            self._observe(feature, "first_token", started)
+        if len(candidates) == 1:
+            outcome = "primary"
+        else:
+            outcome = "hedged_primary" if winner is candidates[0] else "hedged_fallback"
+        HEDGED_REQUESTS.labels(feature=feature, outcome=outcome).inc()
+
+        try:
+            data = first
+            while data is not None:
+                await channel.send(data)
+                data = await winner.channel.queue.get()
+            # The winner may still be persisting the answer after closing its channel
+            await winner.task
+        except asyncio.CancelledError:
+            winner.task.cancel()
+            raise
+        if winner.failed:
+            raise winner.error
+
+
+class _SentTracker(StreamChannel):
+    """Passes everything through to `channel`, remembering if anything was sent."""
+
+    def __init__(self, channel: StreamChannel) -> None:
+        self.channel = channel
+        self.count = 0
+        self.replay_chunk_size = channel.replay_chunk_size
+        self.replay_delay = channel.replay_delay
+        self.closed = False
+
+    async def send(self, data: Optional[str]) -> None:
+        if data is not None:
+            self.count += 1
+        else:
+            self.closed = True
+        await self.channel.send(data)
+
+    def close_nowait(self) -> None:
+        self.closed = True
+        self.channel.close_nowait()
+
+
+_NO_TOKEN_YET = object()
+
+
+class _Candidate:
+    def __init__(
+        self,
+        producer: Producer,
+        template: StreamChannel,
+        exceptions_to_handle: Tuple[Type[BaseException], ...],
+    ) -> None:
+        self.channel = StreamChannel(template.queue.maxsize, template.replay_chunk_size, template.replay_delay)
+        self.exceptions_to_handle = exceptions_to_handle
+        self.error: Optional[BaseException] = None
+        self.task = asyncio.create_task(self._run(producer))
+        self._first: Optional[asyncio.Task] = None
+
+    @property
+    def failed(self) -> bool:
+        return self.error is not None
+
+    async def _run(self, producer: Producer) -> None:
+        try:
+            await producer(self.channel)
+        except asyncio.CancelledError:
+            self.channel.close_nowait()
+            raise
+        except self.exceptions_to_handle as e:
+            self.error = e
+        await self.channel.close()
+
+    def first_task(self) -> asyncio.Task:
+        if self._first is None:
+            self._first = asyncio.ensure_future(self.channel.queue.get())
+        return self._first
+
+    async def first(self, timeout: float) -> Any:
+        done, _ = await asyncio.wait({self.first_task()}, timeout=timeout)
+        return self._first.result() if done else _NO_TOKEN_YET
+
+
+async def _first_of(candidates: List[_Candidate]) -> Tuple[_Candidate, Optional[str]]:
+    """Returns the first candidate to send a token, or the last one to fail."""
+    pending = {candidate.first_task(): candidate for candidate in candidates}
+    last: Tuple[_Candidate, Optional[str]] = (candidates[-1], None)
+    while pending:
+        done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            candidate = pending.pop(task)
+            if not candidate.failed or task.result() is not None:
+                for other in pending:
+                    other.cancel()
+                return candidate, task.result()
+            last = (candidate, None)
+    return last
+
+
+class HedgedRunnable(RunnableWithFallbacks):
+    """`RunnableWithFallbacks` that races the first fallback when the primary is slow.
+
+    The feature is taken from the model's `feature` or, if unset, from the
+    current `require_points_for_feature` scope.
+    """
+
+    hedger: Any
+    feature: Optional[str] = None
+
+    def _hedge(self) -> Tuple[Optional[str], Optional[float]]:
+        feature = self.feature or SemanticCache.current_feature()
+        if not self.fallbacks:
+            return feature, None
+        return feature, self.hedger.delay_for(feature)
+
+    def invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        # Followers wait on the primary's key, whichever model answers stores it there too
+        with SingleFlightCache.group():
+            return self._invoke(input, config, **kwargs)
+
+    async def ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        with SingleFlightCache.group():
+            return await self._ainvoke(input, config, **kwargs)
+
+    def batch(self, inputs: List[Any], *args: Any, **kwargs: Any) -> List[Any]:
+        # LLMChain runs its model through batch
+        with SingleFlightCache.group():
+            return super().batch(inputs, *args, **kwargs)
+
+    async def abatch(self, inputs: List[Any], *args: Any, **kwargs: Any) -> List[Any]:
+        with SingleFlightCache.group():
+            return await super().abatch(inputs, *args, **kwargs)
+
+    def _invoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        feature, delay = self._hedge()
+        if delay is None:
+            return super().invoke(input, config, **kwargs)
+
+        def backup() -> Any:
+            return RunnableWithFallbacks(
+                runnable=self.fallbacks[0],
+                fallbacks=self.fallbacks[1:],
+                exceptions_to_handle=self.exceptions_to_handle,
+            ).invoke(input, config, **kwargs)
+
+        return self.hedger.run(feature, lambda: self.runnable.invoke(input, config, **kwargs), backup, delay)
+
+    async def _ainvoke(self, input: Any, config: Optional[RunnableConfig] = None, **kwargs: Any) -> Any:
+        feature, delay = self._hedge()
+        if delay is None:
+            return await super().ainvoke(input, config, **kwargs)
+
+        async def backup() -> Any:
+            return await RunnableWithFallbacks(
+                runnable=self.fallbacks[0],
+                fallbacks=self.fallbacks[1:],
+                exceptions_to_handle=self.exceptions_to_handle,
+            ).ainvoke(input, config, **kwargs)
+
+        return await self.hedger.arun(
+            feature, lambda: self.runnable.ainvoke(input, config, **kwargs), backup, delay
+        )
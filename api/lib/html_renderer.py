@@ -4,6 +4,7 @@ from langchain.pydantic_v1 import BaseModel
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import HumanMessage, SystemMessage
 from .infographic_maker.infographic_maker import InfographicMaker
+from .structured_output import StructuredOutput
 
 
 class Content(BaseModel):
@@ -37,7 +38,7 @@ class ImageExplainers:
         return [img for _, img in sorted(images, key=lambda x: x[0])]
     
     def generate_md(self, prompt: str) -> Content:
-        structured_llm = self.llm.with_structured_output(Content)
+        structured_llm = StructuredOutput(self.llm, Content)
         return structured_llm.invoke(
             [
                 SystemMessage(
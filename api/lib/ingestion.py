@@ -0,0 +1,204 @@
+import logging
+import os
+import resource
+import threading
+import time
+import uuid
+
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+from google.cloud.firestore_v1.vector import Vector  # type: ignore
+from langchain.schema import Document
+from prometheus_client import Counter, Histogram
+import tenacity
+
+
+logger = logging.getLogger(__name__)
+
+INGESTION_STAGE_SECONDS = Histogram(
+    "ingestion_stage_seconds",
+    "Time spent per batch in each ingestion stage",
+    ["stage"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60),
+)
+INGESTION_RETRIES = Counter(
+    "ingestion_retries_total",
+    "Ingestion batches retried after an error",
+    ["stage"],
+)
+INGESTION_FAILURES = Counter(
+    "ingestion_failed_chunks_total",
+    "Chunks that could not be ingested after all retries",
+    ["stage"],
+)
+
+UPLOAD_RSS_GROWTH = Histogram(
+    "upload_rss_growth_bytes",
+    "Growth of the worker's resident memory while ingesting one upload",
+    buckets=tuple(2**i * 1024 * 1024 for i in range(11)),
+)
+
+
+def rss_bytes() -> int:
+    """Current resident set size of this process."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        # Peak rather than current RSS, in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class IngestionError(ValueError):
+    pass
+
+
+@dataclass
+class _Batch:
+    ids: List[str]
+    documents: List[Document]
+    embeddings: Optional[List[List[float]]] = None
+
+
+@dataclass
+class IngestionReport:
+    chunks: int = 0
+    batches: int = 0
+    wall_seconds: float = 0
+    stage_seconds: Dict[str, float] = field(default_factory=lambda: {"embed": 0.0, "write": 0.0})
+    failed: List[Tuple[str, int, str]] = field(default_factory=list)
+
+
+class IngestionPipeline:
+    """Embeds documents and writes them to a Firestore vector store concurrently.
+
+    Batches are embedded on one bounded pool and committed on another as soon
+    as their vectors are ready, every step retried with exponential backoff.
+    A batch that still fails makes the whole ingestion fail, after whatever
+    was written has been removed again, so files are never half indexed.
+    """
+
+    def __init__(
+        self,
+        vectorstore,
+        batch_size: int = 100,
+        embed_workers: int = 4,
+        write_workers: int = 4,
+        max_attempts: int = 4,
+        backoff: float = 0.5,
+        max_backoff: float = 8,
+    ) -> None:
+        self.vectorstore = vectorstore
+        # Firestore allows at most 500 writes per batch commit
+        self.batch_size = min(batch_size, 500)
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._embed_pool = ThreadPoolExecutor(max_workers=embed_workers, thread_name_prefix="ingest-embed")
+        self._write_pool = ThreadPoolExecutor(max_workers=write_workers, thread_name_prefix="ingest-write")
+
+    def _retrying(self, stage: str) -> tenacity.Retrying:
+        def before_sleep(retry_state: tenacity.RetryCallState) -> None:
+            INGESTION_RETRIES.labels(stage=stage).inc()
+            logger.warning(
+                f"Ingestion {stage} attempt {retry_state.attempt_number} failed, retrying: {retry_state.outcome.exception()}"
+            )
+
+        return tenacity.Retrying(
+            stop=tenacity.stop_after_attempt(self.max_attempts),
+            wait=tenacity.wait_exponential(multiplier=self.backoff, max=self.max_backoff),
+            before_sleep=before_sleep,
+            reraise=True,
+        )
+
+    def _timed(self, stage: str, report: IngestionReport, lock: threading.Lock, func, *args):
+        start = time.perf_counter()
+        try:
+            return self._retrying(stage)(func, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            INGESTION_STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+            with lock:
+                report.stage_seconds[stage] += elapsed
+
+    def _embed(self, batch: _Batch) -> _Batch:
+        batch.embeddings = self.vectorstore.embedding_service.embed_documents(
+            [document.page_content for document in batch.documents]
+        )
+        return batch
+
+    def _write(self, batch: _Batch) -> List[str]:
+        store = self.vectorstore
+        db_batch = store.client.batch()
+        for doc_id, document, embedding in zip(batch.ids, batch.documents, batch.embeddings):
+            db_batch.set(
+                store.collection.document(doc_id),
+                {
+                    store.content_field: document.page_content,
+                    store.embedding_field: Vector(embedding),
+                    store.metadata_field: document.metadata,
+                },
+                merge=True,
+            )
+        db_batch.commit()
+        return batch.ids
+
+    def run(self, documents: List[Document]) -> Tuple[List[str], IngestionReport]:
+        report = IngestionReport(chunks=len(documents))
+        lock = threading.Lock()
+        start = time.perf_counter()
+        batches = [
+            _Batch(
+                ids=[str(uuid.uuid4()) for _ in documents[i : i + self.batch_size]],
+                documents=documents[i : i + self.batch_size],
+            )
+            for i in range(0, len(documents), self.batch_size)
+        ]
+        report.batches = len(batches)
+
+        pending: Dict[Future, Tuple[str, _Batch]] = {
+            self._embed_pool.submit(self._timed, "embed", report, lock, self._embed, batch): ("embed", batch)
+            for batch in batches
+        }
+        written: List[str] = []
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage, batch = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    report.failed.append((stage, len(batch.ids), str(e)))
+                    INGESTION_FAILURES.labels(stage=stage).inc(len(batch.ids))
+                    continue
+                if stage == "embed":
+                    write = self._write_pool.submit(self._timed, "write", report, lock, self._write, result)
+                    pending[write] = ("write", batch)
+                else:
+                    written.extend(result)
+
+        report.wall_seconds = time.perf_counter() - start
+        logger.info(
+            f"Ingested {len(written)}/{report.chunks} chunks in {report.batches} batches, "
+            f"{report.wall_seconds:.2f}s wall (embed {report.stage_seconds['embed']:.2f}s, "
+            f"write {report.stage_seconds['write']:.2f}s summed over batches)"
+        )
+        if report.failed:
+            failed_chunks = sum(count for _, count, _ in report.failed)
+            logger.error(f"Ingestion failed for {failed_chunks} chunks after {self.max_attempts} attempts: {report.failed}")
+            self._rollback(written)
+            raise IngestionError(
+                f"Could not add {failed_chunks} of {report.chunks} chunks to the vectorstore: {report.failed[-1][2]}"
+            )
+        return written, report
+
+    def _rollback(self, ids: List[str]) -> None:
+        for i in range(0, len(ids), 500):
+            try:
+                db_batch = self.vectorstore.client.batch()
+                for doc_id in ids[i : i + 500]:
+                    db_batch.delete(self.vectorstore.collection.document(doc_id))
+                db_batch.commit()
+            except Exception as e:
+                logger.error(f"Failed to remove partially ingested chunks: {e}")
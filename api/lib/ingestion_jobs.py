@@ -0,0 +1,314 @@
+import logging
+import threading
+import time
+import traceback
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor
+from enum import Enum
+from typing import Any, Callable, Dict, Optional, Tuple
+from prometheus_client import Counter, Histogram
+from pydantic import BaseModel, Field
+from redis import Redis
+
+
+logger = logging.getLogger(__name__)
+
+INGESTION_JOBS = Counter(
+    "ingestion_jobs_total",
+    "Background ingestion jobs by kind and final status",
+    ["kind", "status"],
+)
+INGESTION_JOB_SECONDS = Histogram(
+    "ingestion_job_seconds",
+    "Time ingestion jobs spend queued and running",
+    ["kind", "phase"],
+    buckets=(0.1, 0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600),
+)
+
+
+class IngestionJobStatus(str, Enum):
+    PENDING = "PENDING"
+    RUNNING = "RUNNING"
+    READY = "READY"
+    FAILED = "FAILED"
+
+
+class IngestionJob(BaseModel):
+    id: str
+    user_id: str
+    kind: str
+    payload: Dict[str, Any] = {}
+    status: IngestionJobStatus = IngestionJobStatus.PENDING
+    stage: str = "queued"
+    progress: float = 0
+    details: Dict[str, Any] = {}
+    result: Dict[str, Any] = {}
+    error: Optional[str] = None
+    attempts: int = 0
+    created_at: float = Field(default_factory=time.time)
+    updated_at: float = Field(default_factory=time.time)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (IngestionJobStatus.READY, IngestionJobStatus.FAILED)
+
+    def public(self) -> Dict[str, Any]:
+        return self.model_dump(mode="json", exclude={"payload", "user_id", "attempts"})
+
+
+# progress(stage, fraction, **details)
+Progress = Callable[..., None]
+Handler = Callable[[Dict[str, Any], Progress], Dict[str, Any]]
+
+
+class IngestionJobQueue:
+    """Runs slow ingestion work (extraction, OCR, transcripts, embedding) off the request path.
+
+    Jobs are stored in Redis and queued on a list that worker threads of every
+    process pop from, moving the id to a processing list until the job ends.
+    Running jobs are saved every `heartbeat_interval` seconds, so only jobs
+    whose worker died stop being updated and are put back on the queue after
+    `stale_after` seconds. Submitting twice with the same
+    idempotency key returns the first job. Without Redis jobs run on a local
+    thread pool and are only visible to this process.
+    """
+
+    def __init__(
+        self,
+        redis_: Optional[Redis],
+        workers: int = 2,
+        prefix: str = "ingest_jobs",
+        job_ttl: int = 7 * 24 * 60 * 60,
+        idempotency_ttl: int = 24 * 60 * 60,
+        stale_after: float = 15 * 60,
+        heartbeat_interval: float = 60,
+        max_attempts: int = 2,
+        poll_timeout: int = 5,
+    ) -> None:
+        self.redis = redis_
+        self.workers = workers
+        self.prefix = prefix
+        self.job_ttl = job_ttl
+        self.idempotency_ttl = idempotency_ttl
+        self.stale_after = stale_after
+        self.heartbeat_interval = min(heartbeat_interval, stale_after / 3)
+        self.max_attempts = max_attempts
+        self.poll_timeout = poll_timeout
+        self._handlers: Dict[str, Handler] = {}
+        self._local: Dict[str, IngestionJob] = {}
+        self._local_keys: Dict[Tuple[str, str], str] = {}
+        self._local_pool: Optional[ThreadPoolExecutor] = None
+        self._started = False
+        self._lock = threading.Lock()
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix, *parts))
+
+    def register(self, kind: str, handler: Handler) -> None:
+        self._handlers[kind] = handler
+
+    def start(self) -> None:
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        if self.redis is None:
+            return
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"ingest-job-{i}", daemon=True).start()
+        threading.Thread(target=self._recover_forever, name="ingest-job-recovery", daemon=True).start()
+
+    def _save(self, job: IngestionJob) -> None:
+        job.updated_at = time.time()
+        if self.redis is None or job.id in self._local:
+            self._local[job.id] = job
+            return
+        self.redis.set(self._key("job", job.id), job.model_dump_json(), ex=self.job_ttl)
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        if job := self._local.get(job_id):
+            return job
+        if self.redis is None:
+            return None
+        try:
+            data = self.redis.get(self._key("job", job_id))
+        except Exception as e:
+            logger.error(f"Failed to read ingestion job {job_id}: {e}")
+            return None
+        return IngestionJob.model_validate_json(data) if data else None
+
+    def find(self, user_id: str, idempotency_key: Optional[str]) -> Optional[IngestionJob]:
+        """The job previously submitted by this user with `idempotency_key`, if it still exists."""
+        if not idempotency_key:
+            return None
+        if job_id := self._local_keys.get((user_id, idempotency_key)):
+            return self.get(job_id)
+        if self.redis is None:
+            return None
+        try:
+            job_id = self.redis.get(self._key("idempotency", user_id, idempotency_key))
+        except Exception as e:
+            logger.error(f"Failed to read idempotency key: {e}")
+            return None
+        return self.get(job_id.decode()) if job_id else None
+
+    def submit(
+        self, user_id: str, kind: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None
+    ) -> Tuple[IngestionJob, bool]:
+        """Queues a job, returns it and whether it is new or an earlier job with the same key."""
+        if kind not in self._handlers:
+            raise ValueError(f"No handler registered for {kind} jobs")
+        job = IngestionJob(id=str(uuid.uuid4()), user_id=user_id, kind=kind, payload=payload)
+
+        if self.redis is not None:
+            try:
+                if idempotency_key:
+                    key = self._key("idempotency", user_id, idempotency_key)
+                    if not self.redis.set(key, job.id, nx=True, ex=self.idempotency_ttl):
+                        if (existing := self.find(user_id, idempotency_key)) is not None:
+                            return existing, False
+                        self.redis.set(key, job.id, ex=self.idempotency_ttl)
+                self._save(job)
+                self.redis.lpush(self._key("queue"), job.id)
+                return job, True
+            except Exception as e:
+                logger.error(f"Failed to queue ingestion job, running it in this process: {e}")
+
+        with self._lock:
+            if idempotency_key:
+                if (existing := self.find(user_id, idempotency_key)) is not None:
+                    return existing, False
+                self._local_keys[(user_id, idempotency_key)] = job.id
+            self._prune_local()
+            self._local[job.id] = job
+            if self._local_pool is None:
+                self._local_pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest-job")
+        self._local_pool.submit(self._run, job)
+        return job, True
+
+    def _prune_local(self) -> None:
+        expired = [job_id for job_id, job in self._local.items() if job.finished and time.time() - job.updated_at > self.job_ttl]
+        for job_id in expired:
+            del self._local[job_id]
+        self._local_keys = {key: job_id for key, job_id in self._local_keys.items() if job_id in self._local}
+
+    def _run(self, job: IngestionJob) -> None:
+        INGESTION_JOB_SECONDS.labels(kind=job.kind, phase="queued").observe(time.time() - job.created_at)
+        job.status = IngestionJobStatus.RUNNING
+        job.stage = "started"
+        job.attempts += 1
+        save_lock = threading.Lock()
+
+        def save() -> None:
+            # Progress and heartbeat save from different threads
+            with save_lock:
+                self._save(job)
+
+        save()
+
+        def progress(stage: str, fraction: float, **details) -> None:
+            job.stage = stage
+            job.progress = round(min(max(fraction, 0), 1), 3)
+            job.details.update(details)
+            try:
+                save()
+            except Exception as e:
+                logger.error(f"Failed to report progress of ingestion job {job.id}: {e}")
+
+        stopped = threading.Event()
+
+        def heartbeat() -> None:
+            while not stopped.wait(self.heartbeat_interval):
+                try:
+                    save()
+                except Exception as e:
+                    logger.error(f"Failed to report progress of ingestion job {job.id}: {e}")
+
+        beat = None
+        if job.id not in self._local:
+            beat = threading.Thread(target=heartbeat, name=f"ingest-job-heartbeat-{job.id}", daemon=True)
+            beat.start()
+
+        start = time.perf_counter()
+        try:
+            job.result = self._handlers[job.kind](job.payload, progress) or {}
+            job.status = IngestionJobStatus.READY
+            job.stage = "done"
+            job.progress = 1
+        except Exception as e:
+            logger.error(f"Ingestion job {job.id} ({job.kind}) failed: {traceback.format_exception(e)}")
+            job.status = IngestionJobStatus.FAILED
+            # Handlers raise ValueError with a message meant for the student
+            job.error = str(e) if isinstance(e, ValueError) else "Something went wrong, please try again."
+        finally:
+            stopped.set()
+            if beat is not None:
+                beat.join()
+
+        INGESTION_JOB_SECONDS.labels(kind=job.kind, phase="run").observe(time.perf_counter() - start)
+        INGESTION_JOBS.labels(kind=job.kind, status=job.status.value).inc()
+        try:
+            save()
+        except Exception as e:
+            logger.error(f"Failed to store result of ingestion job {job.id}: {e}")
+
+    def _work(self) -> None:
+        queue, processing = self._key("queue"), self._key("processing")
+        while True:
+            try:
+                job_id = self.redis.blmove(queue, processing, self.poll_timeout, "RIGHT", "LEFT")
+            except Exception as e:
+                logger.error(f"Ingestion job queue unavailable: {e}")
+                time.sleep(self.poll_timeout)
+                continue
+            if job_id is None:
+                continue
+
+            job_id = job_id.decode()
+            try:
+                job = self.get(job_id)
+                if job is not None and not job.finished:
+                    self._run(job)
+            except Exception as e:
+                logger.error(f"Ingestion worker failed on job {job_id}: {e}")
+            finally:
+                try:
+                    self.redis.lrem(processing, 1, job_id)
+                except Exception as e:
+                    logger.error(f"Failed to acknowledge ingestion job {job_id}: {e}")
+
+    def recover(self) -> int:
+        """Requeues jobs whose worker stopped saving them, returns how many."""
+        queue, processing = self._key("queue"), self._key("processing")
+        requeued = 0
+        for raw in self.redis.lrange(processing, 0, -1):
+            job_id = raw.decode()
+            job = self.get(job_id)
+            if job is not None and not job.finished and time.time() - job.updated_at < self.stale_after:
+                continue
+            # Every process runs this, only the one that removes the entry requeues it
+            if not self.redis.lrem(processing, 1, job_id) or job is None or job.finished:
+                continue
+            if job.attempts >= self.max_attempts:
+                job.status = IngestionJobStatus.FAILED
+                job.error = "Processing took too long, please try again."
+                self._save(job)
+                INGESTION_JOBS.labels(kind=job.kind, status=job.status.value).inc()
+                continue
+            job.status = IngestionJobStatus.PENDING
+            job.stage = "queued"
+            self._save(job)
+            self.redis.lpush(queue, job_id)
+            requeued += 1
+        if requeued:
+            logger.info(f"Requeued {requeued} stale ingestion jobs")
+        return requeued
+
+    def _recover_forever(self) -> None:
+        while True:
+            try:
+                self.recover()
+            except Exception as e:
+                logger.error(f"Failed to recover stale ingestion jobs: {e}")
+            time.sleep(min(60, self.stale_after / 2))
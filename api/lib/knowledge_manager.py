@@ -1,3 +1,5 @@
+import asyncio
+import codecs
 import ipaddress
 import time
 import logging
@@ -12,19 +14,17 @@ from PIL import Image
 from pathlib import Path
 from urllib.parse import urlparse
 from uuid import UUID
-from typing import Any, Optional, Union
+from typing import Any, Callable, Iterator, Optional, Union
 from typing import Dict, List, Tuple
-from itertools import islice
 
 from langchain.embeddings.base import Embeddings
 from langchain.chat_models.base import BaseChatModel
 from langchain_community.document_loaders.unstructured import UnstructuredFileLoader
-from langchain.text_splitter import TokenTextSplitter
 from langchain_community.document_loaders import YoutubeLoader
 
 from .gpt_pdf_loader import PDFLoader
 from .youtube_loader import YoutubeLoader as YoutubeLoaderNew
-from langchain.callbacks.base import BaseCallbackHandler
+from langchain.callbacks.base import AsyncCallbackHandler, BaseCallbackHandler
 from langchain.schema import Document, LLMResult, SystemMessage
 from langchain.embeddings.base import Embeddings
 from langchain.prompts import (
@@ -55,6 +55,13 @@ from google.cloud.firestore_v1.vector import Vector  # type: ignore
 from api.lib.maths_solver.python_exec_client import PythonClient
 from api.lib.ocr import VisionOCR
 from api.lib.utils import format_url
+from api.lib.streaming import StreamChannel
+from api.lib.ingestion import IngestionPipeline, UPLOAD_RSS_GROWTH, rss_bytes
+from api.lib.vector_index import VectorIndexCache
+from api.lib.extraction_cache import ExtractionCache, file_digest
+from api.lib.chunking import get_chunker
+from api.lib.retrieval_cache import RetrievalCache
+from api.lib.agent_executor import ParallelAgentExecutor
 from .database.files import FileDBManager
 from extractous import Extractor, TesseractOcrConfig, PdfOcrStrategy, PdfParserConfig
 
@@ -110,9 +117,11 @@ class FirestoreVectorStoreModified(FirestoreVectorStore):
 
 
 class CustomCallback(BaseCallbackHandler):
-    def __init__(self, callback, on_end_callback) -> None:
+    def __init__(self, callback, on_end_callback, replay_chunk_size: int = 8, replay_delay: float = 0.0) -> None:
         self.callback = callback
         self.on_end_callback = on_end_callback
+        self.replay_chunk_size = replay_chunk_size
+        self.replay_delay = replay_delay
         super().__init__()
         self.cached = True
 
@@ -124,12 +133,37 @@ class CustomCallback(BaseCallbackHandler):
 
     def on_llm_end(self, response: LLMResult, *args, **kwargs) -> None:
         if self.cached:
-            for chunk in split_into_chunks(response.generations[0][0].text, 8):
+            for chunk in split_into_chunks(response.generations[0][0].text, self.replay_chunk_size):
                 self.callback(chunk)
-                time.sleep(0.05)
+                if self.replay_delay:
+                    time.sleep(self.replay_delay)
         self.callback(None)
         self.on_end_callback(response.generations[0][0].text)
 
+
+class AsyncCustomCallback(AsyncCallbackHandler):
+    """Async counterpart of `CustomCallback` writing into a `StreamChannel`."""
+
+    def __init__(self, channel: StreamChannel, on_end_callback) -> None:
+        self.channel = channel
+        self.on_end_callback = on_end_callback
+        super().__init__()
+        self.cached = True
+
+    async def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if token:
+            self.cached = False
+        if not self.cached:
+            await self.channel.send(token)
+
+    async def on_llm_end(self, response: LLMResult, *args, **kwargs) -> None:
+        text = response.generations[0][0].text
+        if self.cached:
+            await self.channel.replay(text)
+        await self.channel.close()
+        if self.on_end_callback:
+            await asyncio.to_thread(self.on_end_callback, text)
+
 class CustomCallbackAgent(BaseCallbackHandler):
     def __init__(self, callback, on_end_callback) -> None:
         self.callback = callback
@@ -184,14 +218,66 @@ class CustomCallbackAgent(BaseCallbackHandler):
             pass
         self.callback(None)
 
+class AsyncCustomCallbackAgent(AsyncCallbackHandler):
+    """Async counterpart of `CustomCallbackAgent` writing into a `StreamChannel`."""
+
+    def __init__(self, channel: StreamChannel, on_end_callback) -> None:
+        self.channel = channel
+        self.on_end_callback = on_end_callback
+        super().__init__()
+        self.cached = True
+
+    async def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if token:
+            self.cached = False
+        if not self.cached:
+            await self.channel.send(token)
+
+    async def on_agent_action(self, action: Any, **kwargs: Any) -> None:
+        await self.channel.send(
+            "\n*AI is using a tool/reading your files to better assist you...*\n"
+        )
+
+    async def on_tool_end(self, output: str, **kwargs: Any) -> None:
+        await self.channel.send(
+            "\n*AI has finished using the tool and will respond shortly...*\n\n"
+        )
+
+    async def on_tool_error(self, error: BaseException, **kwargs: Any) -> None:
+        await self.on_tool_end(str(error))
+
+    async def on_agent_finish(self, finish: AgentFinish, **kwargs: Any) -> None:
+        output = finish.return_values.get("output", "")
+        try:
+            if self.cached:
+                await self.channel.replay(output)
+            if self.on_end_callback:
+                await asyncio.to_thread(self.on_end_callback, output)
+        except Exception:
+            pass
+        await self.channel.close()
+
 class ExtractousLoader(BaseLoader):
     def __init__(self, file_path: str) -> None:
         self.file_path = file_path
 
-    def load(self):
+    @staticmethod
+    def _extractor() -> Extractor:
         pdf_config = PdfParserConfig().set_ocr_strategy(PdfOcrStrategy.NO_OCR)
-        extractor = Extractor().set_ocr_config(TesseractOcrConfig().set_language("eng")).set_pdf_config(pdf_config)
-        data = extractor.extract_file_to_string(self.file_path)
+        return Extractor().set_ocr_config(TesseractOcrConfig().set_language("eng")).set_pdf_config(pdf_config)
+
+    def stream(self, block_size: int = 64 * 1024) -> Iterator[str]:
+        """Yields the extracted text block by block instead of as one string."""
+        reader, _ = self._extractor().extract_file(self.file_path)
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        while block := reader.read(block_size):
+            if text := decoder.decode(bytes(block)):
+                yield text
+        if tail := decoder.decode(b"", final=True):
+            yield tail
+
+    def load(self):
+        data = self._extractor().extract_file_to_string(self.file_path)
         return [Document(
             page_content=data[0]
         )]
@@ -207,7 +293,11 @@ class KnowledgeManager:
         ocr: VisionOCR,
         chunk_size: int = 1000,
         advanced_ocr_page_count: int = 15,
-        collection_name: str = "academi"
+        collection_name: str = "academi",
+        ingestion_kwargs: Dict = None,
+        vector_index: Optional[VectorIndexCache] = None,
+        extraction_cache: Optional[ExtractionCache] = None,
+        retrieval_cache: Optional[RetrievalCache] = None,
     ) -> None:
         self.azure_ocr = ocr
         self.embeddings = embeddings
@@ -217,11 +307,14 @@ class KnowledgeManager:
             collection=collection_name,
             embedding_service=embeddings,
         )
+        self.ingestion = IngestionPipeline(self.vectorstore, **(ingestion_kwargs or {}))
+        self.vector_index = vector_index
+        self.extraction_cache = extraction_cache
+        self.retrieval_cache = retrieval_cache
+        self.collection_name = collection_name
 
     def split_docs(self, docs: Document) -> List[Document]:
-        return TokenTextSplitter(
-            chunk_size=self.chunk_size
-        ).split_documents(docs)
+        return get_chunker(self.chunk_size).split_documents(docs)
 
     def is_pdf_file(self, file_path: str) -> bool:
         """
@@ -276,6 +369,34 @@ class KnowledgeManager:
         except Exception:
             return UnstructuredFileLoader(file_path=filepath, strategy="fast").load()
 
+    def _cached_docs(self, digest: Optional[str], mode: str, load, cacheable=None) -> List[Document]:
+        if digest is None:
+            return load()
+        return self.extraction_cache.documents(digest, mode, load, cacheable)
+
+    def _ocr(self, digest: Optional[str], file_path: str) -> str:
+        if digest is None:
+            return self.azure_ocr.perform_ocr(file_path)
+        return self.extraction_cache.get_or_compute(digest, "image_ocr", lambda: self.azure_ocr.perform_ocr(file_path))
+
+    def _file_digest(self, file_path: str) -> Optional[str]:
+        if self.extraction_cache is None or not self.extraction_cache.enabled:
+            return None
+        return file_digest(file_path)
+
+    def _load_advanced_or_extractous(self, digest: Optional[str], file_path: str) -> List[Document]:
+        try:
+            # Pages whose OCR failed would be shared with everyone uploading the file, only complete results are kept
+            return self._cached_docs(
+                digest,
+                "pdf_advanced",
+                lambda: self.load_using_advanced_extraction(file_path),
+                PDFLoader.ocr_succeeded,
+            )
+        except Exception as e:
+            logging.error(f"Advanced extraction failed, using extractous: {e}")
+            return self._cached_docs(digest, "extractous", lambda: self.load_using_extractous(file_path))
+
     def load_data(self, file_path: str, advanced_pdf_extraction: bool = False) -> Tuple[str, List[Document], bytes]:
         print(f"Loading {file_path}")
         
@@ -283,19 +404,17 @@ class KnowledgeManager:
             logging.error(f"Invalid file path: {file_path}. Access outside /tmp directory is not allowed.")
             raise ValueError("Invalid file path")
 
+        digest = self._file_digest(file_path)
         if self.is_image_file(file_path):
             logging.info("Using azure ocr")
-            docs = [Document(page_content=self.azure_ocr.perform_ocr(file_path))]
+            docs = [Document(page_content=self._ocr(digest, file_path))]
         else:
             if self.is_pdf_file(file_path=file_path) and self.get_pdf_page_count(file_path) <= self.advanced_ocr_page_count:
                 logging.info("Using advanced ocr")
-                try:
-                    docs = self.load_using_advanced_extraction(file_path)
-                except:
-                    docs = self.load_using_extractous(file_path)                         
+                docs = self._load_advanced_or_extractous(digest, file_path)
             else:
                 logging.info("Using extractous")
-                docs = self.load_using_extractous(file_path)         
+                docs = self._cached_docs(digest, "extractous", lambda: self.load_using_extractous(file_path))
 
         docs = self.split_docs(docs)
         logging.info(f"Loaded {len(docs)} Documents.")
@@ -306,6 +425,98 @@ class KnowledgeManager:
 
         return contents, docs, file_bytes
 
+    def _split_stream(self, blocks: Iterator[str]) -> Iterator[Document]:
+        splitter = get_chunker(self.chunk_size)
+        min_buffer = max(64 * 1024, self.chunk_size * 4 * 16)
+        buffer = ""
+        for block in blocks:
+            buffer += block
+            if len(buffer) < min_buffer:
+                continue
+            chunks = splitter.split_text(buffer)
+            # The last chunk may continue in the next block
+            for chunk in chunks[:-1]:
+                yield Document(page_content=chunk)
+            buffer = chunks[-1] if chunks else ""
+        for chunk in splitter.split_text(buffer):
+            yield Document(page_content=chunk)
+
+    def iter_chunks(self, file_path: str, advanced_pdf_extraction: bool = False) -> Iterator[Document]:
+        """Same extraction as `load_data`, but yields chunks as the text is extracted."""
+        if not file_path.startswith("/tmp/"):
+            logging.error(f"Invalid file path: {file_path}. Access outside /tmp directory is not allowed.")
+            raise ValueError("Invalid file path")
+
+        digest = self._file_digest(file_path)
+        if self.is_image_file(file_path):
+            logging.info("Using azure ocr")
+            yield from self.split_docs([Document(page_content=self._ocr(digest, file_path))])
+            return
+        if self.is_pdf_file(file_path=file_path) and self.get_pdf_page_count(file_path) <= self.advanced_ocr_page_count:
+            logging.info("Using advanced ocr")
+            yield from self.split_docs(self._load_advanced_or_extractous(digest, file_path))
+            return
+
+        logging.info("Using extractous (streaming)")
+        blocks = lambda: ExtractousLoader(file_path=file_path).stream()
+        if digest is not None:
+            blocks = lambda: self.extraction_cache.stream(digest, "extractous_text", ExtractousLoader(file_path=file_path).stream)
+        emitted = False
+        try:
+            for doc in self._split_stream(blocks()):
+                emitted = True
+                yield doc
+        except Exception as e:
+            if emitted:
+                raise
+            logging.error(f"Streaming extraction failed, falling back: {e}")
+            yield from self.split_docs(UnstructuredFileLoader(file_path=file_path, strategy="fast").load())
+
+    def stream_and_injest_file(
+        self,
+        filepath: str,
+        metadata: Dict,
+        advanced_pdf_extraction: bool = False,
+        batch_size: int = 200,
+        on_progress: Optional[Callable[[int], None]] = None,
+    ) -> Tuple[str, List[str]]:
+        """Like `load_and_injest_file`, but embeds and writes chunks in batches while extracting.
+
+        Only the extracted text is kept for the file record, the file itself is
+        never read into memory. `on_progress` receives the number of chunks
+        ingested so far after every batch.
+        """
+        start_rss = peak_rss = rss_bytes()
+        contents, ids, batch = [], [], []
+        try:
+            for doc in self.iter_chunks(filepath, advanced_pdf_extraction):
+                doc.metadata.update(metadata)
+                contents.append(doc.page_content)
+                batch.append(doc)
+                if len(batch) >= batch_size:
+                    ids.extend(self.ingestion.run(batch)[0])
+                    batch = []
+                    peak_rss = max(peak_rss, rss_bytes())
+                    if on_progress:
+                        on_progress(len(ids))
+            if batch:
+                ids.extend(self.ingestion.run(batch)[0])
+                if on_progress:
+                    on_progress(len(ids))
+            text = "\n\n".join(contents)
+            if len(text) <= 7:
+                raise ValueError("Insufficient data in documents")
+        except Exception:
+            self.delete_ids(ids)
+            raise
+
+        peak_rss = max(peak_rss, rss_bytes())
+        UPLOAD_RSS_GROWTH.observe(max(peak_rss - start_rss, 0))
+        logging.info(
+            f"Streamed {len(ids)} chunks into the vectorstore, RSS grew by {(peak_rss - start_rss) / 1e6:.1f} MB"
+        )
+        return text, ids
+
     def collection_exists(self, collection_name: str) -> bool:
         try:
             return bool(self.client.get_collection(collection_name))
@@ -321,21 +532,7 @@ class KnowledgeManager:
             if len(content) <= 7:
                 raise ValueError("Insufficient data in documents")
         
-        batch_size = 200
-        ids = []
-        
-        iterator = iter(documents)
-        while True:
-            batch = list(islice(iterator, batch_size))
-            if not batch:
-                break
-            
-            try:
-                batch_ids = self.vectorstore.add_documents(batch)
-                ids.extend(batch_ids)
-            except Exception as e:
-                print(f"Error adding batch: {str(e)}")
-        
+        ids, _ = self.ingestion.run(documents)
         if not ids:
             raise ValueError("No documents were successfully added to the vectorstore")
         
@@ -475,11 +672,21 @@ class KnowledgeManager:
     def query_data(
         self, query: str, k: int, metadata: Dict[str, str] = None
     ):
+        metadata = metadata or {}
         try:
-            return self.vectorstore.similarity_search(query, k, filters=self.create_filters(metadata))
+            if self.retrieval_cache:
+                return self.retrieval_cache.get_or_search(
+                    self.collection_name, query, k, metadata, lambda: self._search(query, k, metadata)
+                )
+            return self._search(query, k, metadata)
         except Exception as e:
             print(f"error retrieving: {e}")
             return []
+
+    def _search(self, query: str, k: int, metadata: Dict[str, str]) -> List[Document]:
+        if self.vector_index and (docs := self.vector_index.search(query, k, metadata)) is not None:
+            return docs
+        return self.vectorstore.similarity_search(query, k, filters=self.create_filters(metadata))
         
     def query_data_with_score(
         self, query: str, k: int, metadata: Dict[str, str] = None
@@ -495,9 +702,13 @@ class ChatManagerRetrieval:
         conversation_limit: int,
         docs_limit: int,
         ai_name: str = "AcademiAI",
-        collection_name: str = "academi"
+        collection_name: str = "academi",
+        vector_index: Optional[VectorIndexCache] = None,
+        retrieval_cache: Optional[RetrievalCache] = None,
     ) -> None:
         self.embeddings = embeddings
+        self.vector_index = vector_index
+        self.retrieval_cache = retrieval_cache
         self.conversation_limit = conversation_limit
         self.docs_limit = docs_limit
         self.ai_name = ai_name
@@ -519,13 +730,22 @@ class ChatManagerRetrieval:
     ):
         metadata["collection"] = collection_name
         try:
-            filters = self.create_filters(metadata)
-            print(filters)
-            return self.vectorstore.similarity_search(query, k, filters=filters)
+            if self.retrieval_cache:
+                return self.retrieval_cache.get_or_search(
+                    self.qdrant_collection_name, query, k, metadata, lambda: self._search(query, k, metadata)
+                )
+            return self._search(query, k, metadata)
         except Exception as e:
             print(f"Error retrieving: {e}")
             return []
 
+    def _search(self, query: str, k: int, metadata: Dict[str, str]) -> List[Document]:
+        if self.vector_index and (docs := self.vector_index.search(query, k, metadata)) is not None:
+            return docs
+        filters = self.create_filters(metadata)
+        print(filters)
+        return self.vectorstore.similarity_search(query, k, filters=filters)
+
     @staticmethod
     def read_file_contents(user_id: str, collection_name: str, file_manager: FileDBManager, file_name: str = None, length: int = 2000) -> str:
         if not file_name:
@@ -543,21 +763,8 @@ class ChatManagerRetrieval:
 
         return "\n".join([file.file_content for file in files if file])[:length]
 
-    def chat(
-        self,
-        collection_name: str,
-        prompt: str,
-        chat_history: list[tuple[str, str]],
-        llm: BaseChatModel,
-        callback_func: callable = None,
-        on_end_callback: callable = None,
-        k: int = 4,
-        metadata: dict[str, str] = None,
-        filename: str = None,
-        help_data_random: str = "Ask user to reupload file!"
-    ) -> str:
-        
-        prompt_template = ChatPromptTemplate.from_messages(
+    def make_chat_prompt(self) -> ChatPromptTemplate:
+        return ChatPromptTemplate.from_messages(
             [
                 (
                     "system",
@@ -582,8 +789,40 @@ dont forget the above rules""",
                 MessagesPlaceholder(variable_name="messages"),
             ]
         )
-        
-           
+
+    def make_chat_inputs(
+        self, similar_docs: list[Document], chat_history: list[tuple[str, str]], prompt: str, help_data_random: str
+    ) -> dict:
+        print(len(similar_docs), "Docs")        
+        if not similar_docs:
+            logging.info("Using random data")
+            similar_docs = [Document(page_content=help_data_random)]
+            
+        chat_history = self.format_messages_into_messages(chat_history, self.conversation_limit)
+        return {
+            "context": similar_docs,
+            "ai_name": self.ai_name,
+            "language":"In the same langage of user",
+            "model_name":"gpt",
+            "messages": [
+                *chat_history,
+                HumanMessage(content=prompt)
+            ],
+        }
+
+    def chat(
+        self,
+        collection_name: str,
+        prompt: str,
+        chat_history: list[tuple[str, str]],
+        llm: BaseChatModel,
+        callback_func: callable = None,
+        on_end_callback: callable = None,
+        k: int = 4,
+        metadata: dict[str, str] = None,
+        filename: str = None,
+        help_data_random: str = "Ask user to reupload file!"
+    ) -> str:
         if metadata is None:
             metadata = {}
 
@@ -591,34 +830,41 @@ dont forget the above rules""",
         if filename:
             metadata["file"] = filename
 
-      #  similar_docs = self.query_data(
-       #     combined, collection_name, metadata=metadata, k=k // 2
-       # )
         similar_docs = self.query_data(prompt, collection_name, metadata=metadata, k=k)
-       # similar_docs = self._reduce_tokens_below_limit(
-       #     similar_docs, docs_limit=self.docs_limit
-       # )
-        print(len(similar_docs), "Docs")        
-        if not similar_docs:
-            logging.info("Using random data")
-            similar_docs = [Document(page_content=help_data_random)]
-            
-        chat_history = self.format_messages_into_messages(chat_history, self.conversation_limit)
-        document_chain = create_stuff_documents_chain(llm, prompt_template)
+        document_chain = create_stuff_documents_chain(llm, self.make_chat_prompt())
         return document_chain.invoke(
-            {
-                "context": similar_docs,
-                "ai_name": self.ai_name,
-                "language":"In the same langage of user",
-                "model_name":"gpt",
-                "messages": [
-                    *chat_history,
-                    HumanMessage(content=prompt)
-                ],
-            },
+            self.make_chat_inputs(similar_docs, chat_history, prompt, help_data_random),
             config={"verbose" : True}
         )
 
+    async def achat(
+        self,
+        collection_name: str,
+        prompt: str,
+        chat_history: list[tuple[str, str]],
+        llm: BaseChatModel,
+        channel: StreamChannel,
+        on_end_callback: callable = None,
+        k: int = 4,
+        metadata: dict[str, str] = None,
+        filename: str = None,
+        help_data_random: str = "Ask user to reupload file!"
+    ) -> str:
+        """Same as `chat` but streams into `channel` and can be cancelled mid generation."""
+        if metadata is None:
+            metadata = {}
+        if filename:
+            metadata["file"] = filename
+
+        similar_docs = await asyncio.to_thread(
+            self.query_data, prompt, collection_name, k, metadata
+        )
+        document_chain = create_stuff_documents_chain(llm, self.make_chat_prompt())
+        return await document_chain.ainvoke(
+            self.make_chat_inputs(similar_docs, chat_history, prompt, help_data_random),
+            config={"callbacks": [AsyncCustomCallback(channel, on_end_callback)]}
+        )
+
     def format_messages_into_messages(
         self,
         chat_history: List[Tuple[str, str]],
@@ -666,18 +912,23 @@ class ChatManagerNonRetrieval(ChatManagerRetrieval):
         python_client: PythonClient,
         ai_name: str = "AcademiAI",
         base_tools: list[Tool] = [],
+        max_concurrent_tools: int = 4,
+        tool_timeout: float = 60,
     ) -> None:
         self.conversation_limit = conversation_limit
         self.ai_name = ai_name
         self.python_client = python_client
         self.base_tools = base_tools
+        self.max_concurrent_tools = max_concurrent_tools
+        self.tool_timeout = tool_timeout
 
     def make_agent(
         self,
         llm: BaseChatModel,
         extra_tools: list[Tool] = [],
         files: str = "No files",
-        sys_template: str = None
+        sys_template: str = None,
+        tool_timeouts: Dict[str, float] = None,
     ) -> AgentExecutor:
         sys_message_default_template = f"""
 You are {self.ai_name}, an AI teacher designed to teach students. 
@@ -725,11 +976,14 @@ Follow all above rules (Important)
         )
         tools = [*self.make_code_runner(), *extra_tools, *self.base_tools]
         agent_obj = create_tool_calling_agent(llm, tools, prompt)
-        return AgentExecutor.from_agent_and_tools(
+        return ParallelAgentExecutor.from_agent_and_tools(
             agent=agent_obj,
             tools=tools,
             handle_parsing_errors=True,
             max_iterations=5,
+            max_concurrent_tools=self.max_concurrent_tools,
+            default_tool_timeout=self.tool_timeout,
+            tool_timeouts=tool_timeouts or {},
         )
 
     def make_code_runner(self) -> list[Tool]:
@@ -812,4 +1066,70 @@ You will not run unsafe code or perform harm to the server youre on. Or import p
                 },
             )
 
+    async def arun_agent(
+        self,
+        prompt: str,
+        llm: BaseChatModel,
+        channel: StreamChannel,
+        on_end_callback: callable = None,
+        chat_history: list[tuple[str, str]] = None,
+        extra_tools: list = None,
+        files: str = "",
+        sys_template: str = None,
+        tool_timeouts: Dict[str, float] = None,
+    ):
+        """Same as `run_agent` but streams into `channel` and can be cancelled mid generation.
+
+        Tool calls of a step run concurrently, `tool_timeouts` overrides the timeout per tool name.
+        """
+        chat_history_messages = self.format_messages_into_messages(
+            chat_history or [], self.conversation_limit
+        )
+        agent = self.make_agent(
+            llm=llm,
+            extra_tools=extra_tools or [],
+            sys_template=sys_template,
+            files=files,
+            tool_timeouts=tool_timeouts,
+        )
+        return await agent.ainvoke(
+            {
+                "input": [HumanMessage(content=prompt)],
+                "chat_history" : chat_history_messages
+            },
+            config={
+                "callbacks" : [AsyncCustomCallbackAgent(channel, on_end_callback)],
+            }
+        )
+
+
 
+    async def arun_fast(
+        self,
+        prompt: str,
+        llm: BaseChatModel,
+        channel: StreamChannel,
+        on_end_callback: callable = None,
+        chat_history: list[tuple[str, str]] = None,
+        history_limit: int = 1500,
+    ) -> str:
+        """Answers a trivial turn without the agent, its tools or the file list."""
+        sys_template = f"""You are {self.ai_name}, an AI teacher inside a study app. 
+Talk like a friendly teacher, refer to the user as student and use emojis.
+Keep the answer short."""
+        chat_prompt = ChatPromptTemplate.from_messages(
+            [
+                SystemMessage(content=sys_template),
+                MessagesPlaceholder(variable_name="chat_history"),
+                MessagesPlaceholder(variable_name="input"),
+            ]
+        )
+        chain = chat_prompt | llm
+        response = await chain.ainvoke(
+            {
+                "input": [HumanMessage(content=prompt)],
+                "chat_history": self.format_messages_into_messages(chat_history or [], history_limit),
+            },
+            config={"callbacks": [AsyncCustomCallback(channel, on_end_callback)]},
+        )
+        return response.content
@@ -1,5 +1,7 @@
+import asyncio
 import logging
 import re
+import threading
 from typing import List, Optional, Tuple
 from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
 from uuid import UUID
@@ -12,12 +14,14 @@ from langchain.schema import (
     HumanMessage,
     AIMessage,
 )
-from langchain.callbacks.base import BaseCallbackHandler
+from langchain.callbacks.base import AsyncCallbackHandler, BaseCallbackHandler
 from langchain.chat_models.base import BaseChatModel
 from langchain.agents import AgentExecutor, create_tool_calling_agent
 from typing import Any, Optional
 from langchain.agents.agent import AgentExecutor
 from langchain.schema.agent import AgentFinish
+from ..streaming import StreamChannel
+from ..agent_executor import ParallelAgentExecutor
 
 
 
@@ -75,19 +79,64 @@ class CustomCallback(BaseCallbackHandler):
         if self.cached or not self.is_openai:
             self.callback(finish.return_values.get("output", ""))
         self.callback("@@END@@")
+
+
+class AsyncCustomCallback(AsyncCallbackHandler):
+    """Async counterpart of `CustomCallback` writing into a `StreamChannel`."""
+
+    def __init__(self, channel: StreamChannel, on_end_callback, is_openai: bool) -> None:
+        self.channel = channel
+        self.on_end_callback = on_end_callback
+        super().__init__()
+        self.cached = True
+        self.is_openai = is_openai
+
+    async def on_llm_new_token(self, token: str, **kwargs) -> None:
+        if token:
+            self.cached = False
+        if not self.cached and self.is_openai:
+            await self.channel.send(token)
+
+    async def on_agent_action(self, action: Any, **kwargs: Any) -> None:
+        await self.channel.send(
+            "*AI is using a tool to perform calculations to better assist you...*\n"
+        )
+
+    async def on_tool_end(self, output: str, **kwargs: Any) -> None:
+        await self.channel.send("\n*AI has finished using the tool and will respond shortly...*\n")
+
+    async def on_tool_error(self, error: BaseException, **kwargs: Any) -> None:
+        await self.on_tool_end(str(error))
+
+    async def on_agent_finish(self, finish: AgentFinish, **kwargs: Any) -> None:
+        output = finish.return_values.get("output", "")
+        if self.cached or not self.is_openai:
+            await self.channel.replay(output)
+        if self.on_end_callback:
+            await asyncio.to_thread(self.on_end_callback, output)
+        await self.channel.close()
         
 
 
 
 class MathSolver:
     def __init__(
-        self, python_client: PythonClient, llm: BaseChatModel, is_openai_functions: bool = True, extra_tools: list[Tool] = []
+        self,
+        python_client: PythonClient,
+        llm: BaseChatModel,
+        is_openai_functions: bool = True,
+        extra_tools: list[Tool] = [],
+        max_concurrent_tools: int = 4,
+        tool_timeout: float = 60,
     ) -> None:
         self.python_client = python_client
         self.llm = llm
         self.is_openai_functions = is_openai_functions
         self.python_count = 0
+        self.python_count_lock = threading.Lock()
         self.extra_tools = extra_tools
+        self.max_concurrent_tools = max_concurrent_tools
+        self.tool_timeout = tool_timeout
 
     def make_tools(self) -> list[Tool]:
         try:
@@ -118,10 +167,12 @@ Used to execute multiline python code wont persist states so run everything once
         def python_function(code: str):
             logging.info(f"Runing {code}")
             max_count = 3 if self.is_openai_functions else 2
-            if self.python_count >= max_count:
-                return "Cannot use tool anymore, just answer what you know"
+            # Calls of one step run in parallel threads, count them before running
+            with self.python_count_lock:
+                if self.python_count >= max_count:
+                    return "Cannot use tool anymore, just answer what you know"
+                self.python_count += 1
             result = self.python_client.evaluate_code(extract_python_code(code))
-            self.python_count += 1
             try:
                 return result["result"]
             except Exception as e:
@@ -159,11 +210,13 @@ Remember to explain thoroughly in English, as the student will be solving the pr
 
         tools = self.make_tools()
         agent_obj = create_tool_calling_agent(llm, tools, prompt)
-        return AgentExecutor.from_agent_and_tools(
+        return ParallelAgentExecutor.from_agent_and_tools(
             agent=agent_obj,
             tools=tools,
             handle_parsing_errors=True,
             max_iterations=5,
+            max_concurrent_tools=self.max_concurrent_tools,
+            default_tool_timeout=self.tool_timeout,
         )
 
 
@@ -196,6 +249,26 @@ Remember to explain thoroughly in English, as the student will be solving the pr
         )
 
 
+    async def arun_agent(
+        self,
+        prompt: str,
+        channel: StreamChannel,
+        on_end_callback: callable = None,
+        chat_history: list[tuple[str, str]] = None,
+    ):
+        """Same as `run_agent` but streams into `channel` and can be cancelled mid generation."""
+        # make_agent fetches the available libraries over HTTP
+        agent = await asyncio.to_thread(self.make_agent, llm=self.llm)
+        return await agent.ainvoke(
+            {
+                "input": [HumanMessage(content=self.wrap_prompt(prompt))],
+                "chat_history" : self.format_messages(chat_history or [], 2000, self.llm)
+            },
+            config={
+                "callbacks" : [AsyncCustomCallback(channel, on_end_callback, self.is_openai_functions)]
+            }
+        )
+
     def format_messages(
         self,
         chat_history: List[Tuple[str, str]],
@@ -0,0 +1,105 @@
+import json
+import logging
+import threading
+import httpx
+
+from typing import Any, Dict, Optional, Tuple
+from langchain.chat_models.base import BaseChatModel
+from ..ai_model import AIModel
+from .rate_limiter import AsyncRateLimitedTransport, RateLimitedTransport, RateLimiter
+
+
+logger = logging.getLogger(__name__)
+
+PER_CALL_FIELDS = frozenset({"streaming", "temperature", "cache", "callbacks", "verbose", "max_tokens"})
+
+
+def _freeze(value: Any) -> str:
+    try:
+        return json.dumps(value, sort_keys=True, default=repr)
+    except Exception:
+        return repr(value)
+
+
+class ModelRegistry:
+    """Builds every chat model configuration once and hands out cheap per-call copies.
+
+    Constructing an `AzureChatOpenAI`/`ChatOpenAI` creates a fresh OpenAI client with
+    its own connection pool. The registry keeps one instance per
+    (model class, premium, static kwargs) and applies per-call settings such as
+    temperature, streaming and callbacks with a shallow copy, which shares the
+    underlying client and its keep-alive connections.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 200,
+        max_keepalive_connections: int = 50,
+        keepalive_expiry: float = 60,
+        timeout: float = 60,
+        rate_limiter: Optional[RateLimiter] = None,
+    ) -> None:
+        limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        transport = httpx.HTTPTransport(limits=limits)
+        async_transport = httpx.AsyncHTTPTransport(limits=limits)
+        if rate_limiter is not None:
+            # Every request of a shared client waits for provider capacity first
+            transport = RateLimitedTransport(rate_limiter, transport)
+            async_transport = AsyncRateLimitedTransport(rate_limiter, async_transport)
+        self.http_client = httpx.Client(transport=transport, timeout=timeout)
+        self.http_async_client = httpx.AsyncClient(transport=async_transport, timeout=timeout)
+        self._models: Dict[Tuple[int, bool, str], BaseChatModel] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def split_kwargs(model_kwargs: dict) -> Tuple[dict, dict]:
+        static = {k: v for k, v in model_kwargs.items() if k not in PER_CALL_FIELDS}
+        per_call = {k: v for k, v in model_kwargs.items() if k in PER_CALL_FIELDS}
+        return static, per_call
+
+    def shared_client_kwargs(self, model_cls: type) -> dict:
+        fields = getattr(model_cls, "__fields__", {})
+        kwargs = {}
+        if "http_client" in fields:
+            kwargs["http_client"] = self.http_client
+        if "http_async_client" in fields:
+            kwargs["http_async_client"] = self.http_async_client
+        return kwargs
+
+    def _build(self, model_class: AIModel, premium: bool, static_kwargs: dict) -> BaseChatModel:
+        model_type = "premium" if premium else "regular"
+        args = getattr(model_class, f"{model_type}_args")
+        model_cls = getattr(model_class, f"{model_type}_model")
+        kwargs = {**self.shared_client_kwargs(model_cls), **args, **static_kwargs}
+        logger.info(f"Building shared {model_cls.__name__} ({model_type})")
+        return model_cls(**kwargs)
+
+    def get_base(self, model_class: AIModel, premium: bool, static_kwargs: Optional[dict] = None) -> BaseChatModel:
+        static_kwargs = static_kwargs or {}
+        key = (id(model_class), premium, _freeze(static_kwargs))
+        if model := self._models.get(key):
+            return model
+
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = self._build(model_class, premium, static_kwargs)
+            return self._models[key]
+
+    def get(self, model_class: AIModel, premium: bool, model_kwargs: dict) -> BaseChatModel:
+        """Returns a request scoped model, safe to mutate (e.g. `llm.callbacks = ...`)."""
+        static_kwargs, per_call = self.split_kwargs(model_kwargs)
+        base = self.get_base(model_class, premium, static_kwargs)
+        update = {k: v for k, v in per_call.items() if k in getattr(base, "__fields__", {})}
+        return base.copy(update=update)
+
+    def size(self) -> int:
+        return len(self._models)
+
+    def close(self) -> None:
+        with self._lock:
+            self._models.clear()
+        self.http_client.close()
@@ -9,6 +9,7 @@ from langchain.pydantic_v1 import BaseModel, Field
 from docx import Document
 from docx.shared import RGBColor
 from langchain.chat_models.base import BaseChatModel
+from ..structured_output import StructuredOutput
 from langchain.schema import SystemMessage, HumanMessage, AIMessage
 from langchain.prompts import (
     ChatPromptTemplate,
@@ -141,7 +142,7 @@ The notes in markdown (RETURN NO OTHER TEXT):"""
             return notes.strip()
 
     def generate_title(self, content: str) -> Metadata:
-        structured_llm = self.llm.with_structured_output(Metadata)
+        structured_llm = StructuredOutput(self.llm, Metadata)
         return structured_llm.invoke(
             [
                 SystemMessage(
@@ -266,7 +267,7 @@ The image and description should show the full picture, this is for students. we
                 content=f"Here is the query: {query}. Return only the images that are relevant to the query"
             )
         )
-        return self.llm.with_structured_output(RelevantImages).invoke(messages)
+        return StructuredOutput(self.llm, RelevantImages).invoke(messages)
 
 
 if __name__ == "__main__":
@@ -164,10 +164,10 @@ class TemplateKnowledgeManager(TemplateObserver):
 
 
 def initialize_managers(
-    template_json_path: str, template_dir: str
+    template_json_path: str, template_dir: str, embeddings = None
 ) -> tuple[TemplateDBManager, TemplateKnowledgeManager]:
     template_manager = TemplateDBManager(templates_json_path=template_json_path, template_dir=template_dir)
-    knowledge_manager = TemplateKnowledgeManager()
+    knowledge_manager = TemplateKnowledgeManager(embeddings)
     templates = template_manager.get_all_templates()
     docs = [
         Document(
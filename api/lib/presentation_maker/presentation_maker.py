@@ -12,6 +12,7 @@ from .database import TemplateDBManager, TemplateKnowledgeManager, TemplateModel
 from langchain.pydantic_v1 import BaseModel, Field
 from ..knowledge_manager import KnowledgeManager
 from ..diagram_maker import DiagramMaker
+from ..structured_output import StructuredOutput
 from retrying import retry
 from langchain.chat_models.base import BaseChatModel
 
@@ -189,7 +190,7 @@ Dont make slides with same heading and detail failure to do so will cause error.
             negative_prompt=presentation_input.negative_prompt,
             slides=self.format_slides(template.slides),
         )
-        structured_llm = self.llm.with_structured_output(PresentationSequence)
+        structured_llm = StructuredOutput(self.llm, PresentationSequence)
         return structured_llm.invoke(
             messages
         )
@@ -424,7 +425,7 @@ Titles and subtitles must be even shorter only content placeholders can have mor
         else:
             help_text = "Use your own knowledge to fill the placeholders"
 
-        structured_llm = self.llm.with_structured_output(Placeholders)
+        structured_llm = StructuredOutput(self.llm, Placeholders)
         messages = prompt.format_messages(
             placeholders=self.format_placeholders(slide.placeholders, True),
             slide_detail=sequence_part.slide_detail,
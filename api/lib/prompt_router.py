@@ -0,0 +1,164 @@
+import logging
+import math
+import re
+
+from dataclasses import dataclass
+from typing import Dict, Optional, Sequence, Tuple
+from prometheus_client import Counter
+
+
+logger = logging.getLogger(__name__)
+
+FAST, AGENT = "fast", "agent"
+
+ROUTE_DECISIONS = Counter(
+    "llm_route_decisions_total",
+    "Chat turns per route picked by the prompt router",
+    ["route", "reason"],
+)
+
+_WORD = re.compile(r"\w+", re.U)
+_URL = re.compile(r"https?://|www\.", re.I)
+_MATH = re.compile(r"\d\s*[-+*/^=]\s*\d|\\frac|\\sqrt|∫|∑|√")
+_CODE = re.compile(r"```|\bdef |\bimport |#include|;\s*$", re.M)
+_CONVERSATIONAL = re.compile(
+    r"^\W*(hi+|hey+|hello+|yo|sup|hola|salam|assalam\w*|namaste|good (morning|afternoon|evening|night)|"
+    r"thanks?( a lot| so much| you)?|thank u|thx|ty|merci|gracias|shukriya|ok(ay)?|k+|cool|nice|great|awesome|"
+    r"perfect|got it|i see|understood|sure|yes|yeah|yep|no|nope|bye|goodbye|see (you|ya)|lol|haha+|"
+    r"who are you|what(?:'s| is) your name|how are you)\W*$",
+    re.I,
+)
+# Agreement with whatever the previous answer offered
+_CONFIRMATION = re.compile(
+    r"^\W*(yes|yeah|yep|yup|ya|sure|ok(ay)?|k|please|go ahead|do it|go for it|sounds good|why not|of course|"
+    r"alright|absolutely|definitely)(\W+(yes|sure|ok(ay)?|please|go ahead|do it|go for it|thanks?|thank you))*\W*$",
+    re.I,
+)
+# Phrases an answer offers a follow up action with
+_OFFER = re.compile(
+    r"\b(want me to|would you like( me)? to|shall i|should i|do you want( me)? to|"
+    r"let me know if you(?:'d| would) like|if you(?:'d| would) like,? i can|i can also)\b",
+    re.I,
+)
+_SENTENCE = re.compile(r"[^.!?\n]*[.!?\n]?")
+# Words that point at something only the agent's tools can do, time sensitive ones need web search
+_ACTION_WORDS = frozenset(
+    """
+    presentation ppt powerpoint slide slides graph graphs chart charts plot diagram diagrams flowchart
+    notes table timetable schedule essay essays article report poem write draft search find look latest
+    news course courses youtube video videos link pdf doc docx document image images picture pictures
+    code python run execute calculate compute solve subject subjects file files upload uploaded quiz
+    flashcards translate summarize summarise summary
+    """.split()
+)
+_TOOL_WORDS = _ACTION_WORDS | frozenset(
+    """
+    today tonight yesterday tomorrow current currently now recent recently live weather forecast temperature
+    price prices stock stocks rate rates exchange bitcoin crypto score scores won win winner winning match
+    election elected president ceo
+    """.split()
+)
+
+
+
+def _offers_action(answer: str) -> bool:
+    """Whether an answer ends by offering or asking about something, e.g. "Want me to make slides?"."""
+    tail = answer[-400:]
+    if _OFFER.search(tail):
+        return True
+    return any(
+        sentence.strip().endswith("?") and any(word.lower() in _ACTION_WORDS for word in _WORD.findall(sentence))
+        for sentence in _SENTENCE.findall(tail)
+    )
+
+
+DEFAULT_WEIGHTS: Dict[str, float] = {
+    "bias": 1.5,
+    "conversational": 3.0,
+    "words": -0.12,
+    "tool_words": -2.5,
+    "question": -0.6,
+    "math": -2.0,
+    "code": -3.0,
+    "history_tools": -0.8,
+}
+
+
+@dataclass
+class RouteDecision:
+    route: str
+    score: float
+    reason: str
+
+    @property
+    def fast(self) -> bool:
+        return self.route == FAST
+
+
+def prompt_features(prompt: str, chat_history: Optional[Sequence[Tuple[str, str]]] = None) -> Dict[str, float]:
+    """Cheap features of a chat turn, the inputs of the router's classifier."""
+    words = [word.lower() for word in _WORD.findall(prompt)]
+    last_answer = chat_history[-1][1] if chat_history else ""
+    return {
+        "conversational": float(bool(_CONVERSATIONAL.match(prompt.strip()))),
+        "words": float(len(words)),
+        "tool_words": float(sum(1 for word in words if word in _TOOL_WORDS)),
+        "question": float("?" in prompt),
+        "math": float(bool(_MATH.search(prompt))),
+        "code": float(bool(_CODE.search(prompt))),
+        "url": float(bool(_URL.search(prompt))),
+        # Follow ups on a tool answer ("make it shorter") tend to need the tool again
+        "history_tools": float(bool(_URL.search(last_answer)) or "```" in last_answer),
+        # "yes" to "Want me to make a presentation?" needs the tool that was offered
+        "confirms_offer": float(bool(_CONFIRMATION.match(prompt.strip())) and _offers_action(last_answer)),
+    }
+
+
+class PromptRouter:
+    """Sends trivial chat turns to a fast path without tools.
+
+    A logistic score over `prompt_features` estimates how likely a turn can
+    be answered without tools. Links, long prompts and agreeing to an action
+    the previous answer offered always go to the agent, so mistakes only
+    ever cost a little latency, never a missing tool.
+    """
+
+    def __init__(
+        self,
+        weights: Optional[Dict[str, float]] = None,
+        threshold: float = 0.7,
+        max_words: int = 40,
+        enabled: bool = True,
+    ) -> None:
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.threshold = threshold
+        self.max_words = max_words
+        self.enabled = enabled
+
+    def score(self, features: Dict[str, float]) -> float:
+        logit = self.weights["bias"] + sum(
+            weight * features.get(name, 0.0) for name, weight in self.weights.items() if name != "bias"
+        )
+        return 1 / (1 + math.exp(-logit))
+
+    def decide(self, prompt: str, chat_history: Optional[Sequence[Tuple[str, str]]] = None) -> RouteDecision:
+        if not self.enabled:
+            return RouteDecision(AGENT, 0.0, "disabled")
+        features = prompt_features(prompt, chat_history)
+        if features["url"]:
+            return RouteDecision(AGENT, 0.0, "url")
+        if features["confirms_offer"]:
+            return RouteDecision(AGENT, 0.0, "confirmation")
+        if features["words"] > self.max_words:
+            return RouteDecision(AGENT, 0.0, "long")
+        score = self.score(features)
+        if score >= self.threshold:
+            return RouteDecision(FAST, score, "conversational" if features["conversational"] else "simple")
+        return RouteDecision(AGENT, score, "tools" if features["tool_words"] else "score")
+
+    def route(self, prompt: str, chat_history: Optional[Sequence[Tuple[str, str]]] = None) -> RouteDecision:
+        decision = self.decide(prompt, chat_history)
+        ROUTE_DECISIONS.labels(route=decision.route, reason=decision.reason).inc()
+        logger.info(f"Routed chat turn to {decision.route} ({decision.reason}, score {decision.score:.2f})")
+        return decision
+
@@ -9,13 +9,12 @@ from langchain.prompts import (
     SystemMessagePromptTemplate,
     HumanMessagePromptTemplate,
 )
-from langchain.output_parsers import PydanticOutputParser
 from langchain.schema.language_model import BaseLanguageModel
 from langchain.pydantic_v1 import BaseModel, Field
 from pydantic import BaseModel as RealBaseModel
 from pydantic import BaseModel, Field
 from retrying import retry
-from langchain.output_parsers import PydanticOutputParser, OutputFixingParser
+from .structured_output import RepairingOutputParser
 from typing import List, Literal
 
 class Option(BaseModel):
@@ -172,8 +171,7 @@ class QuizGenerator:
         maximum_questions: int = 7,
         collection_description: str = "Anything",
     ) -> list[QuizQuestionResponse]:
-        parser = PydanticOutputParser(pydantic_object=Quiz)
-        parser = OutputFixingParser.from_llm(parser=parser, llm=self.llm)
+        parser = RepairingOutputParser.from_llm(Quiz, self.llm)
 
         fotmat_instructions = f"""You will follow the following schema and will not return anything else or an error will be raised
 The schema:
@@ -288,8 +286,7 @@ THe quiz in json with {number_of_questions} questions be brief:"""
         maximium_flashcards: int = 7,
         collection_description: str = "Anything",
     ) -> list[FlashCard]:
-        parser = PydanticOutputParser(pydantic_object=FlashCards)
-        parser = OutputFixingParser.from_llm(parser=parser, llm=self.llm)
+        parser = RepairingOutputParser.from_llm(FlashCards, self.llm)
         prompt_template = ChatPromptTemplate(
             messages=[
                 SystemMessagePromptTemplate.from_template(
@@ -340,8 +337,7 @@ The generated flashcards in proper schema. You must follow the schema and return
 
     @retry(stop_max_attempt_number=3)
     def evaluate_quiz(self, user_answers: list[UserResponse]) -> Result:
-        parser = PydanticOutputParser(pydantic_object=QuestionResults)
-        parser = OutputFixingParser.from_llm(parser=parser, llm=self.llm)
+        parser = RepairingOutputParser.from_llm(QuestionResults, self.llm)
 
         format_instruction = f"""The schema:
 {parser.get_format_instructions()}"""
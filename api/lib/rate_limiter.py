@@ -0,0 +1,357 @@
+import asyncio
+import itertools
+import json
+import logging
+import threading
+import time
+import httpx
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterator, Optional, Tuple
+from prometheus_client import Counter, Gauge, Histogram
+from redis import Redis
+from .feature_metrics import record_provider_request
+
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+_RANKS = {INTERACTIVE: 0, BACKGROUND: 1}
+
+_priority: ContextVar[str] = ContextVar("rate_limit_priority", default=BACKGROUND)
+_wait_listener: ContextVar[Optional[Callable[[int, float], None]]] = ContextVar("rate_limit_wait_listener", default=None)
+
+RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "llm_rate_limit_wait_seconds",
+    "Time calls waited for provider capacity",
+    ["provider", "priority"],
+)
+RATE_LIMIT_WAITING = Gauge(
+    "llm_rate_limit_waiting",
+    "Calls currently waiting for provider capacity",
+    ["provider", "priority"],
+)
+RATE_LIMIT_TOKENS = Counter(
+    "llm_rate_limit_estimated_tokens_total",
+    "Tokens reserved up front for provider calls",
+    ["provider", "priority"],
+)
+
+# Two buckets (requests and tokens) per provider, refilled continuously per minute.
+# Background calls may not dip into the last `reserve` share, which is kept for interactive ones.
+_ACQUIRE_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local time = redis.call("TIME")
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2])
+local cost, reserve = tonumber(ARGV[3]), tonumber(ARGV[4])
+local state = redis.call("HMGET", KEYS[1], "requests", "tokens", "ts")
+local requests = tonumber(state[1]) or rpm
+local tokens = tonumber(state[2]) or tpm
+local elapsed = math.max(0, now - (tonumber(state[3]) or now))
+requests = math.min(rpm, requests + elapsed * rpm / 60)
+tokens = math.min(tpm, tokens + elapsed * tpm / 60)
+local wait = 0
+if requests - 1 < rpm * reserve then
+    wait = math.max(wait, (rpm * reserve + 1 - requests) * 60 / rpm)
+end
+if tokens - cost < tpm * reserve then
+    wait = math.max(wait, (tpm * reserve + cost - tokens) * 60 / tpm)
+end
+if wait == 0 then
+    requests = requests - 1
+    tokens = tokens - cost
+end
+redis.call("HSET", KEYS[1], "requests", requests, "tokens", tokens, "ts", now)
+redis.call("EXPIRE", KEYS[1], 120)
+return tostring(wait)
+"""
+
+
+def current_priority() -> str:
+    return _priority.get()
+
+
+@contextmanager
+def priority_scope(priority: str) -> Iterator[None]:
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+@contextmanager
+def wait_listener(listener: Callable[[int, float], None]) -> Iterator[None]:
+    """Calls `listener(queue_position, eta_seconds)` while calls in this scope wait for capacity."""
+    token = _wait_listener.set(listener)
+    try:
+        yield
+    finally:
+        _wait_listener.reset(token)
+
+
+@dataclass
+class _Bucket:
+    requests: float
+    tokens: float
+    ts: float
+
+
+@dataclass
+class _Waiter:
+    provider: str
+    rank: int
+    seq: int
+    tokens: int
+
+
+class RateLimiter:
+    """Token bucket scheduler for provider requests per minute and tokens per minute.
+
+    Buckets live in Redis so all workers share the provider quota, with an in
+    process bucket as fallback. Within a worker waiting calls are served in
+    priority order, interactive before background.
+    """
+
+    def __init__(
+        self,
+        redis_: Optional[Redis],
+        limits: Dict[str, Dict[str, int]],
+        *,
+        background_reserve: float = 0.2,
+        max_wait: float = 120,
+        poll_interval: float = 0.05,
+        prefix: str = "ratelimit",
+        enabled: bool = True,
+    ) -> None:
+        self.redis = redis_
+        self.limits = limits
+        self.background_reserve = background_reserve
+        self.max_wait = max_wait
+        self.poll_interval = poll_interval
+        self.prefix = prefix
+        self.enabled = enabled
+        self._script = redis_.register_script(_ACQUIRE_SCRIPT) if redis_ is not None else None
+        self._buckets: Dict[str, _Bucket] = {}
+        self._waiters: Dict[int, _Waiter] = {}
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def limit_for(self, provider: str) -> Optional[Tuple[int, int]]:
+        if not self.enabled or (limit := self.limits.get(provider)) is None:
+            return None
+        return limit.get("rpm", 10**9), limit.get("tpm", 10**12)
+
+    def _local_try(self, provider: str, rpm: int, tpm: int, cost: int, reserve: float) -> float:
+        now = time.time()
+        with self._lock:
+            bucket = self._buckets.setdefault(provider, _Bucket(rpm, tpm, now))
+            elapsed = max(0.0, now - bucket.ts)
+            bucket.requests = min(rpm, bucket.requests + elapsed * rpm / 60)
+            bucket.tokens = min(tpm, bucket.tokens + elapsed * tpm / 60)
+            bucket.ts = now
+            wait = 0.0
+            if bucket.requests - 1 < rpm * reserve:
+                wait = max(wait, (rpm * reserve + 1 - bucket.requests) * 60 / rpm)
+            if bucket.tokens - cost < tpm * reserve:
+                wait = max(wait, (tpm * reserve + cost - bucket.tokens) * 60 / tpm)
+            if wait == 0:
+                bucket.requests -= 1
+                bucket.tokens -= cost
+            return wait
+
+    def _try(self, provider: str, tokens: int, priority: str) -> float:
+        """Takes capacity if available, otherwise returns the seconds until it should be."""
+        rpm, tpm = self.limit_for(provider)
+        # Oversized calls would never fit next to the interactive reserve
+        cost = min(tokens, int(tpm * (1 - self.background_reserve)))
+        reserve = self.background_reserve if priority == BACKGROUND else 0.0
+        if self._script is not None:
+            try:
+                return float(self._script(keys=[f"{self.prefix}:{provider}"], args=[rpm, tpm, cost, reserve]))
+            except Exception as e:
+                logger.error(f"Rate limiter falling back to local buckets: {e}")
+        return self._local_try(provider, rpm, tpm, cost, reserve)
+
+    def _enqueue(self, provider: str, tokens: int, priority: str) -> int:
+        ticket = next(self._seq)
+        with self._lock:
+            self._waiters[ticket] = _Waiter(provider, _RANKS.get(priority, 1), ticket, tokens)
+        RATE_LIMIT_WAITING.labels(provider=provider, priority=priority).inc()
+        return ticket
+
+    def _dequeue(self, ticket: int, priority: str) -> None:
+        with self._lock:
+            waiter = self._waiters.pop(ticket)
+        RATE_LIMIT_WAITING.labels(provider=waiter.provider, priority=priority).dec()
+
+    def _ahead(self, ticket: int) -> Tuple[int, int]:
+        """Waiters of the same provider served before `ticket`, and the tokens they need."""
+        with self._lock:
+            me = self._waiters[ticket]
+            ahead = [
+                waiter
+                for waiter in self._waiters.values()
+                if waiter.provider == me.provider and (waiter.rank, waiter.seq) < (me.rank, me.seq)
+            ]
+        return len(ahead), sum(waiter.tokens for waiter in ahead)
+
+    def _eta(self, provider: str, tokens_ahead: int, wait: float) -> float:
+        _, tpm = self.limit_for(provider)
+        return wait + tokens_ahead * 60 / tpm
+
+    def _step(self, ticket: int, provider: str, tokens: int, priority: str, reported_at: float) -> Tuple[Optional[float], float]:
+        """One scheduling attempt, returns (None, _) once capacity was taken or the time to sleep."""
+        position, tokens_ahead = self._ahead(ticket)
+        wait = 0.0
+        if position == 0:
+            wait = self._try(provider, tokens, priority)
+            if wait == 0:
+                return None, reported_at
+        listener = _wait_listener.get()
+        if listener is not None and time.monotonic() - reported_at >= 1:
+            reported_at = time.monotonic()
+            try:
+                listener(position, self._eta(provider, tokens_ahead, wait))
+            except Exception as e:
+                logger.error(f"Rate limit wait listener failed: {e}")
+        return max(self.poll_interval, min(wait, 1.0)), reported_at
+
+    def acquire(self, provider: str, tokens: int, priority: Optional[str] = None) -> float:
+        """Blocks until the call fits in the provider's quota, returns the seconds waited."""
+        if self.limit_for(provider) is None:
+            return 0.0
+        priority = priority or current_priority()
+        RATE_LIMIT_TOKENS.labels(provider=provider, priority=priority).inc(tokens)
+        started = time.monotonic()
+        ticket = self._enqueue(provider, tokens, priority)
+        reported_at = 0.0
+        try:
+            while time.monotonic() - started < self.max_wait:
+                sleep, reported_at = self._step(ticket, provider, tokens, priority, reported_at)
+                if sleep is None:
+                    break
+                time.sleep(sleep)
+            else:
+                logger.warning(f"Gave up waiting for {provider} capacity after {self.max_wait}s")
+        finally:
+            self._dequeue(ticket, priority)
+        waited = time.monotonic() - started
+        RATE_LIMIT_WAIT_SECONDS.labels(provider=provider, priority=priority).observe(waited)
+        return waited
+
+    async def aacquire(self, provider: str, tokens: int, priority: Optional[str] = None) -> float:
+        if self.limit_for(provider) is None:
+            return 0.0
+        priority = priority or current_priority()
+        RATE_LIMIT_TOKENS.labels(provider=provider, priority=priority).inc(tokens)
+        started = time.monotonic()
+        ticket = self._enqueue(provider, tokens, priority)
+        reported_at = 0.0
+        try:
+            while time.monotonic() - started < self.max_wait:
+                sleep, reported_at = await asyncio.to_thread(
+                    self._step, ticket, provider, tokens, priority, reported_at
+                )
+                if sleep is None:
+                    break
+                await asyncio.sleep(sleep)
+            else:
+                logger.warning(f"Gave up waiting for {provider} capacity after {self.max_wait}s")
+        finally:
+            self._dequeue(ticket, priority)
+        waited = time.monotonic() - started
+        RATE_LIMIT_WAIT_SECONDS.labels(provider=provider, priority=priority).observe(waited)
+        return waited
+
+    def estimate(self, priority: str = BACKGROUND) -> Dict[str, float]:
+        """Queue position and ETA a new call of `priority` would get on the busiest provider."""
+        rank = _RANKS.get(priority, 1)
+        with self._lock:
+            waiters = list(self._waiters.values())
+        position, eta = 0, 0.0
+        for provider in {waiter.provider for waiter in waiters}:
+            ahead = [w for w in waiters if w.provider == provider and w.rank <= rank]
+            position = max(position, len(ahead))
+            eta = max(eta, self._eta(provider, sum(w.tokens for w in ahead), 0.0))
+        return {"queue_position": position, "eta_seconds": round(eta, 1)}
+
+
+def estimate_request(request: httpx.Request, completion_tokens: int = 512) -> Tuple[Optional[str], int]:
+    """Provider deployment and a rough token count of an OpenAI/Azure OpenAI request."""
+    try:
+        body = json.loads(request.content or b"{}")
+    except Exception:
+        return None, 0
+    if not isinstance(body, dict):
+        return None, 0
+
+    parts = request.url.path.split("/")
+    if "deployments" in parts and parts.index("deployments") + 1 < len(parts):
+        provider = f"azure:{parts[parts.index('deployments') + 1]}"
+    elif body.get("model"):
+        provider = f"openai:{body['model']}"
+    else:
+        provider = None
+
+    chars = 0
+    images = 0
+    for message in body.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "image_url":
+                    images += 1
+                else:
+                    chars += len(part.get("text", ""))
+    if "input" in body:
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        for item in inputs:
+            # Embedding inputs are either text or already tokenized
+            chars += len(item) if isinstance(item, str) else len(item) * 4
+        completion_tokens = 0
+    if "functions" in body or "tools" in body:
+        chars += len(json.dumps(body.get("functions") or body.get("tools")))
+
+    max_tokens = body.get("max_tokens") or completion_tokens
+    return provider, chars // 4 + images * 765 + max_tokens
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    def __init__(self, limiter: RateLimiter, transport: httpx.BaseTransport) -> None:
+        self.limiter = limiter
+        self.transport = transport
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/chat/completions"):
+            record_provider_request()
+        provider, tokens = estimate_request(request)
+        if provider:
+            self.limiter.acquire(provider, tokens)
+        return self.transport.handle_request(request)
+
+    def close(self) -> None:
+        self.transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    def __init__(self, limiter: RateLimiter, transport: httpx.AsyncBaseTransport) -> None:
+        self.limiter = limiter
+        self.transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/chat/completions"):
+            record_provider_request()
+        provider, tokens = estimate_request(request)
+        if provider:
+            await self.limiter.aacquire(provider, tokens)
+        return await self.transport.handle_async_request(request)
+
+    async def aclose(self) -> None:
+        await self.transport.aclose()
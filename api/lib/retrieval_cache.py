@@ -0,0 +1,99 @@
+import hashlib
+import json
+import logging
+import re
+
+from typing import Callable, Dict, List, Optional
+from langchain.schema import Document
+from prometheus_client import Counter
+from redis import Redis
+
+
+logger = logging.getLogger(__name__)
+
+RETRIEVAL_CACHE_REQUESTS = Counter(
+    "retrieval_cache_requests_total",
+    "Similarity searches looked up in the retrieval cache",
+    ["result"],
+)
+
+
+def normalize_query(query: str) -> str:
+    return re.sub(r"\s+", " ", query.lower()).strip(" ?!.")
+
+
+class RetrievalCache:
+    """Similarity search results per (user, subject, file filter, normalized query, k).
+
+    Every entry records the subject's version, a Redis counter bumped by
+    `invalidate` whenever its files change. The version and the entry are
+    read in one MGET and entries from an older version count as misses, so
+    a repeat question costs one Redis round trip instead of an embedding
+    request and a Firestore search. Entries also expire after `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        redis_: Optional[Redis],
+        ttl: int = 5 * 60,
+        prefix: str = "retrieval",
+        enabled: bool = True,
+    ) -> None:
+        self.redis = redis_
+        self.ttl = ttl
+        self.prefix = prefix
+        self.enabled = enabled and redis_ is not None
+
+    def _version_key(self, user_id: str, collection_name: str) -> str:
+        return f"{self.prefix}:version:{user_id}:{collection_name}"
+
+    def _key(self, namespace: str, query: str, k: int, metadata: Dict[str, str]) -> str:
+        filters = json.dumps(metadata, sort_keys=True, default=str)
+        digest = hashlib.sha256(f"{normalize_query(query)}\0{k}\0{filters}".encode()).hexdigest()
+        return f"{self.prefix}:{namespace}:{metadata['user']}:{metadata['collection']}:{digest}"
+
+    def invalidate(self, user_id: str, collection_name: str) -> None:
+        if not self.enabled:
+            return
+        try:
+            self.redis.incr(self._version_key(user_id, collection_name))
+        except Exception as e:
+            logger.error(f"Failed to bump retrieval cache version: {e}")
+
+    def get_or_search(
+        self,
+        namespace: str,
+        query: str,
+        k: int,
+        metadata: Dict[str, str],
+        search: Callable[[], List[Document]],
+    ) -> List[Document]:
+        """Cached results of `search`, only subjects (user and collection set) are cached."""
+        if not self.enabled or not metadata.get("user") or not metadata.get("collection"):
+            return search()
+
+        key = self._key(namespace, query, k, metadata)
+        version = None
+        try:
+            version, cached = self.redis.mget([self._version_key(metadata["user"], metadata["collection"]), key])
+            version = int(version or 0)
+            if cached is not None:
+                entry = json.loads(cached)
+                if entry["version"] == version:
+                    RETRIEVAL_CACHE_REQUESTS.labels(result="hit").inc()
+                    return [Document(**doc) for doc in entry["documents"]]
+        except Exception as e:
+            logger.error(f"Retrieval cache lookup failed: {e}")
+
+        RETRIEVAL_CACHE_REQUESTS.labels(result="miss").inc()
+        documents = search()
+        if version is not None:
+            try:
+                entry = {
+                    "version": version,
+                    "documents": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents],
+                }
+                self.redis.set(key, json.dumps(entry, default=str), ex=self.ttl)
+            except Exception as e:
+                logger.error(f"Retrieval cache update failed: {e}")
+        return documents
@@ -0,0 +1,289 @@
+import logging
+import hashlib
+import re
+import threading
+import time
+import numpy as np
+
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import (
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Tuple
+)
+from langchain.embeddings.base import Embeddings
+from langchain.schema.cache import RETURN_VAL_TYPE, BaseCache
+from prometheus_client import Counter, Histogram
+
+
+logger = logging.getLogger(__name__)
+
+_current_feature: ContextVar[Optional[str]] = ContextVar("semantic_cache_feature", default=None)
+
+SEMANTIC_CACHE_REQUESTS = Counter(
+    "llm_semantic_cache_requests_total",
+    "LLM cache lookups by tier and result",
+    ["feature", "tier", "result"],
+)
+SEMANTIC_CACHE_LOOKUP_SECONDS = Histogram(
+    "llm_semantic_cache_lookup_seconds",
+    "Time spent looking up the semantic cache (including the query embedding)",
+    ["feature"],
+)
+SEMANTIC_CACHE_EVICTIONS = Counter(
+    "llm_semantic_cache_evictions_total",
+    "Semantic cache entries evicted",
+    ["reason"],
+)
+
+
+def _hash(_input: str) -> str:
+    return hashlib.md5(_input.encode()).hexdigest()
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace and case so trivially different prompts embed the same."""
+    return re.sub(r"\s+", " ", prompt).strip().lower()
+
+
+@dataclass
+class _Entry:
+    key: str
+    llm_string: str
+    vector: np.ndarray
+    generations: RETURN_VAL_TYPE
+    created_at: float
+    size: int
+    # Hash of the middle of a long prompt, which is left out of the embedding
+    omitted: Optional[str] = None
+
+
+@dataclass
+class _Index:
+    keys: list = field(default_factory=list)
+    matrix: Optional[np.ndarray] = None
+
+
+class SemanticCache(BaseCache):
+    """Second tier LLM cache that matches prompts by embedding similarity.
+
+    Exact matches are still served by the wrapped cache. Only features that
+    opted in (see `feature_scope`) use the semantic tier, everything else
+    behaves exactly like the wrapped cache. Prompts longer than
+    `max_prompt_chars` are embedded from both ends and only match prompts
+    with exactly the same middle.
+    """
+
+    def __init__(
+        self,
+        exact_cache: Optional[BaseCache],
+        embeddings: Embeddings,
+        *,
+        features: Iterable[str] = (),
+        threshold: float = 0.97,
+        ttl: Optional[int] = 24 * 60 * 60,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_prompt_chars: int = 6000,
+        enabled: bool = True,
+    ) -> None:
+        self.exact_cache = exact_cache
+        self.embeddings = embeddings
+        self.features = {feature.upper() for feature in features}
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_prompt_chars = max_prompt_chars
+        self.enabled = enabled
+
+        self._lock = threading.RLock()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._indexes: Dict[str, _Index] = {}
+        self._pending_vectors: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "lookup_seconds": 0.0}
+
+    @staticmethod
+    def current_feature() -> Optional[str]:
+        return _current_feature.get()
+
+    @contextmanager
+    def feature_scope(self, feature: Optional[str]) -> Iterator[None]:
+        token = _current_feature.set(feature.upper() if feature else None)
+        try:
+            yield
+        finally:
+            _current_feature.reset(token)
+
+    def _semantic_enabled(self, feature: Optional[str]) -> bool:
+        return self.enabled and feature is not None and feature in self.features
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return _hash(prompt + llm_string)
+
+    def _text_for_embedding(self, prompt: str) -> Tuple[str, Optional[str]]:
+        """The text to embed and, for long prompts, the hash of the part left out."""
+        text = normalize_prompt(prompt)
+        if len(text) <= self.max_prompt_chars:
+            return text, None
+        # Keep both ends, the variable part of most prompts (the data) sits at the end.
+        half = self.max_prompt_chars // 2
+        return text[:half] + " ... " + text[-half:], _hash(text[half:-half])
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remember_vector(self, key: str, vector: np.ndarray) -> None:
+        self._pending_vectors[key] = vector
+        while len(self._pending_vectors) > 256:
+            self._pending_vectors.popitem(last=False)
+
+    def _is_expired(self, entry: _Entry, now: float) -> bool:
+        return bool(self.ttl) and now - entry.created_at > self.ttl
+
+    def _remove(self, key: str, reason: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._bytes -= entry.size
+        index = self._indexes.get(entry.llm_string)
+        if index is not None:
+            index.keys.remove(key)
+            index.matrix = None
+            if not index.keys:
+                del self._indexes[entry.llm_string]
+        SEMANTIC_CACHE_EVICTIONS.labels(reason=reason).inc()
+
+    def _evict(self) -> None:
+        now = time.time()
+        for key in [k for k, entry in self._entries.items() if self._is_expired(entry, now)]:
+            self._remove(key, "ttl")
+        while self._bytes > self.max_bytes and self._entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key, "memory")
+
+    def _search(self, llm_string: str, vector: np.ndarray, omitted: Optional[str]) -> Tuple[Optional[_Entry], float]:
+        """The most similar entry with the same omitted middle, or the first one below the threshold."""
+        with self._lock:
+            index = self._indexes.get(llm_string)
+            if not index or not index.keys:
+                return None, 0.0
+            if index.matrix is None:
+                index.matrix = np.stack([self._entries[key].vector for key in index.keys])
+            scores = index.matrix @ vector
+            for best in np.argsort(-scores):
+                entry = self._entries[index.keys[best]]
+                if entry.omitted == omitted or scores[best] < self.threshold:
+                    break
+            else:
+                return None, 0.0
+            if self._is_expired(entry, time.time()):
+                self._remove(entry.key, "ttl")
+                return None, 0.0
+            self._entries.move_to_end(entry.key)
+            return entry, float(scores[best])
+
+    def _record(self, feature: Optional[str], tier: str, result: str) -> None:
+        SEMANTIC_CACHE_REQUESTS.labels(feature=feature or "NONE", tier=tier, result=result).inc()
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        feature = self.current_feature()
+        if self.exact_cache is not None:
+            if generations := self.exact_cache.lookup(prompt, llm_string):
+                self._stats["exact_hits"] += 1
+                self._record(feature, "exact", "hit")
+                return generations
+
+        if not self._semantic_enabled(feature):
+            self._record(feature, "exact", "miss")
+            return None
+
+        start = time.perf_counter()
+        text, omitted = self._text_for_embedding(prompt)
+        try:
+            vector = self._embed(text)
+        except Exception as e:
+            logger.error(f"Failed to embed prompt for semantic cache: {e}")
+            self._record(feature, "semantic", "error")
+            return None
+
+        key = self._key(prompt, llm_string)
+        with self._lock:
+            self._remember_vector(key, vector)
+        entry, score = self._search(llm_string, vector, omitted)
+        elapsed = time.perf_counter() - start
+        SEMANTIC_CACHE_LOOKUP_SECONDS.labels(feature=feature).observe(elapsed)
+        self._stats["lookup_seconds"] += elapsed
+
+        if entry is not None and score >= self.threshold:
+            logger.info(f"Semantic cache hit for {feature} (score={score:.4f})")
+            self._stats["semantic_hits"] += 1
+            self._record(feature, "semantic", "hit")
+            return entry.generations
+
+        self._stats["misses"] += 1
+        self._record(feature, "semantic", "miss")
+        return None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        if self.exact_cache is not None:
+            self.exact_cache.update(prompt, llm_string, return_val)
+
+        if not self._semantic_enabled(self.current_feature()):
+            return
+        if not any(gen.text for gen in return_val):
+            return
+
+        key = self._key(prompt, llm_string)
+        text, omitted = self._text_for_embedding(prompt)
+        with self._lock:
+            vector = self._pending_vectors.pop(key, None)
+        if vector is None:
+            try:
+                vector = self._embed(text)
+            except Exception as e:
+                logger.error(f"Failed to embed prompt for semantic cache: {e}")
+                return
+
+        size = vector.nbytes + sum(len(gen.text) for gen in return_val)
+        with self._lock:
+            self._remove(key, "replaced")
+            self._entries[key] = _Entry(
+                key=key,
+                llm_string=llm_string,
+                vector=vector,
+                generations=return_val,
+                created_at=time.time(),
+                size=size,
+                omitted=omitted,
+            )
+            index = self._indexes.setdefault(llm_string, _Index())
+            index.keys.append(key)
+            index.matrix = None
+            self._bytes += size
+            self._evict()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                **self._stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "indexes": len(self._indexes),
+            }
+
+    def clear(self, **kwargs: Any) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._indexes.clear()
+            self._pending_vectors.clear()
+            self._bytes = 0
+        if self.exact_cache is not None:
+            self.exact_cache.clear(**kwargs)
@@ -0,0 +1,466 @@
+import asyncio
+import contextlib
+import logging
+import hashlib
+import threading
+import time
+import uuid
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple, TypeVar
+from langchain.schema.cache import RETURN_VAL_TYPE, BaseCache
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.tracers.context import register_configure_hook
+from prometheus_client import Counter
+from redis import Redis
+from redis.asyncio import Redis as AsyncRedis
+from .feature_metrics import record_cache_lookup
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+
+class _Lease(NamedTuple):
+    cache: "SingleFlightCache"
+    key: str
+    token: str
+    prompt: str
+    llm_string: str
+
+
+# Locks taken by the lookups of the current context, as (key, token)
+_leases: ContextVar[Tuple[Tuple[str, str], ...]] = ContextVar("single_flight_leases", default=())
+# Locks taken by the lookups of a call with fallbacks, shared by all its models
+_group: ContextVar[Optional[List[_Lease]]] = ContextVar("single_flight_group", default=None)
+
+SINGLE_FLIGHT_CALLS = Counter(
+    "llm_single_flight_calls_total",
+    "Identical in-flight generations by role",
+    ["kind", "role"],
+)
+
+_RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+END_MARKER = "e"
+ABORT_MARKER = "a"
+
+# Set in the generation info of answers served from the cache
+CACHED_KEY = "from_llm_cache"
+
+
+def _hash(_input: str) -> str:
+    return hashlib.md5(_input.encode()).hexdigest()
+
+
+def make_key(*parts: Any) -> str:
+    return _hash("\x1f".join(str(part) for part in parts))
+
+
+def _mark_cached(generations: RETURN_VAL_TYPE) -> RETURN_VAL_TYPE:
+    return [
+        generation.copy(update={"generation_info": {**(generation.generation_info or {}), CACHED_KEY: True}})
+        for generation in generations
+    ]
+
+
+def is_cached(response: LLMResult) -> bool:
+    """Whether an LLM run was answered by the LLM cache instead of the provider."""
+    return any(
+        (generation.generation_info or {}).get(CACHED_KEY)
+        for generations in response.generations
+        for generation in generations
+    )
+
+
+class SingleFlight:
+    """Redis lock based coalescing of identical work across workers.
+
+    The first caller for a key becomes the leader and runs the work, others
+    wait for its result. The lock expires after `lock_ttl`, so a stuck or
+    crashed leader is handed over to one of the waiting followers.
+    """
+
+    def __init__(
+        self,
+        redis_: Optional[Redis],
+        async_redis: Optional[AsyncRedis] = None,
+        *,
+        lock_ttl: int = 90,
+        wait_timeout: int = 90,
+        poll_interval: float = 0.1,
+        stream_ttl: int = 120,
+        publish_interval: float = 0.2,
+        prefix: str = "singleflight",
+    ) -> None:
+        self.redis = redis_
+        self.async_redis = async_redis
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        self.stream_ttl = stream_ttl
+        self.publish_interval = publish_interval
+        self.prefix = prefix
+
+    def _lock_key(self, key: str) -> str:
+        return f"{self.prefix}:lock:{key}"
+
+    def _stream_key(self, key: str) -> str:
+        return f"{self.prefix}:stream:{key}"
+
+    def _followers_key(self, key: str) -> str:
+        return f"{self.prefix}:followers:{key}"
+
+    def try_acquire(self, key: str) -> Optional[str]:
+        """Returns a lock token if the caller became the leader."""
+        if self.redis is None:
+            return str(uuid.uuid4())
+        token = str(uuid.uuid4())
+        try:
+            if self.redis.set(self._lock_key(key), token, nx=True, px=self.lock_ttl * 1000):
+                return token
+            return None
+        except Exception as e:
+            logger.error(f"Single flight lock failed, running uncoalesced: {e}")
+            return token
+
+    def release(self, key: str, token: str) -> None:
+        if self.redis is None:
+            return
+        try:
+            self.redis.eval(_RELEASE_SCRIPT, 1, self._lock_key(key), token)
+        except Exception as e:
+            logger.error(f"Failed to release single flight lock: {e}")
+
+    def is_locked(self, key: str) -> bool:
+        if self.redis is None:
+            return False
+        try:
+            return bool(self.redis.exists(self._lock_key(key)))
+        except Exception:
+            return False
+
+    def wait_for(self, key: str, fetch: Callable[[], Optional[T]], kind: str) -> Optional[T]:
+        """Blocks until the leader released the lock, then returns `fetch()`.
+
+        Returns None when the leader produced nothing within `wait_timeout`,
+        the caller should then try to take over.
+        """
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            if not self.is_locked(key):
+                break
+            time.sleep(self.poll_interval)
+        else:
+            SINGLE_FLIGHT_CALLS.labels(kind=kind, role="timeout").inc()
+            return None
+
+        result = fetch()
+        if result is not None:
+            SINGLE_FLIGHT_CALLS.labels(kind=kind, role="coalesced").inc()
+        return result
+
+    async def _axadd(self, key: str, *values: str) -> None:
+        if self.async_redis is None:
+            return
+        stream_key = self._stream_key(key)
+        try:
+            async with self.async_redis.pipeline(transaction=False) as pipe:
+                for value in values:
+                    pipe.xadd(stream_key, {"t": value})
+                pipe.expire(stream_key, self.stream_ttl)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Failed to publish single flight tokens: {e}")
+
+    async def ahas_followers(self, key: str) -> bool:
+        if self.async_redis is None:
+            return False
+        try:
+            return bool(await self.async_redis.exists(self._followers_key(key)))
+        except Exception as e:
+            logger.error(f"Failed to check single flight followers: {e}")
+            return False
+
+    def lead(self, key: str, token: str) -> "StreamLeader":
+        """Starts publishing a stream the caller holds the lock of."""
+        return StreamLeader(self, key, token)
+
+    async def afollow(self, key: str, answers: Optional[List[str]] = None) -> AsyncGenerator[Optional[str], None]:
+        """Yields the leader's streamed chunks from the start.
+
+        Yields None once if the leader aborted or went silent, so the caller can
+        decide whether to take over. The answer the leader reported on
+        completion, if any, is appended to `answers`.
+        """
+        if self.async_redis is None:
+            yield None
+            return
+        stream_key = self._stream_key(key)
+        try:
+            # Leaders only start publishing once they see a follower
+            await self.async_redis.set(self._followers_key(key), 1, ex=self.stream_ttl)
+        except Exception as e:
+            logger.error(f"Failed to follow single flight stream: {e}")
+            yield None
+            return
+        last_id = "0"
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            try:
+                response = await self.async_redis.xread({stream_key: last_id}, block=1000, count=100)
+            except Exception as e:
+                logger.error(f"Failed to read single flight stream: {e}")
+                break
+            if not response:
+                if not await asyncio.to_thread(self.is_locked, key):
+                    break
+                continue
+            for _, entries in response:
+                for entry_id, fields in entries:
+                    last_id = entry_id
+                    data = fields.get(b"t", fields.get("t"))
+                    if isinstance(data, bytes):
+                        data = data.decode()
+                    if data[:1] == END_MARKER:
+                        if answers is not None and len(data) > 1:
+                            answers.append(data[1:])
+                        return
+                    if data == ABORT_MARKER:
+                        yield None
+                        return
+                    deadline = time.monotonic() + self.wait_timeout
+                    yield data[1:]
+        SINGLE_FLIGHT_CALLS.labels(kind="stream", role="timeout").inc()
+        yield None
+
+
+class StreamLeader:
+    """Publishes a leader's stream for its followers.
+
+    Chunks are kept in memory and only written once a follower registered,
+    checked every `publish_interval`, then everything sent since the last
+    write goes out as one entry in one pipelined round trip. `publish`
+    never waits on Redis.
+    """
+
+    def __init__(self, single_flight: SingleFlight, key: str, token: str) -> None:
+        self.single_flight = single_flight
+        self.key = key
+        self.token = token
+        self._pending: List[str] = []
+        self._followed = False
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    def publish(self, chunk: str) -> None:
+        self._pending.append(chunk)
+
+    async def _followed_yet(self) -> bool:
+        if not self._followed:
+            self._followed = await self.single_flight.ahas_followers(self.key)
+        return self._followed
+
+    async def _flush(self, *markers: str) -> None:
+        # Chunks get a one character prefix so they never collide with the markers
+        values = ["c" + "".join(self._pending)] if self._pending else []
+        self._pending = []
+        await self.single_flight._axadd(self.key, *values, *markers)
+
+    async def _run(self) -> None:
+        while True:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._stop.wait(), self.single_flight.publish_interval)
+            if self._stop.is_set():
+                return
+            if self._pending and await self._followed_yet():
+                await self._flush()
+
+    async def afinish(
+        self, completed: bool, answer: Optional[Callable[[], Awaitable[Optional[str]]]] = None
+    ) -> None:
+        """Ends the stream, if followed the awaited `answer` is handed to followers to persist."""
+        self._stop.set()
+        await self._task
+        if await self._followed_yet():
+            if completed:
+                await self._flush(END_MARKER + ((await answer() if answer else None) or ""))
+            else:
+                await self._flush(ABORT_MARKER)
+        await asyncio.to_thread(self.single_flight.release, self.key, self.token)
+
+    def abort(self) -> None:
+        """Releases without telling followers, for when the caller is being cancelled."""
+        self._task.cancel()
+        self.single_flight.release(self.key, self.token)
+
+
+class SingleFlightCache(BaseCache):
+    """LLM cache wrapper that makes identical concurrent generations wait for one leader.
+
+    Keys are computed the same way as `RedisCache`, so followers pick up the
+    leader's answer from the wrapped cache as soon as it is stored. A leader
+    releases the lock when it stores the answer, when its generation ends
+    or fails (a callback hook on every LLM run) and, on async runs, when the
+    generating task finishes or is cancelled.
+
+    Lookups made in a `group()`, a call with fallbacks, keep their locks until
+    one of its models stored an answer for the prompt, which is then stored
+    under the locked keys as well, or until the group ends. Followers of the
+    primary model so get a fallback's or hedge's answer too.
+    """
+
+    def __init__(self, cache: BaseCache, single_flight: SingleFlight, enabled: bool = True) -> None:
+        self.cache = cache
+        self.single_flight = single_flight
+        self.enabled = enabled
+        self._held: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+        if enabled:
+            register_configure_hook(
+                ContextVar(f"single_flight_release_{id(self)}", default=SingleFlightCallback(self)), False
+            )
+
+    @staticmethod
+    @contextmanager
+    def group() -> Iterator[None]:
+        """Shares the locks of the lookups made inside between all models of a call with fallbacks."""
+        if _group.get() is not None:
+            yield
+            return
+        leases: List[_Lease] = []
+        token = _group.set(leases)
+        try:
+            yield
+        finally:
+            _group.reset(token)
+            for lease in list(leases):
+                lease.cache._release(lease.key, lease.token)
+
+    def _hold(self, key: str, token: str, prompt: str, llm_string: str) -> bool:
+        """Returns whether the lease went to the current group."""
+        now = time.monotonic()
+        with self._lock:
+            # Leases of lookups whose caller went away before getting them, their lock already expired in Redis
+            for stale in [t for t, (_, at) in self._held.items() if now - at > self.single_flight.lock_ttl]:
+                del self._held[stale]
+            self._held[token] = (key, now)
+            if (group := _group.get()) is not None:
+                group.append(_Lease(self, key, token, prompt, llm_string))
+                return True
+        _leases.set((*_leases.get(), (key, token)))
+        return False
+
+    def _release(self, key: str, token: str) -> None:
+        with self._lock:
+            if self._held.pop(token, None) is None:
+                return
+        self.single_flight.release(key, token)
+
+    def release_leases(self, key: Optional[str] = None) -> None:
+        """Releases the locks taken by lookups of the current context, or only the one of `key`."""
+        leases = _leases.get()
+        if not leases:
+            return
+        _leases.set(tuple(lease for lease in leases if key is not None and lease[0] != key))
+        for lease_key, token in leases:
+            if key is None or lease_key == key:
+                self._release(lease_key, token)
+
+    def _key(self, prompt: str, llm_string: str) -> str:
+        return _hash(prompt + llm_string)
+
+    def lookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        generations, lease = self._lookup(prompt, llm_string)
+        record_cache_lookup(bool(generations))
+        if lease:
+            self._hold(*lease, prompt, llm_string)
+        return _mark_cached(generations) if generations else generations
+
+    async def alookup(self, prompt: str, llm_string: str) -> Optional[RETURN_VAL_TYPE]:
+        generations, lease = await asyncio.to_thread(self._lookup, prompt, llm_string)
+        record_cache_lookup(bool(generations))
+        # LangChain generates in a task of its own, it ends on success, failure and cancellation alike
+        if lease and not self._hold(*lease, prompt, llm_string):
+            if task := asyncio.current_task():
+                task.add_done_callback(
+                    lambda done: done.get_loop().run_in_executor(None, self._release, *lease)
+                )
+        return _mark_cached(generations) if generations else generations
+
+    def _lookup(self, prompt: str, llm_string: str) -> Tuple[Optional[RETURN_VAL_TYPE], Optional[Tuple[str, str]]]:
+        if generations := self.cache.lookup(prompt, llm_string):
+            return generations, None
+        if not self.enabled:
+            return None, None
+
+        key = self._key(prompt, llm_string)
+        for _ in range(2):
+            if token := self.single_flight.try_acquire(key):
+                SINGLE_FLIGHT_CALLS.labels(kind="llm", role="leader").inc()
+                return None, (key, token)
+
+            if generations := self.single_flight.wait_for(
+                key, lambda: self.cache.lookup(prompt, llm_string), kind="llm"
+            ):
+                return generations, None
+            # The leader failed or timed out, try to take over once
+            SINGLE_FLIGHT_CALLS.labels(kind="llm", role="handover").inc()
+
+        return None, None
+
+    def update(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        try:
+            self.cache.update(prompt, llm_string, return_val)
+        finally:
+            self.release_leases(self._key(prompt, llm_string))
+            self._answer_group(prompt, llm_string, return_val)
+
+    def _answer_group(self, prompt: str, llm_string: str, return_val: RETURN_VAL_TYPE) -> None:
+        """Stores an answer under the keys the current group locked for the prompt and releases them."""
+        if not (group := _group.get()):
+            return
+        with self._lock:
+            answered = [lease for lease in group if lease.prompt == prompt]
+            for lease in answered:
+                group.remove(lease)
+        for lease in answered:
+            try:
+                if lease.llm_string != llm_string:
+                    lease.cache.cache.update(prompt, lease.llm_string, return_val)
+            except Exception as e:
+                logger.error(f"Failed to share a fallback answer with single flight followers: {e}")
+            finally:
+                lease.cache._release(lease.key, lease.token)
+
+    def clear(self, **kwargs: Any) -> None:
+        self.cache.clear(**kwargs)
+
+
+class SingleFlightCallback(BaseCallbackHandler):
+    """Releases the leases of a sync generation once it ended or failed.
+
+    Sync runs look up, generate and report in the same context, async
+    leases are released by their task. Grouped leases are left to the
+    group, a fallback may still answer for them.
+    """
+
+    run_inline = True
+
+    def __init__(self, cache: SingleFlightCache) -> None:
+        self.cache = cache
+
+    def on_llm_end(self, response: LLMResult, **kwargs: Any) -> None:
+        self.cache.release_leases()
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        self.cache.release_leases()
@@ -0,0 +1,235 @@
+import asyncio
+import contextlib
+import logging
+
+from contextvars import ContextVar
+from typing import AsyncGenerator, Awaitable, Callable, List, Optional
+from prometheus_client import Counter, Gauge
+from .single_flight import SINGLE_FLIGHT_CALLS, SingleFlight
+from .rate_limiter import INTERACTIVE, priority_scope
+
+
+ACTIVE_STREAMS = Gauge("llm_active_streams", "Streaming responses currently open")
+STREAMS_FINISHED = Counter(
+    "llm_streams_finished_total",
+    "Streaming responses by how they ended",
+    ["name", "reason"],
+)
+
+
+def split_into_chunks(text: str, chunk_size: int) -> list[str]:
+    return [text[i : i + chunk_size] for i in range(0, len(text), chunk_size)]
+
+
+class StreamChannel:
+    """Bounded token channel between a producer coroutine and the HTTP response.
+
+    `send(None)` marks the end of the stream, mirroring the `callback(None)`
+    convention used by the synchronous callbacks.
+    """
+
+    def __init__(self, max_buffer: int = 64, replay_chunk_size: int = 8, replay_delay: float = 0.0) -> None:
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffer)
+        self.replay_chunk_size = replay_chunk_size
+        self.replay_delay = replay_delay
+        self.closed = False
+
+    async def send(self, data: Optional[str]) -> None:
+        if self.closed:
+            return
+        if data is None:
+            self.closed = True
+        await self.queue.put(data)
+
+    async def replay(self, text: str) -> None:
+        """Streams an already complete answer (cache hit, error message) in chunks."""
+        for chunk in split_into_chunks(text, self.replay_chunk_size):
+            await self.send(chunk)
+            if self.replay_delay:
+                await asyncio.sleep(self.replay_delay)
+
+    async def close(self) -> None:
+        await self.send(None)
+
+    def close_nowait(self) -> None:
+        if self.closed:
+            return
+        self.closed = True
+        with contextlib.suppress(asyncio.QueueFull):
+            self.queue.put_nowait(None)
+
+
+Producer = Callable[[StreamChannel], Awaitable[None]]
+
+_TIMED_OUT = object()
+
+# Answers reported by the current producer
+_answers: ContextVar[Optional[List[str]]] = ContextVar("stream_answers", default=None)
+
+
+def report_answer(answer: str) -> None:
+    """Called with the answer a producer persisted, followers of a coalesced stream persist it too."""
+    if (answers := _answers.get()) is not None:
+        answers.append(answer)
+
+
+class _Answer:
+    """The answers a producer reported, they may come after it closed its channel."""
+
+    def __init__(self) -> None:
+        self.values: List[str] = []
+        self.task: Optional[asyncio.Task] = None
+
+    async def wait(self, timeout: float = 10) -> Optional[str]:
+        if self.task is not None and not self.task.done():
+            await asyncio.wait({self.task}, timeout=timeout)
+        return self.values[-1] if self.values else None
+
+
+class StreamingEngine:
+    def __init__(
+        self,
+        max_buffer: int = 64,
+        idle_timeout: float = 60,
+        replay_chunk_size: int = 8,
+        replay_delay: float = 0.0,
+        single_flight: Optional[SingleFlight] = None,
+    ) -> None:
+        self.max_buffer = max_buffer
+        self.idle_timeout = idle_timeout
+        self.replay_chunk_size = replay_chunk_size
+        self.replay_delay = replay_delay
+        self.single_flight = single_flight
+
+    def make_channel(self) -> StreamChannel:
+        return StreamChannel(self.max_buffer, self.replay_chunk_size, self.replay_delay)
+
+    async def _run(
+        self, producer: Producer, channel: StreamChannel, name: str, error_message: str, answer: _Answer
+    ) -> None:
+        _answers.set(answer.values)
+        try:
+            # Streams are someone waiting on an answer, they go before background jobs
+            with priority_scope(INTERACTIVE):
+                await producer(channel)
+        except asyncio.CancelledError:
+            channel.close_nowait()
+            raise
+        except Exception as e:
+            logging.error(f"Error running {name}: {e}")
+            await channel.replay(error_message)
+        await channel.close()
+
+    async def _produce(
+        self, producer: Producer, name: str, error_message: str, answer: _Answer
+    ) -> AsyncGenerator[object, None]:
+        """Yields the producer's chunks, then None on completion or `_TIMED_OUT`."""
+        channel = self.make_channel()
+        task = answer.task = asyncio.create_task(self._run(producer, channel, name, error_message, answer))
+        completed = False
+        try:
+            while True:
+                try:
+                    data = await asyncio.wait_for(channel.queue.get(), timeout=self.idle_timeout)
+                except asyncio.TimeoutError:
+                    yield _TIMED_OUT
+                    break
+                if data is None:
+                    completed = True
+                    yield None
+                    break
+                yield data
+        finally:
+            # After a normal end the producer may still be persisting the answer.
+            if not task.done() and not completed:
+                logging.info(f"Cancelling {name}, stream ended early")
+                task.cancel()
+
+    def stream(
+        self,
+        producer: Producer,
+        name: str = "stream",
+        start_token: Optional[str] = None,
+        end_token: Optional[str] = None,
+        timeout_token: str = "[TIMEOUT]",
+        error_message: str = "Error in getting response",
+        coalesce_key: Optional[str] = None,
+        on_coalesced: Optional[Callable[[str], None]] = None,
+    ) -> AsyncGenerator[str, None]:
+        """Runs `producer` on the event loop and yields whatever it sends.
+
+        The producer only starts once the response starts iterating. If the
+        client goes away, Starlette stops iterating and the producer task is
+        cancelled, which aborts the upstream model request.
+
+        With a `coalesce_key`, identical concurrent requests share one producer:
+        the leader publishes its chunks and followers stream them from Redis.
+        Keys shared across users need `on_coalesced`, which followers call with
+        the answer the leader's producer passed to `report_answer`.
+        """
+
+        async def generator() -> AsyncGenerator[str, None]:
+            ACTIVE_STREAMS.inc()
+            reason = "disconnected"
+            leader = None
+            answer = _Answer()
+            coalesced_answers: List[str] = []
+            try:
+                if start_token:
+                    yield start_token
+
+                if coalesce_key and self.single_flight is not None:
+                    token = await asyncio.to_thread(self.single_flight.try_acquire, coalesce_key)
+                    if token is None:
+                        emitted = False
+                        async for data in self.single_flight.afollow(coalesce_key, coalesced_answers):
+                            if data is None:
+                                break
+                            emitted = True
+                            yield data
+                        else:
+                            SINGLE_FLIGHT_CALLS.labels(kind="stream", role="coalesced").inc()
+                            reason = "completed"
+                            if on_coalesced is not None and coalesced_answers:
+                                try:
+                                    await asyncio.to_thread(on_coalesced, coalesced_answers[-1])
+                                except Exception as e:
+                                    logging.error(f"Error persisting coalesced {name}: {e}")
+                            if end_token:
+                                yield end_token
+                            return
+                        if emitted:
+                            # Part of the answer was already sent, restarting would duplicate it
+                            reason = "error"
+                            yield error_message
+                            return
+                        SINGLE_FLIGHT_CALLS.labels(kind="stream", role="handover").inc()
+                        token = await asyncio.to_thread(self.single_flight.try_acquire, coalesce_key)
+                    if token is not None:
+                        SINGLE_FLIGHT_CALLS.labels(kind="stream", role="leader").inc()
+                        leader = self.single_flight.lead(coalesce_key, token)
+
+                async for data in self._produce(producer, name, error_message, answer):
+                    if data is None:
+                        reason = "completed"
+                        if end_token:
+                            yield end_token
+                        break
+                    if data is _TIMED_OUT:
+                        reason = "timeout"
+                        yield timeout_token
+                        break
+                    if leader is not None:
+                        leader.publish(data)
+                    yield data
+            finally:
+                ACTIVE_STREAMS.dec()
+                STREAMS_FINISHED.labels(name=name, reason=reason).inc()
+                if leader is not None:
+                    try:
+                        await leader.afinish(reason == "completed", answer.wait)
+                    except asyncio.CancelledError:
+                        leader.abort()
+                        raise
+
+        return generator()
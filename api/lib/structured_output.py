@@ -0,0 +1,282 @@
+import json
+import logging
+import re
+
+from typing import Any, Dict, Generic, List, Optional, Sequence, Tuple, Type, TypeVar
+from langchain.output_parsers import OutputFixingParser, PydanticOutputParser
+from langchain.schema import BaseOutputParser, OutputParserException
+from langchain_core.messages import BaseMessage, SystemMessage
+from langchain_core.runnables import RunnableBinding
+from langchain_core.runnables.fallbacks import RunnableWithFallbacks
+from langchain_openai.chat_models.base import BaseChatOpenAI
+from prometheus_client import Counter
+
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+STRUCTURED_OUTPUT = Counter(
+    "llm_structured_output_total",
+    "Structured answers by how they were parsed (repaired ones saved a model call)",
+    ["schema", "outcome"],
+)
+
+_STRING = re.compile(r'"(?:\\.|[^"\\])*"', re.S)
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.S)
+_PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def _scan(text: str) -> Tuple[Optional[int], bool, List[str], List[Tuple[int, Tuple[str, ...]]]]:
+    """Finds where the first JSON value ends.
+
+    Returns the end index (None if truncated), whether it stopped inside a
+    string, the closers still open and the structural commas seen on the way.
+    """
+    stack: List[str] = []
+    commas: List[Tuple[int, Tuple[str, ...]]] = []
+    in_string = escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if stack and stack[-1] == char:
+                stack.pop()
+            if not stack:
+                return i + 1, False, [], commas
+        elif char == "," and stack:
+            commas.append((i, tuple(stack)))
+    return None, in_string, stack, commas
+
+
+def _clean(text: str) -> str:
+    """Drops trailing commas and maps Python literals, leaving string contents alone."""
+    cleaned, last = [], 0
+    for match in [*_STRING.finditer(text), None]:
+        code = text[last : match.start()] if match else text[last:]
+        code = re.sub(r"\b(True|False|None)\b", lambda m: _PYTHON_LITERALS[m.group(1)], code)
+        cleaned.append(re.sub(r",(\s*[}\]])", r"\1", code))
+        if match:
+            cleaned.append(match.group(0))
+            last = match.end()
+    return "".join(cleaned)
+
+
+def _loads(text: str) -> Any:
+    return json.loads(_clean(text), strict=False)
+
+
+def load_json(text: str) -> Any:
+    """Parses JSON out of a model answer, fixing the usual faults.
+
+    Handles code fences and chatter around the JSON, trailing commas, Python
+    literals and answers cut off mid array or object (the incomplete last
+    element is dropped).
+    """
+    text = text.strip()
+    if (fenced := _FENCE.search(text)) and fenced.group(1).strip():
+        text = fenced.group(1).strip()
+    starts = [i for i in (text.find("{"), text.find("[")) if i != -1]
+    if not starts:
+        return json.loads(text)
+    text = text[min(starts) :]
+
+    end, in_string, stack, commas = _scan(text)
+    if end is not None:
+        return _loads(text[:end])
+
+    # Prefer dropping the element that was cut off over keeping half of it
+    attempts = [(text[:position], list(open_)) for position, open_ in reversed(commas)]
+    attempts.append((text + ('"' if in_string else ""), stack))
+    for prefix, open_ in attempts:
+        candidate = prefix.rstrip().rstrip(",")
+        if candidate.endswith(":"):
+            candidate += " null"
+        try:
+            return _loads(candidate + "".join(reversed(open_)))
+        except json.JSONDecodeError:
+            continue
+    raise json.JSONDecodeError("Could not repair truncated JSON", text, len(text))
+
+
+def _json_schema(schema: Type[Any]) -> Dict[str, Any]:
+    if hasattr(schema, "model_json_schema"):
+        return schema.model_json_schema()
+    return schema.schema()
+
+
+def _validate(schema: Type[T], data: Any) -> T:
+    if hasattr(schema, "model_validate"):
+        return schema.model_validate(data)
+    return schema.parse_obj(data)
+
+
+def _resolve(node: Dict[str, Any], definitions: Dict[str, Any]) -> Dict[str, Any]:
+    while "$ref" in node:
+        node = definitions.get(node["$ref"].split("/")[-1], {})
+    if len(node.get("allOf", [])) == 1:
+        return _resolve(node["allOf"][0], definitions)
+    return node
+
+
+def coerce_enums(data: Any, node: Dict[str, Any], definitions: Dict[str, Any]) -> Any:
+    """Matches enum and literal values case insensitively, e.g. "mcq" to "MCQ"."""
+    node = _resolve(node, definitions)
+    choices = node.get("enum") or ([node["const"]] if "const" in node else None)
+    if choices and isinstance(data, str) and data not in choices:
+        normalized = data.strip().lower().replace(" ", "_")
+        for choice in choices:
+            if isinstance(choice, str) and choice.lower().replace(" ", "_") == normalized:
+                return choice
+        return data
+    for option in node.get("anyOf", []):
+        coerced = coerce_enums(data, option, definitions)
+        if coerced is not data:
+            return coerced
+    if isinstance(data, dict):
+        properties = node.get("properties", {})
+        return {key: coerce_enums(value, properties.get(key, {}), definitions) for key, value in data.items()}
+    if isinstance(data, list):
+        items = node.get("items", {})
+        return [coerce_enums(value, items, definitions) for value in data]
+    return data
+
+
+def _drop_invalid_tail(data: Any, error: Exception) -> bool:
+    """Removes the last item of a list if validation failed on it, as cut off answers do."""
+    try:
+        errors = error.errors()
+    except Exception:
+        return False
+    for detail in errors:
+        loc = list(detail.get("loc", ()))
+        for depth in range(len(loc) - 1, -1, -1):
+            if not isinstance(loc[depth], int):
+                continue
+            container = data
+            try:
+                for key in loc[:depth]:
+                    container = container[key]
+            except (KeyError, IndexError, TypeError):
+                break
+            if isinstance(container, list) and loc[depth] == len(container) - 1 and len(container) > 1:
+                container.pop()
+                return True
+            break
+    return False
+
+
+def parse_structured(text: str, schema: Type[T]) -> Tuple[T, bool]:
+    """Parses and validates `text` against `schema` without calling a model.
+
+    Returns the object and whether anything had to be repaired.
+    """
+    try:
+        return _validate(schema, json.loads(text)), False
+    except Exception:
+        pass
+
+    data = load_json(text)
+    json_schema = _json_schema(schema)
+    definitions = {**json_schema.get("definitions", {}), **json_schema.get("$defs", {})}
+    data = coerce_enums(data, json_schema, definitions)
+    for _ in range(3):
+        try:
+            return _validate(schema, data), True
+        except Exception as e:
+            if not _drop_invalid_tail(data, e):
+                raise
+    return _validate(schema, data), True
+
+
+class RepairingOutputParser(BaseOutputParser):
+    """Drop in replacement for `OutputFixingParser` that repairs answers locally.
+
+    The model is only asked to fix the answer when local repair failed.
+    """
+
+    pydantic_object: Any
+    llm: Any = None
+
+    @classmethod
+    def from_llm(cls, pydantic_object: Type[Any], llm: Any = None) -> "RepairingOutputParser":
+        return cls(pydantic_object=pydantic_object, llm=llm)
+
+    @property
+    def _schema_name(self) -> str:
+        return self.pydantic_object.__name__
+
+    def parse(self, text: str) -> Any:
+        try:
+            result, repaired = parse_structured(text, self.pydantic_object)
+            STRUCTURED_OUTPUT.labels(schema=self._schema_name, outcome="repaired" if repaired else "clean").inc()
+            return result
+        except Exception as e:
+            if self.llm is None:
+                STRUCTURED_OUTPUT.labels(schema=self._schema_name, outcome="failed").inc()
+                raise OutputParserException(f"Failed to parse {self._schema_name}: {e}", llm_output=text)
+            logger.warning(f"Local repair of {self._schema_name} failed, asking the model: {e}")
+
+        try:
+            result = OutputFixingParser.from_llm(
+                parser=PydanticOutputParser(pydantic_object=self.pydantic_object), llm=self.llm
+            ).parse(text)
+        except Exception:
+            STRUCTURED_OUTPUT.labels(schema=self._schema_name, outcome="failed").inc()
+            raise
+        STRUCTURED_OUTPUT.labels(schema=self._schema_name, outcome="llm_fix").inc()
+        return result
+
+    def get_format_instructions(self) -> str:
+        return PydanticOutputParser(pydantic_object=self.pydantic_object).get_format_instructions()
+
+    @property
+    def _type(self) -> str:
+        return "repairing_output_parser"
+
+
+def with_json_mode(llm: Any) -> Any:
+    """Switches OpenAI models to JSON mode, other models are returned as is.
+
+    JSON mode is used over json_schema since not every deployment supports it,
+    the schema itself is part of the format instructions.
+    """
+    response_format = {"type": "json_object"}
+    if isinstance(llm, RunnableWithFallbacks):
+        return llm.copy(
+            update={
+                "runnable": with_json_mode(llm.runnable),
+                "fallbacks": [with_json_mode(fallback) for fallback in llm.fallbacks],
+            }
+        )
+    if isinstance(llm, RunnableBinding) and isinstance(llm.bound, BaseChatOpenAI):
+        return llm.bind(response_format=response_format)
+    if isinstance(llm, BaseChatOpenAI):
+        return llm.bind(response_format=response_format)
+    return llm
+
+
+class StructuredOutput(Generic[T]):
+    """Replacement for `llm.with_structured_output(schema)` built on JSON mode and local repair."""
+
+    def __init__(self, llm: Any, schema: Type[T]) -> None:
+        self.schema = schema
+        self.llm = with_json_mode(llm)
+        self.parser = RepairingOutputParser.from_llm(schema, llm)
+
+    def invoke(self, messages: Sequence[BaseMessage]) -> T:
+        instructions = SystemMessage(
+            content=f"Return only json.\n{self.parser.get_format_instructions()}"
+        )
+        response = self.llm.invoke([*messages, instructions])
+        return self.parser.parse(response.content)
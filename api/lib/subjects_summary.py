@@ -0,0 +1,78 @@
+import json
+import logging
+
+from typing import Callable, Optional
+from prometheus_client import Counter
+from redis import Redis
+
+
+logger = logging.getLogger(__name__)
+
+SUBJECTS_SUMMARY_REQUESTS = Counter(
+    "subjects_summary_requests_total",
+    "Subjects and files summaries looked up in the cache",
+    ["result"],
+)
+
+
+class SubjectsSummaryCache:
+    """The subjects and files summary the chat agent gets, materialized per user.
+
+    Any change to a user's subjects or files bumps a version counter through
+    `invalidate`, which has the signature of a file change listener. Entries
+    record the version they were built at, the version and the entry are
+    read in one MGET and an entry of an older version is a miss, so a stale
+    summary is never served and a change costs one rebuild on the next read.
+    """
+
+    def __init__(
+        self,
+        redis_: Optional[Redis],
+        ttl: int = 24 * 60 * 60,
+        prefix: str = "subjects_summary",
+        enabled: bool = True,
+    ) -> None:
+        self.redis = redis_
+        self.ttl = ttl
+        self.prefix = prefix
+        self.enabled = enabled and redis_ is not None
+
+    def _version_key(self, user_id: str) -> str:
+        return f"{self.prefix}:version:{user_id}"
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.prefix}:{user_id}"
+
+    def invalidate(self, user_id: str, collection_name: Optional[str] = None) -> None:
+        if not self.enabled:
+            return
+        try:
+            self.redis.incr(self._version_key(user_id))
+        except Exception as e:
+            logger.error(f"Failed to bump subjects summary version: {e}")
+
+    def get_or_build(self, user_id: str, build: Callable[[], str]) -> str:
+        if not self.enabled:
+            return build()
+
+        version = None
+        try:
+            version, cached = self.redis.mget([self._version_key(user_id), self._key(user_id)])
+            version = int(version or 0)
+            if cached is not None:
+                entry = json.loads(cached)
+                if entry["version"] == version:
+                    SUBJECTS_SUMMARY_REQUESTS.labels(result="hit").inc()
+                    return entry["summary"]
+        except Exception as e:
+            logger.error(f"Subjects summary lookup failed: {e}")
+
+        SUBJECTS_SUMMARY_REQUESTS.labels(result="miss").inc()
+        summary = build()
+        if version is not None:
+            try:
+                # Built from data at least as new as `version`, a later change makes it a miss
+                self.redis.set(self._key(user_id), json.dumps({"version": version, "summary": summary}), ex=self.ttl)
+            except Exception as e:
+                logger.error(f"Subjects summary update failed: {e}")
+        return summary
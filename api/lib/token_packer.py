@@ -0,0 +1,115 @@
+import math
+import random
+import re
+
+from collections import Counter
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+from .chunking import count_tokens, get_chunker
+
+STRATEGIES = ("random", "head", "tail", "head_tail", "ranked")
+
+
+@dataclass
+class PackResult:
+    text: str
+    chunk_ids: List[int]  # positions in `TokenBudgetPacker.chunks(text)`, in document order
+    tokens: int
+    total_tokens: int
+    strategy: str
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def lexical_scores(chunks: Sequence[str], query: str) -> List[float]:
+    """BM25 like term overlap of each chunk with the query, no embeddings needed."""
+    terms = set(_words(query))
+    if not terms:
+        return [0.0] * len(chunks)
+    counts = [Counter(word for word in _words(chunk) if word in terms) for chunk in chunks]
+    document_frequency = Counter(term for chunk_counts in counts for term in chunk_counts)
+    idf = {term: math.log((len(chunks) + 1) / (df + 1)) + 1 for term, df in document_frequency.items()}
+    return [sum(idf[term] * tf / (tf + 1.2) for term, tf in chunk_counts.items()) for chunk_counts in counts]
+
+
+class TokenBudgetPacker:
+    """Selects chunks of a text that fit a token budget, in linear time.
+
+    The text is encoded once with the budget's encoding and cut into chunks
+    whose token counts are known from their boundaries, so nothing is
+    tokenized again while packing. Chunks are picked in the order given by
+    the strategy and joined in document order, adjacent chunks without a
+    separator. Random and ranked selections skip chunks that no longer fit,
+    positional ones stop at the first.
+    """
+
+    def __init__(self, chunk_size: int, budget: int, encoding_name: str = "cl100k_base", separator: str = "\n\n") -> None:
+        self.chunk_size = chunk_size
+        self.budget = budget
+        self.separator = separator
+        self.separator_tokens = count_tokens(separator, encoding_name) if separator else 0
+        # No overlap, selected neighbours would repeat text
+        self.chunker = get_chunker(chunk_size, 0, encoding_name)
+
+    def chunks(self, text: str) -> List[Tuple[str, int]]:
+        return self.chunker.split_text_with_counts(text)
+
+    def order(
+        self, chunks: Sequence[str], strategy: str, seed: Optional[int] = None, query: Optional[str] = None
+    ) -> List[int]:
+        ids = list(range(len(chunks)))
+        if strategy == "random":
+            random.Random(seed).shuffle(ids)
+        elif strategy == "tail":
+            ids.reverse()
+        elif strategy == "head_tail":
+            ids = [ids[i // 2] if i % 2 == 0 else ids[-(i // 2) - 1] for i in range(len(ids))]
+        elif strategy == "ranked" and query:
+            scores = lexical_scores(chunks, query)
+            ids.sort(key=lambda i: -scores[i])
+        elif strategy not in STRATEGIES:
+            raise ValueError(f"Unknown packing strategy {strategy}, use one of {STRATEGIES}")
+        return ids
+
+    def join(self, chunks: Sequence[str], chunk_ids: Sequence[int]) -> str:
+        parts, previous = [], None
+        for i in sorted(chunk_ids):
+            if previous is not None and i != previous + 1:
+                parts.append(self.separator)
+            parts.append(chunks[i])
+            previous = i
+        return "".join(parts)
+
+    def select(self, text: str, chunk_ids: Sequence[int]) -> str:
+        """Rebuilds an earlier selection from its chunk ids."""
+        return self.join([chunk for chunk, _ in self.chunks(text)], chunk_ids)
+
+    def pack(
+        self, text: str, strategy: str = "random", seed: Optional[int] = None, query: Optional[str] = None
+    ) -> PackResult:
+        chunks = self.chunks(text)
+        total = sum(count for _, count in chunks)
+        if total <= self.budget:
+            return PackResult(text, list(range(len(chunks))), total, total, strategy)
+
+        texts = [chunk for chunk, _ in chunks]
+        chosen, used = [], 0
+        for i in self.order(texts, strategy, seed, query):
+            # Separators are reserved for every chunk, the final count can only be lower
+            cost = chunks[i][1] + (self.separator_tokens if chosen else 0)
+            if used + cost <= self.budget:
+                chosen.append(i)
+                used += cost
+            elif strategy in ("head", "tail", "head_tail"):
+                # Keep positional selections contiguous
+                break
+        chosen.sort()
+        return PackResult(self.join(texts, chosen), chosen, used, total, strategy)
+
+
+@lru_cache(maxsize=32)
+def get_packer(chunk_size: int, budget: int) -> TokenBudgetPacker:
+    return TokenBudgetPacker(chunk_size, budget)
@@ -0,0 +1,166 @@
+import hashlib
+import logging
+import math
+import re
+import threading
+import numpy as np
+
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+from langchain.embeddings.base import Embeddings
+from langchain_core.tools import BaseTool
+from prometheus_client import Counter as MetricCounter
+
+
+logger = logging.getLogger(__name__)
+
+TOOL_PICKS = MetricCounter(
+    "tool_index_picks_total",
+    "Tool selections by the method that ranked them",
+    ["method"],
+)
+TOOL_QUERY_CACHE = MetricCounter(
+    "tool_index_query_cache_total",
+    "Query vector lookups by result",
+    ["result"],
+)
+
+
+STOPWORDS = frozenset("a an and are as at be by for from i in is it me my of on or the this to use used with you".split())
+
+
+def _terms(text: str) -> List[str]:
+    words = re.findall(r"[a-z0-9]+", text.lower().replace("_", " "))
+    # Crude plural stemming, "presentations" should find "presentation"
+    return [word[:-1] if len(word) > 3 and word.endswith("s") else word for word in words if word not in STOPWORDS]
+
+
+def normalize_query(query: str) -> str:
+    """The query's distinct terms, so rephrasings of the same request share a query vector."""
+    return " ".join(sorted(set(_terms(query))))
+
+
+def keyword_scores(descriptions: Sequence[str], query: str) -> List[float]:
+    terms = set(_terms(query))
+    counts = [Counter(term for term in _terms(description) if term in terms) for description in descriptions]
+    document_frequency = Counter(term for description_counts in counts for term in description_counts)
+    idf = {term: math.log((len(descriptions) + 1) / (df + 1)) + 1 for term, df in document_frequency.items()}
+    return [sum(idf[term] for term in description_counts) for description_counts in counts]
+
+
+class ToolIndex:
+    """Ranks agent tools against a prompt without a vector store.
+
+    Tool descriptions are embedded once, in the background, and kept
+    normalized in memory, so ranking is a NumPy dot product. Query vectors
+    are kept in a small LRU keyed by `normalize_query`, case, punctuation,
+    stopwords, plurals and word order don't make a new entry. A request
+    never waits on the embeddings API: a query that is not cached is ranked
+    by keyword overlap and its normalized form embedded in the background
+    for the next time, unless `max_pending_queries` are already being
+    embedded. Keywords are also used while descriptions are still being
+    embedded and without embeddings.
+    """
+
+    def __init__(
+        self,
+        embeddings: Optional[Embeddings] = None,
+        query_cache_size: int = 2048,
+        max_pending_queries: int = 16,
+    ) -> None:
+        self.embeddings = embeddings
+        self.query_cache_size = query_cache_size
+        self.max_pending_queries = max_pending_queries
+        self._vectors: Dict[str, np.ndarray] = {}
+        self._pending: Dict[str, Future] = {}
+        self._pending_queries: Set[str] = set()
+        self._queries: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="tool-index")
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / max(np.linalg.norm(vector), 1e-12)
+
+    def warm(self, descriptions: Iterable[str]) -> None:
+        """Embeds descriptions not seen before in the background, e.g. at startup."""
+        if self.embeddings is None:
+            return
+        with self._lock:
+            missing = list(
+                {self._key(text): text for text in descriptions if self._key(text) not in self._vectors}.items()
+            )
+            missing = [(key, text) for key, text in missing if key not in self._pending]
+            if not missing:
+                return
+            future = self._pool.submit(self._embed_descriptions, missing)
+            for key, _ in missing:
+                self._pending[key] = future
+
+    def _embed_descriptions(self, missing: List[tuple]) -> None:
+        try:
+            vectors = self.embeddings.embed_documents([text for _, text in missing])
+            with self._lock:
+                for (key, _), vector in zip(missing, vectors):
+                    self._vectors[key] = self._normalize(vector)
+        except Exception as e:
+            logger.error(f"Failed to embed tool descriptions: {e}")
+        finally:
+            with self._lock:
+                for key, _ in missing:
+                    self._pending.pop(key, None)
+
+    def _embed_query(self, query: str) -> None:
+        try:
+            vector = self._normalize(self.embeddings.embed_query(query))
+            with self._lock:
+                self._queries[query] = vector
+                while len(self._queries) > self.query_cache_size:
+                    self._queries.popitem(last=False)
+        except Exception as e:
+            logger.error(f"Failed to embed tool query: {e}")
+        finally:
+            with self._lock:
+                self._pending_queries.discard(query)
+
+    def _query_vector(self, query: str) -> Optional[np.ndarray]:
+        """The cached query vector, if missing it is embedded in the background and None returned."""
+        if not (query := normalize_query(query)):
+            return None
+        with self._lock:
+            if (vector := self._queries.get(query)) is not None:
+                self._queries.move_to_end(query)
+                TOOL_QUERY_CACHE.labels(result="hit").inc()
+                return vector
+            if query in self._pending_queries or len(self._pending_queries) >= self.max_pending_queries:
+                TOOL_QUERY_CACHE.labels(result="pending").inc()
+                return None
+            self._pending_queries.add(query)
+        TOOL_QUERY_CACHE.labels(result="miss").inc()
+        self._pool.submit(self._embed_query, query)
+        return None
+
+    def rank(self, descriptions: Sequence[str], query: str) -> List[float]:
+        if self.embeddings is not None:
+            self.warm(descriptions)
+            with self._lock:
+                vectors = [self._vectors.get(self._key(text)) for text in descriptions]
+            if all(vector is not None for vector in vectors) and (query_vector := self._query_vector(query)) is not None:
+                TOOL_PICKS.labels(method="embeddings").inc()
+                return (np.vstack(vectors) @ query_vector).tolist()
+        TOOL_PICKS.labels(method="keywords").inc()
+        return keyword_scores(descriptions, query)
+
+    def pick(self, tools: List[BaseTool], query: str, k: int = 2) -> List[BaseTool]:
+        """The `k` tools most relevant to `query`, in their original order."""
+        if len(tools) <= k:
+            return list(tools)
+        scores = self.rank([tool.description for tool in tools], query)
+        best = sorted(range(len(tools)), key=lambda i: -scores[i])[:k]
+        return [tool for i, tool in enumerate(tools) if i in best]
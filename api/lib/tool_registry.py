@@ -0,0 +1,75 @@
+import functools
+
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterable, List, Optional, Type
+from langchain.pydantic_v1 import BaseModel
+from langchain_core.tools import BaseTool, StructuredTool
+from .database.cache_manager import CacheProtocol
+
+
+@dataclass(frozen=True)
+class ToolContext:
+    """What a tool needs to know about the request it runs for."""
+
+    user_id: str
+    cache_manager: Optional[CacheProtocol] = None
+    url_template: str = ""
+
+
+class ToolRegistry:
+    """Agent tools built once and bound to a request's context.
+
+    Shared tools hold no per user state, clients included, and are handed
+    out as is. Contextual tools are registered as functions taking a
+    `ToolContext` first, with their schema built at registration. Binding
+    one is a shallow copy of its template with the context partially
+    applied without validation, no schema or client is created per
+    request.
+    """
+
+    def __init__(self) -> None:
+        self._shared: Dict[str, BaseTool] = {}
+        self._templates: Dict[str, StructuredTool] = {}
+        self._funcs: Dict[str, Callable[..., Any]] = {}
+
+    def add_shared(self, tool: BaseTool) -> None:
+        self._check_name(tool.name)
+        self._shared[tool.name] = tool
+
+    def add(
+        self,
+        func: Callable[..., Any],
+        name: str,
+        description: str,
+        args_schema: Type[BaseModel],
+    ) -> None:
+        """Registers `func(context, **tool_args)` as a tool."""
+        self._check_name(name)
+        self._funcs[name] = func
+        self._templates[name] = StructuredTool(
+            name=name, description=description, args_schema=args_schema, func=func
+        )
+
+    def _check_name(self, name: str) -> None:
+        if name in self._shared or name in self._templates:
+            raise ValueError(f"Tool {name} is already registered")
+
+    def templates(self, names: Iterable[str]) -> List[BaseTool]:
+        """Unbound tools, enough to read names, descriptions and schemas."""
+        return [self._shared.get(name) or self._templates[name] for name in names]
+
+    def bind(self, context: ToolContext, names: Iterable[str]) -> List[BaseTool]:
+        tools = []
+        for name in names:
+            if name in self._shared:
+                tools.append(self._shared[name])
+            else:
+                template = self._templates[name]
+                # `copy` would drop fields excluded from serialization, callbacks among them
+                tools.append(
+                    StructuredTool.construct(
+                        template.__fields_set__,
+                        **{**template.__dict__, "func": functools.partial(self._funcs[name], context)},
+                    )
+                )
+        return tools
@@ -0,0 +1,246 @@
+import logging
+import threading
+import time
+import numpy as np
+
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from prometheus_client import Counter, Gauge, Histogram
+from redis import Redis
+
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+
+logger = logging.getLogger(__name__)
+
+VECTOR_INDEX_QUERIES = Counter(
+    "vector_index_queries_total",
+    "Similarity searches by the tier that answered them",
+    ["tier"],
+)
+VECTOR_INDEX_LOAD_SECONDS = Histogram(
+    "vector_index_load_seconds",
+    "Time to load a subject's vectors from Firestore",
+    buckets=(0.1, 0.25, 0.5, 1, 2, 5, 10, 30),
+)
+VECTOR_INDEX_BYTES = Gauge(
+    "vector_index_bytes",
+    "Memory held by local vector indexes",
+)
+
+Key = Tuple[str, str]
+
+
+@dataclass
+class _SubjectIndex:
+    version: int
+    matrix: np.ndarray  # normalized rows, cosine similarity is a dot product
+    documents: List[Document]
+    hnsw: Any = None
+    size: int = 0
+    checked_at: float = field(default_factory=time.monotonic)
+
+    def _matches(self, document: Document, filters: Dict[str, Any]) -> bool:
+        for key, value in filters.items():
+            actual = document.metadata.get(key)
+            if isinstance(value, list) and actual not in value:
+                return False
+            if not isinstance(value, list) and actual != value:
+                return False
+        return True
+
+    def search(self, vector: np.ndarray, k: int, filters: Dict[str, Any]) -> List[Document]:
+        if not self.documents or k <= 0:
+            return []
+        if not filters and self.hnsw is not None:
+            labels, _ = self.hnsw.knn_query(vector, k=min(k, len(self.documents)))
+            return [self.documents[i] for i in labels[0]]
+
+        if filters:
+            rows = np.array([i for i, doc in enumerate(self.documents) if self._matches(doc, filters)], dtype=np.int64)
+            if not rows.size:
+                return []
+            scores = self.matrix[rows] @ vector
+        else:
+            rows = None
+            scores = self.matrix @ vector
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        if rows is not None:
+            top = rows[top]
+        return [self.documents[i] for i in top]
+
+
+class VectorIndexCache:
+    """In process vector indexes per (user, subject) in front of Firestore find_nearest.
+
+    An index is loaded in the background the first time a subject is queried,
+    until then queries go to Firestore. Small subjects are searched brute force
+    with NumPy, larger ones with HNSW when hnswlib is installed. File changes
+    bump a version in Redis so every worker drops its stale copy, and indexes
+    are evicted least recently used first once `max_bytes` is exceeded.
+    """
+
+    def __init__(
+        self,
+        vectorstore,
+        embeddings: Embeddings,
+        redis_: Optional[Redis] = None,
+        max_bytes: int = 512 * 1024 * 1024,
+        hnsw_threshold: int = 5000,
+        max_documents: int = 50_000,
+        version_check_interval: float = 2,
+        prefix: str = "vidx",
+        enabled: bool = True,
+    ) -> None:
+        self.vectorstore = vectorstore
+        self.embeddings = embeddings
+        self.redis = redis_
+        self.max_bytes = max_bytes
+        self.hnsw_threshold = hnsw_threshold
+        self.max_documents = max_documents
+        self.version_check_interval = version_check_interval
+        self.prefix = prefix
+        self.enabled = enabled
+        self._indexes: "OrderedDict[Key, _SubjectIndex]" = OrderedDict()
+        self._loading: Dict[Key, int] = {}
+        self._too_large: Dict[Key, int] = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._loader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="vector-index")
+
+    def _version_key(self, key: Key) -> str:
+        return f"{self.prefix}:version:{key[0]}:{key[1]}"
+
+    def _version(self, key: Key) -> int:
+        if self.redis is None:
+            return 0
+        try:
+            return int(self.redis.get(self._version_key(key)) or 0)
+        except Exception as e:
+            logger.error(f"Failed to read vector index version: {e}")
+            return -1
+
+    def invalidate(self, user_id: str, collection_name: str) -> None:
+        """Drops the index of a subject here and, through Redis, in every other worker."""
+        key = (user_id, collection_name)
+        if self.redis is not None:
+            try:
+                self.redis.incr(self._version_key(key))
+            except Exception as e:
+                logger.error(f"Failed to bump vector index version: {e}")
+        with self._lock:
+            self._drop(key)
+            self._too_large.pop(key, None)
+
+    def _drop(self, key: Key) -> None:
+        if (index := self._indexes.pop(key, None)) is not None:
+            self._bytes -= index.size
+            VECTOR_INDEX_BYTES.set(self._bytes)
+
+    def _fresh(self, key: Key, index: _SubjectIndex) -> bool:
+        now = time.monotonic()
+        if now - index.checked_at < self.version_check_interval:
+            return True
+        version = self._version(key)
+        if version == index.version:
+            index.checked_at = now
+            return True
+        return False
+
+    def _load(self, key: Key, version: int) -> None:
+        start = time.perf_counter()
+        try:
+            store = self.vectorstore
+            query = store.collection.where(f"{store.metadata_field}.user", "==", key[0]).where(
+                f"{store.metadata_field}.collection", "==", key[1]
+            )
+            documents, vectors = [], []
+            for snapshot in query.stream():
+                data = snapshot.to_dict() or {}
+                embedding = data.get(store.embedding_field)
+                if embedding is None:
+                    continue
+                documents.append(
+                    Document(page_content=data.get(store.content_field) or "", metadata=data.get(store.metadata_field) or {})
+                )
+                vectors.append(np.asarray(list(embedding), dtype=np.float32))
+                if len(documents) > self.max_documents:
+                    logger.info(f"Subject {key} has too many chunks for a local index")
+                    with self._lock:
+                        self._too_large[key] = version
+                    return
+            index = self._build(version, documents, np.vstack(vectors) if vectors else np.zeros((0, 1), dtype=np.float32))
+            if self._version(key) != version:
+                # Files changed while loading
+                return
+            with self._lock:
+                self._drop(key)
+                self._indexes[key] = index
+                self._bytes += index.size
+                while self._bytes > self.max_bytes and len(self._indexes) > 1:
+                    self._drop(next(iter(self._indexes)))
+                VECTOR_INDEX_BYTES.set(self._bytes)
+            VECTOR_INDEX_LOAD_SECONDS.observe(time.perf_counter() - start)
+        except Exception as e:
+            logger.error(f"Failed to load vector index for {key}: {e}")
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+
+    def _build(self, version: int, documents: List[Document], matrix: np.ndarray) -> _SubjectIndex:
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.maximum(norms, 1e-12)
+        size = matrix.nbytes + sum(len(doc.page_content) for doc in documents)
+        hnsw = None
+        if hnswlib is not None and len(documents) >= self.hnsw_threshold:
+            hnsw = hnswlib.Index(space="ip", dim=matrix.shape[1])
+            hnsw.init_index(max_elements=len(documents), ef_construction=100, M=16)
+            hnsw.add_items(matrix, np.arange(len(documents)))
+            hnsw.set_ef(64)
+            size += len(documents) * 16 * 2 * 8
+        return _SubjectIndex(version=version, matrix=matrix, documents=documents, hnsw=hnsw, size=size)
+
+    def search(self, query: str, k: int, metadata: Dict[str, Any]) -> Optional[List[Document]]:
+        """Searches the local index, None means the index is cold and Firestore has to answer."""
+        if not self.enabled or not metadata.get("user") or not metadata.get("collection"):
+            return None
+        key = (metadata["user"], metadata["collection"])
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is not None:
+                self._indexes.move_to_end(key)
+
+        if index is not None and not self._fresh(key, index):
+            with self._lock:
+                self._drop(key)
+            index = None
+
+        if index is None:
+            self._schedule(key)
+            VECTOR_INDEX_QUERIES.labels(tier="firestore").inc()
+            return None
+
+        filters = {name: value for name, value in metadata.items() if name not in ("user", "collection")}
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        vector /= max(np.linalg.norm(vector), 1e-12)
+        VECTOR_INDEX_QUERIES.labels(tier="local").inc()
+        return index.search(vector, k, filters)
+
+    def _schedule(self, key: Key) -> None:
+        version = self._version(key)
+        if version < 0:
+            return
+        with self._lock:
+            if key in self._loading or self._too_large.get(key) == version:
+                return
+            self._loading[key] = version
+        self._loader.submit(self._load, key, version)
@@ -11,7 +11,7 @@ from api.dependencies import require_points_for_feature
 from api.lib.assignment_solver import AssignmentSolver
 from api.lib.tools import SearchImage, SearchTool, ScholarlySearchRun, RequestsGetTool, make_uml_diagram, make_vega_graph, make_graphviz_graph
 from fastapi import APIRouter, Response, UploadFile, Depends, HTTPException
-from api.globals import SEARCHX_HOST, get_model_and_fallback, get_model, redis_cache_manager, client, subscription_manager
+from api.globals import SEARCHX_HOST, get_model_and_fallback, get_model, redis_cache_manager, client, subscription_manager, extraction_cache
 from ..auth import get_user_id, verify_play_integrity
 from langchain_community.utilities.searx_search import SearxSearchWrapper
 from langchain_community.utilities.requests import TextRequestsWrapper
@@ -120,7 +120,8 @@ def solve_assignment(
                     seachx_wrapper=SearxSearchWrapper(searx_host=SEARCHX_HOST, unsecure=True, k=3),
                 ),
                 *tools
-            ]
+            ],
+            extraction_cache=extraction_cache,
         )
         _, file_extension = os.path.splitext(file.filename)
         with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
@@ -0,0 +1,448 @@
+import logging
+
+from typing import List, Optional
+from api.config import AGENT_SLOW_TOOL_TIMEOUT, CACHE_DOCUMENT_URL_TEMPLATE, SEARCHX_HOST
+from api.lib.diagram_maker import DiagramMaker
+from api.lib.notes_maker.markdown_maker import MarkdownNotesMaker
+from api.lib.presentation_maker.presentation_maker import PresentationMaker
+from ..lib.tool_registry import ToolContext, ToolRegistry
+from ..lib.tools import (
+    MakePresentationInput,
+    MarkdownToDocConverter,
+    MakeTableTool,
+    RequestsGetTool,
+    SearchImage,
+    SearchTool,
+    make_graphviz_graph,
+    make_notes,
+    make_ppt,
+    make_vega_graph,
+    write_content,
+)
+from ..lib.writer import Writer
+from ..globals import (
+    collection_manager,
+    chat_manager,
+    course_manager,
+    file_manager,
+    get_model,
+    knowledge_manager,
+    notes_db,
+    presentation_db,
+    redis_cache_manager,
+    subscription_manager,
+    template_manager,
+    temp_knowledge_manager,
+)
+from ..dependencies import (
+    can_use_premium_model,
+    deduct_points_for_feature,
+    use_feature_with_premium_model_check,
+)
+from .utils import select_random_chunks, find_most_similar
+from langchain.pydantic_v1 import BaseModel as OldBaseModel
+from langchain.pydantic_v1 import Field as OldField
+from langchain_community.utilities.searx_search import SearxSearchWrapper
+from langchain_community.tools.youtube.search import YouTubeSearchTool
+from langchain_community.utilities.requests import TextRequestsWrapper
+
+
+VEGA_LITE_TOOL_DESCRIPTION = "Used to make graphs using vega lite. Takes in a vega lite spec in json format."
+PRESENTATION_TOOL_DESCRIPTION = "Used to make ppt/powerpoint presentation."
+
+
+class WriterArgs(OldBaseModel):
+    topic: str = OldField(
+        None,
+        description="The Topic to write on"
+    )
+    to_generate: Optional[str] =  OldField(
+        "Essay",
+        description="The content to write. Can be essays, articles or anything"
+    )
+    negative_prompt: Optional[str] = ""
+    minimum_word_count: Optional[int] = 100
+    instructions: Optional[str] = "Be detailed"
+
+
+class MakeNotesArgs(OldBaseModel):
+    instructions: str = OldField("")
+    link: str = OldField("", description="The link to make notes from. Web or youtube link.")
+
+
+class ReadDataArgs(OldBaseModel):
+    query: str = OldField("all", description="What you want to search")
+    subject_name: str = OldField(
+        description="The name of the subject to read data from"
+    )
+    file_name: Optional[str] = OldField(
+        None,
+        description="The name of the file to read from the subject, if it is empty, the whole subject will be read/searched",
+    )
+
+
+class MakePptArgs(OldBaseModel):
+    topic: str = OldField(
+        ..., description="The main subject or title of the presentation."
+    )
+    instructions: str = OldField(
+        ...,
+        description="Specific guidelines or directives for creating the presentation content.",
+    )
+    number_of_pages: int = OldField(
+        ..., description="The desired number of pages/slides in the presentation."
+    )
+    negative_prompt: str = OldField(
+        ...,
+        description="Any themes, topics, or elements that should be avoided in the presentation.",
+    )
+    subject_name: Optional[str] = OldField(
+        None, description="Name of users subject to make ppt from"
+    )
+    files: Optional[List[str]] = OldField(
+        None,
+        description="An optional list of file names from the subject to make ppt from",
+    )
+
+
+class GraphvizArgs(OldBaseModel):
+    dot_code: str
+
+
+class VegaLiteArgs(OldBaseModel):
+    vega_lite_spec: str
+
+
+class FindCoursesArgs(OldBaseModel):
+    query: str
+
+
+class NoArgs(OldBaseModel):
+    pass
+
+
+def read_vector_db(
+    context: ToolContext, subject_name: str, file_name: str = None, query: str = "all", **kwargs
+) -> str:
+    user_id = context.user_id
+    all_subjects = [
+        collection.name
+        for collection in collection_manager.get_all_by_user(user_id=user_id)
+    ]
+    subject_name = find_most_similar(all_subjects, subject_name, 5)
+
+    if not subject_name:
+        return "Subject name is wrong, file name might correct. Maybe list all subjects and files to find out?"
+
+    collection = collection_manager.get_collection_by_name_and_user(
+        subject_name, user_id
+    )
+
+    if collection.number_of_files == 0:
+        return "Subject has no files, but it exists. Ask the user to upload a file. AI can also use its own knowledge to answer. Or create files"
+
+    if file_name:
+        all_file_names = [
+            file.filename
+            for file in file_manager.get_all_files(
+                user_id=user_id, collection_name=subject_name
+            )
+        ]
+        file_name = find_most_similar(all_file_names, file_name, max_distance=5)
+        if not file_name:
+            return "File not found. subject exists tho. Maybe list all subjects and files to find out?"
+
+        metadata = {"file": file_name}
+    else:
+        metadata = {}
+
+    metadata["collection"] = collection.name
+    metadata["user"] = user_id
+    docs = knowledge_manager.query_data(query, k=3, metadata=metadata)
+    # Documents come most relevant first
+    data = select_random_chunks(
+        "\n".join([doc.page_content for doc in docs]), 300, 600, strategy="head"
+    )
+    if not data:
+        logging.info("Using random file data")
+        data = chat_manager.read_file_contents(
+            user_id=user_id,
+            collection_name=collection.name,
+            file_manager=file_manager,
+            length=1000
+        )
+    logging.info(f"Read {data}")
+    return f"""
+File Content:
+=======
+{data}
+======="""
+
+
+def list_user_subjects_files(context: ToolContext, **kwargs) -> str:
+    return collection_manager.get_all_files_for_user_as_string(context.user_id)
+
+
+def make_presentation(
+    context: ToolContext,
+    topic: str,
+    instructions: str = "",
+    number_of_pages: int = 5,
+    negative_prompt: str = "",
+    **kwargs,
+):
+    user_id = context.user_id
+    logging.info(f"{topic}, {instructions}, {number_of_pages}, {negative_prompt}")
+    try:
+        model_name, premium_model = use_feature_with_premium_model_check(
+            "PRESENTATION", user_id=user_id
+        )
+    except Exception:
+        return "Limit reached user cannot make more ppts"
+
+    llm = get_model({"temperature": 0.3}, False, premium_model, alt=False, json_mode=True)
+    ppt_pages = (
+        subscription_manager.get_feature_value(user_id, "ppt_pages").main_data or 12
+    )
+    number_of_pages = min(number_of_pages, ppt_pages)
+
+    presentation_maker = PresentationMaker(
+        template_manager,
+        temp_knowledge_manager,
+        llm,
+        vectorstore=knowledge_manager,
+        diagram_maker=DiagramMaker(None, llm, None)
+    )
+    try:
+        return deduct_points_for_feature(
+            user_id,
+            make_ppt,
+            func_kwargs={
+                "ppt_maker": presentation_maker,
+                "ppt_input": MakePresentationInput(
+                    topic=topic,
+                    instructions=instructions,
+                    number_of_pages=number_of_pages,
+                    negative_prompt=negative_prompt,
+                    collection_name=None,
+                    files=None,
+                    user_id=user_id
+                ),
+                "cache_manager": context.cache_manager,
+                "url_template": context.url_template,
+                "presentation_db" : presentation_db
+            },
+            feature_key="PRESENTATION",
+            usage_key="PRESENTATION",
+        )
+    except Exception as e:
+        logging.error(f"Error in ppt {e}")
+        return f"Error in ppt {e}"
+
+
+def make_graph(context: ToolContext, vega_lite_spec: str = "", **kwargs):
+    if not vega_lite_spec:
+        return "Enter a valid spec recieved none"
+    try:
+        return make_vega_graph(
+            vl_spec=vega_lite_spec,
+            cache_manager=context.cache_manager,
+            url_template=context.url_template
+        )
+    except Exception as e:
+        logging.error(f"Error in graph generation {e}")
+        return f"Error in graph generation {e}"
+
+
+def create_graphviz_graph(context: ToolContext, dot_code: str = "", **kwargs):
+    if not dot_code:
+        return "Enter valid graphviz dot code"
+    try:
+        return make_graphviz_graph(dot_code, cache_manager=context.cache_manager, url_template=context.url_template)
+    except Exception as e:
+        logging.error(f"Error in graph generation {e}")
+        return f"Error in graph generation {e}"
+
+
+def create_notes(context: ToolContext, link: str = "", instructions: str = "", **kwargs):
+    user_id = context.user_id
+    try:
+        data, _, _ = knowledge_manager.load_web_youtube_link({}, None, web_url=link, injest=False)
+    except Exception as e:
+        logging.error(f"Error: {e}")
+        return f"Error: {e}"
+
+    content = select_random_chunks(data, 1000, 2700)
+
+    try:
+        model_name, premium_model = use_feature_with_premium_model_check(
+            "NOTES", user_id=user_id
+        )
+    except Exception:
+        return "Limit reached user cannot make more notes"
+
+    llm = get_model({"temperature": 0.3}, False, premium_model, alt=False)
+    try:
+        return deduct_points_for_feature(
+            user_id,
+            make_notes,
+            func_kwargs={
+                "notes_maker" : MarkdownNotesMaker(
+                    llm=llm,
+                    searxng_host=SEARCHX_HOST,
+                ),
+                "cache_manager": context.cache_manager,
+                "url_template": context.url_template,
+                "data_string" : content,
+                "instructions" : instructions,
+                "user_id" : user_id,
+                "notes_db" : notes_db
+            },
+            feature_key="NOTES",
+            usage_key="NOTES",
+        )
+    except ValueError as e:
+        logging.error(f"Error in making notes {e}")
+        return f"Error in making notes {e}. Maybe give the user notes in docs its free?"
+    except Exception as e:
+        logging.error(f"Error in making notes {e}")
+        return f"Error in making notes {e}"
+
+
+def write_content_tool_func(
+    context: ToolContext,
+    topic: str = "",
+    to_generate: str = "content",
+    negative_prompt: str = "",
+    minimum_word_count: int = 500,
+    instructions: str = "",
+    **kwargs,
+):
+    user_id = context.user_id
+    model_name, premium_model = can_use_premium_model(user_id=user_id)
+    model = get_model({"temperature": 0}, False, premium_model, alt=False)
+    writer = Writer(model)
+    try:
+        return deduct_points_for_feature(
+            user_id,
+            write_content,
+            func_kwargs={
+                "writer" : writer,
+                "topic": topic,
+                "instructions": instructions,
+                "minimum_word_count": minimum_word_count,
+                "negative_prompt": negative_prompt,
+                "to_generate": to_generate,
+                "cache_manager": context.cache_manager,
+                "url_template": context.url_template
+            },
+            feature_key="WRITER",
+            usage_key="WRITER",
+        )
+    except Exception as e:
+        logging.error(f"Error in writing content {e}")
+        return f"Error in writing content {e}"
+
+
+def find_free_courses(context: ToolContext, query: str, **kwargs):
+    courses, total = course_manager.search_courses(
+        page=1, page_size=7, query_str=query
+    )
+    return [course for course in courses if (course.actual_price_usd - course.sale_price_usd) >= 50]
+
+
+def make_tool_context(user_id: str) -> ToolContext:
+    return ToolContext(
+        user_id=user_id,
+        cache_manager=redis_cache_manager,
+        url_template=CACHE_DOCUMENT_URL_TEMPLATE,
+    )
+
+
+general_chat_tools = ToolRegistry()
+general_chat_tools.add(
+    find_free_courses,
+    name="find_free_courses",
+    description="Used to find paid courses for free using coupons.",
+    args_schema=FindCoursesArgs,
+)
+general_chat_tools.add(
+    write_content_tool_func,
+    name="writer",
+    description="Used to write content like poems, essays, articles, reports",
+    args_schema=WriterArgs,
+)
+general_chat_tools.add(
+    create_notes,
+    name="make_notes_from_link",
+    description="Used to make notes from links. These can be web links or youtube links",
+    args_schema=MakeNotesArgs,
+)
+general_chat_tools.add(
+    read_vector_db,
+    name="read_user_subject_or_file",
+    description="Used to read students subject of a file in that subject",
+    args_schema=ReadDataArgs,
+)
+general_chat_tools.add(
+    list_user_subjects_files,
+    name="list_user_subjects_files",
+    description="Used to list the subjects the students has added and files in them.",
+    args_schema=NoArgs,
+)
+general_chat_tools.add(
+    create_graphviz_graph,
+    name="make_graph",
+    description="Used to make graphs using graphviz. Takes in valid dot language code for graphviz it must be in string no extra args",
+    args_schema=GraphvizArgs,
+)
+general_chat_tools.add(
+    make_graph,
+    name="make_vega_lite_graph",
+    description=VEGA_LITE_TOOL_DESCRIPTION,
+    args_schema=VegaLiteArgs,
+)
+general_chat_tools.add(
+    make_presentation,
+    name="make_presentation",
+    description=PRESENTATION_TOOL_DESCRIPTION,
+    args_schema=MakePptArgs,
+)
+# Shared tools keep one client each, the cache tools share the global Redis pool
+general_chat_tools.add_shared(
+    SearchTool(seachx_wrapper=SearxSearchWrapper(searx_host=SEARCHX_HOST, unsecure=True, k=3))
+)
+general_chat_tools.add_shared(SearchImage(instance_url=SEARCHX_HOST))
+general_chat_tools.add_shared(
+    MarkdownToDocConverter(cache_manager=redis_cache_manager, url_template=CACHE_DOCUMENT_URL_TEMPLATE)
+)
+general_chat_tools.add_shared(
+    MakeTableTool(cache_manager=redis_cache_manager, url_template=CACHE_DOCUMENT_URL_TEMPLATE)
+)
+general_chat_tools.add_shared(RequestsGetTool(requests_wrapper=TextRequestsWrapper()))
+general_chat_tools.add_shared(YouTubeSearchTool())
+
+MUST_HAVE_TOOLS = [
+    "find_free_courses",
+    "writer",
+    "make_notes_from_link",
+    "read_user_subject_or_file",
+    "list_user_subjects_files",
+    "make_graph",
+    "search_web",
+    "search_image",
+    "make_doc_notes_or_make_table",
+    "make_table",
+]
+OPTIONAL_TOOLS = [
+    "requests_get",
+    "youtube_search",
+    "make_vega_lite_graph",
+    "make_presentation",
+]
+# These generate whole documents with a model, the default tool timeout is too short
+TOOL_TIMEOUTS = {
+    "writer": AGENT_SLOW_TOOL_TIMEOUT,
+    "make_notes_from_link": AGENT_SLOW_TOOL_TIMEOUT,
+    "make_presentation": AGENT_SLOW_TOOL_TIMEOUT,
+}
@@ -1,9 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query
 from fastapi import Depends, HTTPException, status
 from ..auth import get_user_id
 from ..globals import conversation_manager as message_manager
 from ..globals import collection_manager, file_manager
-from ..lib.database.messages import UserLatestConversations, MessagePair
+from ..lib.database.messages import UserLatestConversations, MessagePair, MessagesPage
 from ..lib.database.messages import ChatType, ConversationMetadata
 from ..auth import get_user_id, verify_play_integrity
 from typing import List, Optional
@@ -106,6 +106,23 @@ def get_messages(
     return [] if messages is None else messages
 
 
+@router.get("/get_messages_page", response_model=MessagesPage)
+def get_messages_page(
+    conversation_id: str,
+    cursor: Optional[int] = None,
+    limit: int = Query(50, ge=1, le=200),
+    user_id: str = Depends(get_user_id),
+    play_integrity_verified=Depends(verify_play_integrity),
+):
+    """The latest messages, pass `next_cursor` back as `cursor` for the page before them."""
+    logging.info(f"Getting messages page {user_id}")
+    page = message_manager.get_messages_page(user_id, conversation_id, cursor=cursor, limit=limit)
+    if page is None:
+        logging.error(f"Coversation not found {user_id}")
+        raise HTTPException(400, detail="Conversation does not exist")
+    return page
+
+
 @router.get("/get_all_conversations")
 def get_all_conversations(
     user_id: str = Depends(get_user_id),
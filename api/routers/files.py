@@ -2,11 +2,13 @@ import logging
 import os
 import tempfile
 from urllib.parse import quote
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, Header, HTTPException, UploadFile, File
 from fastapi.responses import FileResponse
 from fastapi import Depends, HTTPException, status
-from ..globals import collection_manager, knowledge_manager, file_manager, subscription_manager
+from ..config import INGEST_JOBS_ENABLED
+from ..globals import collection_manager, knowledge_manager, file_manager, subscription_manager, ingestion_jobs
 from ..lib.database.files import FileModel
+from ..lib.ingestion_jobs import IngestionJob, Progress
 from ..lib.database.purchases import SubscriptionType
 from ..lib.utils import get_file_extension, format_url, convert_youtube_url_to_standard
 from pydantic import BaseModel
@@ -19,6 +21,10 @@ from ..lib.youtube_search import YouTubeSearch
 router = APIRouter()
 
 MAX_FILE_SIZE = 20 * 1024 * 1024
+UPLOAD_COPY_BUFFER = 1024 * 1024
+
+UPLOAD_JOB = "upload"
+LINK_FILE_JOB = "linkfile"
 
 
 class FileCreate(BaseModel):
@@ -76,12 +82,171 @@ def search_youtube(
         logging.error(f"Error occurred during YouTube search for query '{query}': {str(e)}")
         raise HTTPException(status_code=500, detail="An error occurred during the YouTube search")
 
+def file_info(collection_name: str, file_model: FileModel) -> dict:
+    return {
+        "collection_name": collection_name,
+        "filename": file_model.filename,
+        "description": file_model.description,
+        "filetype": file_model.filetype,
+        "friendly_name": file_model.friendly_filename,
+    }
+
+
+def ingest_link_file(payload: dict, progress: Progress) -> dict:
+    user_id = payload["user_id"]
+    try:
+        progress("fetching", 0.1)
+        logging.info("Started loading")
+        contents, ids, file_bytes = knowledge_manager.load_web_youtube_link(
+            metadata={"file": payload["filename"], "collection" : payload["collection_name"], "user" : user_id},
+            youtube_link=payload["youtube_link"],
+            web_url=payload["web_link"],
+        )
+    except ValueError as e:
+        import traceback
+        logging.error(f"File not supported, Error: {traceback.format_exception(e)}")
+        raise
+
+    except Exception as e:
+        import traceback
+        logging.error(f"File not supported, Error: {traceback.format_exception(e)}")
+        raise ValueError("Video has no subtitles.") from e
+
+    progress("saving", 0.9, chunks=len(ids))
+    try:
+        file_model = file_manager.add_file(
+            FileModel(
+                friendly_filename=payload["filename"],
+                collection_name=payload["collection_name"],
+                user_id=user_id,
+                filename=payload["filename"],
+                description=payload["description"],
+                file_content=contents,
+                file_bytes=file_bytes,
+                vector_ids=ids,
+                filetype=payload["filetype"],
+            ),
+        )
+    except Exception as e:
+        knowledge_manager.delete_ids(ids)
+        raise ValueError(str(e)) from e
+
+    logging.info(f"File created, File name: {file_model.filename}, Collection: {payload['collection_name']} {user_id}")
+    return {"file": file_info(payload["collection_name"], file_model)}
+
+
+def ingest_uploaded_file(payload: dict, progress: Progress) -> dict:
+    """Ingests a file stored with `put_upload`, the upload is removed again if anything fails.
+
+    `delete_upload` keeps uploads a file record references, e.g. saved by an
+    earlier run of the same job.
+    """
+    user_id = payload["user_id"]
+    try:
+        with tempfile.NamedTemporaryFile(
+            delete=True, suffix=payload["extension"], mode="w+b"
+        ) as temp_file:
+            progress("downloading", 0.05)
+            file_manager.read_upload(payload["upload_id"], temp_file, UPLOAD_COPY_BUFFER)
+            temp_file.flush()
+
+            progress("extracting", 0.1)
+            try:
+                contents, ids = knowledge_manager.stream_and_injest_file(
+                    temp_file.name,
+                    {"file": payload["filename"], "collection" : payload["collection_name"], "user" : user_id},
+                    advanced_pdf_extraction=payload["advanced_extraction"],
+                    # Total chunk count is unknown while streaming, approach 90% asymptotically
+                    on_progress=lambda chunks: progress("embedding", 0.1 + 0.8 * chunks / (chunks + 200), chunks=chunks),
+                )
+            except Exception as e:
+                import traceback
+                logging.error(f"File not supported, Error: {traceback.format_exception(e)}")
+                raise ValueError("FIle not supported/ FIle has no Data, Handwritten text only supported for PRO or higher.") from e
+
+        progress("saving", 0.95, chunks=len(ids))
+        try:
+            file_model = file_manager.add_file(
+                FileModel(
+                    friendly_filename=payload["filename"],
+                    collection_name=payload["collection_name"],
+                    filename=payload["filename"],
+                    description=payload["description"],
+                    file_content=contents,
+                    vector_ids=ids,
+                    filetype=payload["filetype"],
+                    user_id=user_id,
+                ),
+                upload_id=payload["upload_id"],
+            )
+        except Exception as e:
+            knowledge_manager.delete_ids(ids)
+            raise ValueError(str(e)) from e
+    except Exception:
+        try:
+            file_manager.delete_upload(payload["upload_id"])
+        except Exception as e:
+            logging.error(f"Failed to delete upload {payload['upload_id']}: {e}")
+        raise
+
+    logging.info(f"File created, File name: {file_model.filename}, Collection: {payload['collection_name']} {user_id}")
+    return {"file": file_info(payload["collection_name"], file_model)}
+
+
+ingestion_jobs.register(LINK_FILE_JOB, ingest_link_file)
+ingestion_jobs.register(UPLOAD_JOB, ingest_uploaded_file)
+ingestion_jobs.start()
+
+
+def run_ingestion(user_id: str, kind: str, payload: dict, idempotency_key: Optional[str], file: dict) -> dict:
+    """Queues the ingestion, or runs it in the request when background jobs are disabled."""
+    if not INGEST_JOBS_ENABLED:
+        handler = ingest_link_file if kind == LINK_FILE_JOB else ingest_uploaded_file
+        try:
+            result = handler(payload, lambda *args, **kwargs: None)
+        except ValueError as e:
+            raise HTTPException(detail=str(e), status_code=400) from e
+        return {"status": "success", **result}
+
+    job, created = ingestion_jobs.submit(user_id, kind, payload, idempotency_key)
+    if not created and kind == UPLOAD_JOB:
+        # A concurrent retry with the same key won, this copy is not needed
+        file_manager.delete_upload(payload["upload_id"])
+    logging.info(f"Ingestion job {job.id} queued for {user_id}")
+    return job_response(job, file)
+
+
+def job_response(job: IngestionJob, file: Optional[dict] = None) -> dict:
+    return {
+        "status": job.status.value.lower(),
+        "job_id": job.id,
+        "file": job.result.get("file", file),
+        "job": job.public(),
+    }
+
+
+@router.get("/jobs/{job_id}")
+def get_ingestion_job(
+    job_id: str,
+    user_id=Depends(get_user_id),
+    play_integrity_verified=Depends(verify_play_integrity),
+):
+    job = ingestion_jobs.get(job_id)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(detail="Job does not exist", status_code=404)
+    return job_response(job)
+
+
 @router.post("/linkfile")
 def create_link_file(
     linkfile: LinkFileInput,
     user_id=Depends(get_user_id),
     play_integrity_verified=Depends(verify_play_integrity),
+    idempotency_key: Optional[str] = Header(None),
 ):
+    if existing := ingestion_jobs.find(user_id, idempotency_key):
+        return job_response(existing)
+
     can_add_more_data(user_id, linkfile.collection_name, collection_check=False)
     
     logging.info(f"Create linkfile request from {user_id}, input: {linkfile}")
@@ -119,52 +284,28 @@ def create_link_file(
         )
 
     extension = ".yt" if linkfile.youtube_link else ".html"
-
-    try:
-        logging.info("Started loading")
-        contents, ids, file_bytes = knowledge_manager.load_web_youtube_link(
-            metadata={"file": linkfile.filename, "collection" : collection.name, "user" : user_id},
-            youtube_link=linkfile.youtube_link,
-            web_url=linkfile.web_link,
-        )
-    except ValueError as e:
-        import traceback
-        logging.error(f"File not supported, Error: {traceback.format_exception(e)}")
-        raise HTTPException(400, str(e))
-
-    except Exception as e:
-        import traceback
-        logging.error(f"File not supported, Error: {traceback.format_exception(e)}")
-        raise HTTPException(400, "Video has no subtitles.") from e
-
-    try:
-        file_model = file_manager.add_file(
-            FileModel(
-                friendly_filename=linkfile.filename,
-                collection_name=linkfile.collection_name,
-                user_id=user_id,
-                filename=linkfile.filename,
-                description=linkfile.description,
-                file_content=contents,
-                file_bytes=file_bytes,
-                vector_ids=ids,
-                filetype=extension,
-            ),
-        )
-    except Exception as e:
-        raise HTTPException(detail=str(e), status_code=400)
-    
-    logging.info(f"File created, File name: {file_model.filename}, Collection: {linkfile.collection_name} {user_id}")
-    return {
-        "status": "success",
-        "file": {
+    payload = {
+        "user_id": user_id,
+        "collection_name": collection.name,
+        "filename": linkfile.filename,
+        "description": linkfile.description,
+        "youtube_link": linkfile.youtube_link,
+        "web_link": linkfile.web_link,
+        "filetype": extension,
+    }
+    return run_ingestion(
+        user_id,
+        LINK_FILE_JOB,
+        payload,
+        idempotency_key,
+        {
             "collection_name": linkfile.collection_name,
-            "filename": file_model.filename,
-            "description": file_model.description,
-            "filetype": file_model.filetype,
-            "friendly_name": file_model.friendly_filename,
+            "filename": linkfile.filename,
+            "description": linkfile.description,
+            "filetype": extension,
+            "friendly_name": linkfile.filename,
         },
-    }
+    )
 
 @router.post("/")
 def create_file(
@@ -174,10 +315,14 @@ def create_file(
     file: UploadFile = File(...),
     user_id=Depends(get_user_id),
     play_integrity_verified=Depends(verify_play_integrity),
+    idempotency_key: Optional[str] = Header(None),
 ):
-    can_add_more_data(user_id, collection_name, collection_check=False)
-    
     try:
+        if existing := ingestion_jobs.find(user_id, idempotency_key):
+            return job_response(existing)
+
+        can_add_more_data(user_id, collection_name, collection_check=False)
+
         logging.info(f"Create file request from {user_id}, collection={collection_name}, filename={filename}")
         if not is_safe_filename(filename) or not is_safe_filename(file.filename):
             logging.warning(f"{user_id} is a sus user!")
@@ -218,53 +363,31 @@ def create_file(
             
         _, file_extension = os.path.splitext(file.filename)
 
-        # Create a secure temporary file with the same extension
-        with tempfile.NamedTemporaryFile(
-            delete=True, suffix=file_extension, mode="w+b"
-        ) as temp_file:
-            contents = file.file.read()
-            temp_file.write(contents)
-            temp_file.seek(0)
-
-            try:
-                contents, ids, file_bytes = knowledge_manager.load_and_injest_file(
-                    temp_file.name,
-                    {"file": filename, "collection" : collection.name, "user" : user_id},
-                    advanced_pdf_extraction=advanced_extraction
-                )
-            except Exception as e:
-                import traceback
-                logging.error(f"File not supported, Error: {traceback.format_exception(e)}")
-                raise HTTPException(400, "FIle not supported/ FIle has no Data, Handwritten text only supported for PRO or higher.") from e
-
-            try:
-                file_model = file_manager.add_file(
-                    FileModel(
-                        friendly_filename=filename,
-                        collection_name=collection_name,
-                        filename=filename,
-                        description=description,
-                        file_content=contents,
-                        file_bytes=file_bytes,
-                        vector_ids=ids,
-                        filetype=get_file_extension(file.filename),
-                        user_id=user_id,
-                    ),
-                )
-            except Exception as e:
-                raise HTTPException(detail=str(e), status_code=400)
-            
-        logging.info(f"File created, File name: {file_model.filename}, Collection: {collection_name} {user_id}")
-        return {
-            "status": "success",
-            "file": {
+        # Workers may run on another host, so the upload is handed over through GridFS
+        upload_id = file_manager.put_upload(file.file, filename)
+        payload = {
+            "user_id": user_id,
+            "collection_name": collection.name,
+            "filename": filename,
+            "description": description,
+            "extension": file_extension,
+            "filetype": get_file_extension(file.filename),
+            "advanced_extraction": advanced_extraction,
+            "upload_id": upload_id,
+        }
+        return run_ingestion(
+            user_id,
+            UPLOAD_JOB,
+            payload,
+            idempotency_key,
+            {
                 "collection_name": collection_name,
-                "filename": file_model.filename,
-                "description": file_model.description,
-                "filetype": file_model.filetype,
-                "friendly_name": file_model.friendly_filename,
+                "filename": filename,
+                "description": description,
+                "filetype": payload["filetype"],
+                "friendly_name": filename,
             },
-        }
+        )
     finally:
         file.file.close()
 
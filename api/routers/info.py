@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Depends
-from ..auth import get_user_id, verify_play_integrity
+from ..auth import get_user_id, verify_play_integrity, verify_cronjob_request
 from ..globals import (
     FEATURE_PRICING,
+    rate_limiter,
+    extraction_cache,
 )
 
 
@@ -12,4 +14,19 @@ def get_number_of_ads_watched(
     user_id: str = Depends(get_user_id),
     play_integrity_verified: None = Depends(verify_play_integrity),
 ) -> dict:
-    return FEATURE_PRICING
\ No newline at end of file
+    return FEATURE_PRICING
+
+
+@router.get("/queue_status", tags=["info"])
+def get_queue_status(
+    user_id: str = Depends(get_user_id),
+    play_integrity_verified: None = Depends(verify_play_integrity),
+) -> dict:
+    """Queue position and ETA a background job (presentation, assignment, lecture) would currently get."""
+    return rate_limiter.estimate()
+
+
+@router.get("/extraction_cache_stats", tags=["info"])
+def get_extraction_cache_stats(_=Depends(verify_cronjob_request)) -> dict:
+    """Hit rate, size and evictions of the shared file extraction cache."""
+    return extraction_cache.stats()
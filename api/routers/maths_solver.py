@@ -1,9 +1,7 @@
 import logging
-import queue
 import tempfile
-import threading
 
-from typing import Generator, Optional
+from typing import Optional
 from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
 from fastapi import Depends, HTTPException, status
 from fastapi.responses import StreamingResponse
@@ -12,11 +10,14 @@ from pydantic import BaseModel
 from ..dependencies import get_model_and_fallback, require_points_for_feature
 from ..lib.database.messages import MessagePair
 from ..lib.maths_solver.agent import MathSolver
-from ..lib.utils import split_into_chunks
-from ..globals import conversation_manager, client
+from ..lib.streaming import StreamChannel, report_answer
+from ..lib.single_flight import make_key
+from ..globals import conversation_manager, client, streaming_engine, extraction_cache
 from ..auth import get_user_id, verify_play_integrity
 from ..dependencies import use_feature, can_use_premium_model
 from ..lib.ocr import ImageOCR
+from ..lib.extraction_cache import file_digest
+from api.config import AGENT_MAX_CONCURRENT_TOOLS, AGENT_TOOL_TIMEOUT, CHAT_HISTORY_MESSAGES
 
 
 
@@ -54,7 +55,7 @@ def solve_maths_stream(
 
     chat_history = (
         convert_message_pairs_to_tuples(
-            conversation_manager.get_messages(user_id, conversation_id)
+            conversation_manager.get_messages(user_id, conversation_id, limit=CHAT_HISTORY_MESSAGES)
         )
         if conversation_id
         else maths_solver_input.chat_history
@@ -63,54 +64,47 @@ def solve_maths_stream(
     model_name, premium_model = can_use_premium_model(user_id=user_id)        
     model_default, model_fallback  = get_model_and_fallback({"temperature": 0}, True, premium_model, alt=False)
     logging.info(f"Default {model_default}, Fallback {model_fallback}")        
-    data_queue = queue.Queue()
-
-    def callback(data: str) -> None:
-        data_queue.put(data)
 
     def on_end_callback(response: str) -> None:
+        report_answer(response)
         if conversation_id:
             conversation_manager.add_message(
                 user_id, conversation_id, maths_solver_input.question, response
             )
 
-    def data_generator() -> Generator[str, None, None]:
-        yield "[START]"
-        while True:
-            try:
-                data = data_queue.get(timeout=60)
-                if data == "@@END@@":
-                    yield "[END]"
-                    break
-                yield data
-            except queue.Empty:
-                yield "[TIMEOUT]"
-                break
-
-    def run_agent() -> None:
-        try:
-            maths_solver = MathSolver(
-                client,
-                llm=model_default,
-                is_openai_functions=True,
-            )
-            maths_solver.run_agent(
-                maths_solver_input.question,
-                callback=callback,
-                chat_history=chat_history,
-                on_end_callback=on_end_callback,
-            )
-        except Exception as e:
-            import traceback
-            logging.error(f"Error in math solver {user_id}, Error: {traceback.format_exception(e)}")
-            error_message = "The AI was not able to solve the question please make your question clearer."
-            for chunk in split_into_chunks(error_message, 4):
-                callback(chunk)
-            callback("@@END@@")
-
-    threading.Thread(target=run_agent).start()
+    def on_coalesced(response: str) -> None:
+        # The leader may have been this conversation retrying, it stored the answer already
+        latest = conversation_manager.get_messages(user_id, conversation_id, limit=1) if conversation_id else None
+        if not latest or (latest[-1].human_message, latest[-1].bot_response) != (maths_solver_input.question, response):
+            on_end_callback(response)
+
+    async def run_agent(channel: StreamChannel) -> None:
+        maths_solver = MathSolver(
+            client,
+            llm=model_default,
+            is_openai_functions=True,
+            max_concurrent_tools=AGENT_MAX_CONCURRENT_TOOLS,
+            tool_timeout=AGENT_TOOL_TIMEOUT,
+        )
+        await maths_solver.arun_agent(
+            maths_solver_input.question,
+            channel=channel,
+            chat_history=chat_history,
+            on_end_callback=on_end_callback,
+        )
 
-    return StreamingResponse(data_generator())
+    return StreamingResponse(
+        streaming_engine.stream(
+            run_agent,
+            name="solve_maths_stream",
+            start_token="[START]",
+            end_token="[END]",
+            error_message="The AI was not able to solve the question please make your question clearer.",
+            # Shared across users, an answer depends on nothing but the question and history
+            coalesce_key=make_key("solve_maths_stream", maths_solver_input.question, chat_history, premium_model),
+            on_coalesced=on_coalesced,
+        )
+    )
 
 
 @router.post("/ocr_image")
@@ -126,8 +120,11 @@ def ocr_image_route(
     try:
         with tempfile.NamedTemporaryFile(delete=True) as temp_file:
             temp_file.write(file.file.read())
+            temp_file.flush()
             temp_file_path = temp_file.name
-            ocr_result = ImageOCR().perform_ocr(temp_file_path)
+            ocr_result = extraction_cache.get_or_compute(
+                file_digest(temp_file_path), "image_ocr", lambda: ImageOCR().perform_ocr(temp_file_path)
+            )
         logging.info(f"Successfully ocred {user_id}")
         return ocr_result
 
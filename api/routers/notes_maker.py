@@ -16,8 +16,10 @@ from ..globals import (
     file_manager,
     knowledge_manager,
     notes_db,
+    extraction_cache,
 )
 from ..lib.ocr import ImageOCR
+from ..lib.extraction_cache import file_digest
 from ..lib.database.notes import Note as StoreNotesInput, NoteType
 from .utils import transcribe_audio_with_deepgram
 from .utils import select_random_chunks
@@ -97,8 +99,11 @@ def ocr_image_route(
     try:
         with tempfile.NamedTemporaryFile(delete=True) as temp_file:
             temp_file.write(file.file.read())
+            temp_file.flush()
             temp_file_path = temp_file.name
-            ocr_result = ImageOCR().perform_ocr(temp_file_path)
+            ocr_result = extraction_cache.get_or_compute(
+                file_digest(temp_file_path), "image_ocr", lambda: ImageOCR().perform_ocr(temp_file_path)
+            )
         logging.info(f"Successfully ocred {user_id}")
         return ocr_result.replace("\n", " ")
 
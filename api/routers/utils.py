@@ -1,11 +1,10 @@
 import base64
-import tiktoken
-import random
 import img2pdf
-from langchain.text_splitter import TokenTextSplitter
 import Levenshtein, logging
 from typing import List, Optional
 from deepgram import DeepgramClient, PrerecordedOptions, BufferSource
+from ..lib.chunking import count_tokens
+from ..lib.token_packer import PackResult, get_packer
 
 
 def transcribe_audio_with_deepgram(audio_data: bytes) -> str:
@@ -77,21 +76,19 @@ def file_to_base64(file_path: str) -> str:
 
 def num_tokens_from_string(string: str, encoding_name: str = "cl100k_base") -> int:
     """Returns the number of tokens in a text string."""
-    encoding = tiktoken.get_encoding(encoding_name)
-    num_tokens = len(encoding.encode(string))
-    return num_tokens
-
-def select_random_chunks(text: str, chunk_size: int, total_length: int) -> str:
-    if num_tokens_from_string(text) < total_length:
-        return text
-    
-    texts = TokenTextSplitter(chunk_size=chunk_size).split_text(text)
-    random.shuffle(texts)
-    selected_text = ''
-    for chunk in texts:
-        if num_tokens_from_string(selected_text) + num_tokens_from_string(chunk) <= total_length:
-            selected_text += chunk
-        else:
-            break
-            
-    return selected_text
\ No newline at end of file
+    return count_tokens(string, encoding_name)
+
+def pack_chunks(
+    text: str,
+    chunk_size: int,
+    total_length: int,
+    strategy: str = "random",
+    seed: Optional[int] = None,
+    query: Optional[str] = None,
+) -> PackResult:
+    """Chunks of `text` that fit `total_length` tokens, with the chunk ids to reproduce the selection."""
+    return get_packer(chunk_size, total_length).pack(text, strategy=strategy, seed=seed, query=query)
+
+
+def select_random_chunks(text: str, chunk_size: int, total_length: int, strategy: str = "random") -> str:
+    return pack_chunks(text, chunk_size, total_length, strategy=strategy).text
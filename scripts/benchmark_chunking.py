@@ -0,0 +1,68 @@
+"""Compares langchain's TokenTextSplitter with the shared TokenChunker.
+
+Needs tiktoken's gpt2 encoding, which is downloaded on first use.
+Run from the repository root:
+    python -m scripts.benchmark_chunking [--sizes 1 10 50] [--chunk-size 520]
+
+Sizes are in MB of generated text. Both splitters get a fresh call per text,
+like the routes did, and the chunk texts are compared for agreement.
+"""
+import argparse
+import random
+import time
+
+from langchain.text_splitter import TokenTextSplitter
+from api.lib.chunking import TokenChunker
+
+WORDS = (
+    "the of and to in is was photosynthesis equation derivative matrix "
+    "élan naïve café über 数学 物理 ∑ ∫ π = x² + y² newton energy cell "
+    "mitochondria revolution empire theorem proof lemma"
+).split()
+
+
+def generate_text(size_mb: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    parts, length, target = [], 0, size_mb * 1024 * 1024
+    while length < target:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 25))).capitalize()
+        sentence += rng.choice([". ", "? ", "! ", ".\n", ".\n\n"])
+        parts.append(sentence)
+        length += len(sentence.encode())
+    return "".join(parts)
+
+
+def timed(split, text: str):
+    start = time.perf_counter()
+    chunks = split(text)
+    return time.perf_counter() - start, chunks
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--chunk-size", type=int, default=520)
+    parser.add_argument("--overlap", type=int, default=200)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        text = generate_text(size)
+        before, old_chunks = timed(
+            lambda t: TokenTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.overlap).split_text(t), text
+        )
+        after, new_chunks = timed(
+            lambda t: TokenChunker(chunk_size=args.chunk_size, chunk_overlap=args.overlap).split_text(t), text
+        )
+        sentence, sentence_chunks = timed(
+            lambda t: TokenChunker(args.chunk_size, args.overlap, sentence_aware=True).split_text(t), text
+        )
+        same = sum(old == new for old, new in zip(old_chunks, new_chunks))
+        print(f"{size} MB, {len(old_chunks)} chunks")
+        print(f"  TokenTextSplitter:         {before:.2f}s ({size / before:.1f} MB/s)")
+        print(f"  TokenChunker:              {after:.2f}s ({size / after:.1f} MB/s), {before / after:.1f}x")
+        print(f"  TokenChunker, sentences:   {sentence:.2f}s, {len(sentence_chunks)} chunks")
+        print(f"  Identical chunks:          {same}/{len(old_chunks)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Compares the old sequential ingestion loop with IngestionPipeline.
+
+Embedding and Firestore latencies are simulated, so no credentials are needed.
+Run from the repository root:
+    python -m scripts.benchmark_ingestion
+"""
+import time
+
+from langchain.schema import Document
+from api.lib.ingestion import IngestionPipeline
+
+CHUNKS = 500
+EMBED_SECONDS = 0.4   # one embeddings request
+COMMIT_SECONDS = 0.15  # one Firestore batch commit
+
+
+class SlowEmbeddings:
+    def embed_documents(self, texts):
+        time.sleep(EMBED_SECONDS)
+        return [[0.0] * 8 for _ in texts]
+
+
+class SlowBatch:
+    def set(self, *args, **kwargs):
+        pass
+
+    def delete(self, *args, **kwargs):
+        pass
+
+    def commit(self):
+        time.sleep(COMMIT_SECONDS)
+
+
+class SlowCollection:
+    def document(self, doc_id):
+        return doc_id
+
+
+class SlowClient:
+    def batch(self):
+        return SlowBatch()
+
+
+class SimulatedVectorStore:
+    content_field, embedding_field, metadata_field = "content", "embedding", "metadata"
+
+    def __init__(self):
+        self.embedding_service = SlowEmbeddings()
+        self.client = SlowClient()
+        self.collection = SlowCollection()
+
+    def add_documents(self, documents):
+        """What FirestoreVectorStore.add_documents does: one embed call, one commit."""
+        self.embedding_service.embed_documents([doc.page_content for doc in documents])
+        self.client.batch().commit()
+        return [str(i) for i in range(len(documents))]
+
+
+def sequential(store, documents) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(documents), 200):
+        store.add_documents(documents[i : i + 200])
+    return time.perf_counter() - start
+
+
+def pipeline(store, documents) -> float:
+    start = time.perf_counter()
+    IngestionPipeline(store, batch_size=100, embed_workers=4, write_workers=4).run(documents)
+    return time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    documents = [Document(page_content=f"chunk {i}", metadata={"file": "bench.pdf"}) for i in range(CHUNKS)]
+    store = SimulatedVectorStore()
+    before = sequential(store, documents)
+    after = pipeline(store, documents)
+    print(f"Sequential batches of 200: {before:.2f}s")
+    print(f"IngestionPipeline:         {after:.2f}s")
+    print(f"Speedup:                   {before / after:.1f}x")
+    print("Note: real embedding latency grows with batch size, which favours smaller parallel batches further.")
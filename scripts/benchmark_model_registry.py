@@ -0,0 +1,50 @@
+"""Compares building a chat model per request with reusing one from ModelRegistry.
+
+Run from the repository root:
+    python -m scripts.benchmark_model_registry
+"""
+import os
+import time
+
+os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+
+from langchain_openai.chat_models import ChatOpenAI
+from api.ai_model import AIModel
+from api.lib.model_registry import ModelRegistry
+
+ITERATIONS = 500
+
+model_class = AIModel(
+    regular_model=ChatOpenAI,
+    regular_args={"request_timeout": 60, "model_name": "gpt-4o-mini"},
+    premium_model=ChatOpenAI,
+    premium_args={"model_name": "gpt-4o-mini", "request_timeout": 60, "max_retries": 4},
+)
+per_call = {"temperature": 0.3, "streaming": True, "cache": True}
+
+
+def per_request_construction() -> float:
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        ChatOpenAI(**model_class.regular_args, **per_call)
+    return time.perf_counter() - start
+
+
+def registry_reuse() -> float:
+    registry = ModelRegistry()
+    registry.get(model_class, False, per_call)  # warm up, the first build is paid once per process
+    start = time.perf_counter()
+    for _ in range(ITERATIONS):
+        registry.get(model_class, False, per_call)
+    elapsed = time.perf_counter() - start
+    registry.close()
+    return elapsed
+
+
+if __name__ == "__main__":
+    construction = per_request_construction()
+    reuse = registry_reuse()
+    print(f"Per-request construction: {construction / ITERATIONS * 1000:.3f} ms/model")
+    print(f"Registry reuse:           {reuse / ITERATIONS * 1000:.3f} ms/model")
+    print(f"Speedup:                  {construction / reuse:.1f}x")
+    print("Note: this excludes the TLS handshake each new client pays on its first request.")
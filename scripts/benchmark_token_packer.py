@@ -0,0 +1,80 @@
+"""Regression benchmark of the token budget packer against the old select_random_chunks.
+
+Needs tiktoken's gpt2 and cl100k_base encodings, downloaded on first use.
+Run from the repository root:
+    python -m scripts.benchmark_token_packer [--sizes 0.1 1 5]
+
+Sizes are in MB of generated text, budgets are the ones the routes use.
+Exits with status 1 if any selection exceeds its budget.
+"""
+import argparse
+import random
+import sys
+import time
+
+import tiktoken
+from langchain.text_splitter import TokenTextSplitter
+from api.lib.chunking import count_tokens
+from api.lib.token_packer import STRATEGIES, TokenBudgetPacker
+from scripts.benchmark_chunking import generate_text
+
+# (chunk_size, budget) of quiz/flashcards, chat notes, notes maker and summaries
+ROUTE_BUDGETS = [(1000, 1000), (1000, 2700), (2000, 4500), (600, 2500)]
+
+
+def legacy_select_random_chunks(text: str, chunk_size: int, total_length: int) -> str:
+    """select_random_chunks before the packer, re-tokenizing the selection on every step."""
+    def num_tokens(string: str) -> int:
+        return len(tiktoken.get_encoding("cl100k_base").encode(string, disallowed_special=()))
+
+    if num_tokens(text) < total_length:
+        return text
+    texts = TokenTextSplitter(chunk_size=chunk_size).split_text(text)
+    random.shuffle(texts)
+    selected_text = ""
+    for chunk in texts:
+        if num_tokens(selected_text) + num_tokens(chunk) <= total_length:
+            selected_text += chunk
+        else:
+            break
+    return selected_text
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[0.1, 1, 5])
+    args = parser.parse_args()
+
+    failures = 0
+    for size in args.sizes:
+        text = generate_text(1)[: int(size * 1024 * 1024)] if size < 1 else generate_text(int(size))
+        for chunk_size, budget in ROUTE_BUDGETS:
+            start = time.perf_counter()
+            old = legacy_select_random_chunks(text, chunk_size, budget)
+            before = time.perf_counter() - start
+
+            packer = TokenBudgetPacker(chunk_size, budget)
+            start = time.perf_counter()
+            result = packer.pack(text, seed=0)
+            after = time.perf_counter() - start
+
+            used = count_tokens(result.text)
+            print(
+                f"{size} MB, chunk {chunk_size}, budget {budget}: old {before * 1000:.0f} ms "
+                f"({count_tokens(old)} tokens), packer {after * 1000:.0f} ms ({used} tokens, "
+                f"{len(result.chunk_ids)} chunks), {before / after:.1f}x"
+            )
+            if packer.select(text, result.chunk_ids) != result.text:
+                print("  chunk ids do not reproduce the selection")
+                failures += 1
+
+            for strategy in STRATEGIES:
+                packed = packer.pack(text, strategy=strategy, seed=0, query="photosynthesis energy cell")
+                if count_tokens(packed.text) > budget:
+                    print(f"  {strategy} selection exceeds the budget: {count_tokens(packed.text)} > {budget}")
+                    failures += 1
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Per request tool setup of general chat, rebuilt every time vs bound from the registry.
+
+Imports the app's globals, so it needs the server's environment (.env,
+Redis and the databases reachable). Run from the repository root:
+    python -m scripts.benchmark_tool_setup [--requests 200]
+
+The legacy setup is the one chat_general_stream had before the registry,
+with the tool bodies stubbed out, they are not called here. Tools are
+only built, the agent never runs.
+"""
+import argparse
+import statistics
+import time
+
+from typing import List, Optional
+
+import redis
+from api.config import CACHE_DOCUMENT_URL_TEMPLATE, REDIS_URL, SEARCHX_HOST
+from api.lib.database.cache_manager import RedisCacheManager
+from api.lib.tools import MakeTableTool, MarkdownToDocConverter, RequestsGetTool, SearchImage, SearchTool
+from api.routers.chat_tools import (
+    MUST_HAVE_TOOLS,
+    OPTIONAL_TOOLS,
+    PRESENTATION_TOOL_DESCRIPTION,
+    VEGA_LITE_TOOL_DESCRIPTION,
+    general_chat_tools,
+    make_tool_context,
+)
+from langchain.tools import StructuredTool, tool
+from langchain.pydantic_v1 import BaseModel as OldBaseModel
+from langchain.pydantic_v1 import Field as OldField
+from langchain_community.utilities.searx_search import SearxSearchWrapper
+from langchain_community.tools.youtube.search import YouTubeSearchTool
+from langchain_community.utilities.requests import TextRequestsWrapper
+
+
+def legacy_setup(user_id: str) -> list:
+    class WriterArgs(OldBaseModel):
+        topic: str = OldField(None, description="The Topic to write on")
+        to_generate: Optional[str] = OldField("Essay", description="The content to write. Can be essays, articles or anything")
+        negative_prompt: Optional[str] = ""
+        minimum_word_count: Optional[int] = 100
+        instructions: Optional[str] = "Be detailed"
+
+    class MakeNotesArgs(OldBaseModel):
+        instructions: str = OldField("")
+        link: str = OldField("", description="The link to make notes from. Web or youtube link.")
+
+    class ReadDataArgs(OldBaseModel):
+        query: str = OldField("all", description="What you want to search")
+        subject_name: str = OldField(description="The name of the subject to read data from")
+        file_name: Optional[str] = OldField(None, description="The name of the file to read from the subject")
+
+    class MakePptArgs(OldBaseModel):
+        topic: str = OldField(..., description="The main subject or title of the presentation.")
+        instructions: str = OldField(..., description="Specific guidelines or directives for creating the presentation content.")
+        number_of_pages: int = OldField(..., description="The desired number of pages/slides in the presentation.")
+        negative_prompt: str = OldField(..., description="Any themes, topics, or elements that should be avoided in the presentation.")
+        subject_name: Optional[str] = OldField(None, description="Name of users subject to make ppt from")
+        files: Optional[List[str]] = OldField(None, description="An optional list of file names from the subject to make ppt from")
+
+    def stub(*args, **kwargs):
+        return user_id
+
+    @tool
+    def find_free_courses(query: str):
+        """Used to find paid courses for free using coupons."""
+        return stub(query)
+
+    must_have_tools = [
+        find_free_courses,
+        StructuredTool.from_function(func=lambda topic="", to_generate="content", negative_prompt="", minimum_word_count=500, instructions="", *args, **kwargs: stub(), name="writer", description="Used to write content like poems, essays, articles, reports", args_schema=WriterArgs),
+        StructuredTool.from_function(func=lambda link="", instructions="", *args, **kwargs: stub(), name="make_notes_from_link", description="Used to make notes from links. These can be web links or youtube links", args_schema=MakeNotesArgs),
+        StructuredTool.from_function(func=lambda subject_name, file_name=None, query="all", *args, **kwargs: stub(), name="read_user_subject_or_file", description="Used to read students subject of a file in that subject", args_schema=ReadDataArgs),
+        StructuredTool.from_function(func=lambda *args, **kwargs: stub(), name="list_user_subjects_files", description="Used to list the subjects the students has added and files in them."),
+        StructuredTool.from_function(func=lambda dot_code, *args, **kwargs: stub(), name="make_graph", description="Used to make graphs using graphviz."),
+        SearchTool(seachx_wrapper=SearxSearchWrapper(searx_host=SEARCHX_HOST, unsecure=True, k=3)),
+        SearchImage(instance_url=SEARCHX_HOST),
+        MarkdownToDocConverter(cache_manager=RedisCacheManager(redis.from_url(REDIS_URL)), url_template=CACHE_DOCUMENT_URL_TEMPLATE),
+        MakeTableTool(cache_manager=RedisCacheManager(redis.from_url(REDIS_URL)), url_template=CACHE_DOCUMENT_URL_TEMPLATE),
+    ]
+    optional_tools = [
+        RequestsGetTool(requests_wrapper=TextRequestsWrapper()),
+        YouTubeSearchTool(),
+        StructuredTool.from_function(func=lambda vega_lite_spec, *args, **kwargs: stub(), name="make_vega_lite_graph", description=VEGA_LITE_TOOL_DESCRIPTION),
+        StructuredTool.from_function(func=lambda topic, instructions="", number_of_pages=5, negative_prompt="", *args, **kwargs: stub(), name="make_presentation", description=PRESENTATION_TOOL_DESCRIPTION, args_schema=MakePptArgs),
+    ]
+    # Two optional tools are picked per request, the picking itself is not timed
+    return [*must_have_tools, *optional_tools[2:]]
+
+
+def registry_setup(user_id: str) -> list:
+    return general_chat_tools.bind(make_tool_context(user_id), [*MUST_HAVE_TOOLS, *OPTIONAL_TOOLS[2:]])
+
+
+def timed(setup, requests: int) -> List[float]:
+    times = []
+    for i in range(requests):
+        start = time.perf_counter()
+        setup(f"user-{i}")
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    before = timed(legacy_setup, args.requests)
+    after = timed(registry_setup, args.requests)
+    for label, times in (("Rebuilt per request", before), ("Registry bind", after)):
+        p95 = statistics.quantiles(times, n=20)[-1]
+        print(f"{label:20} mean {statistics.mean(times):8.3f} ms, p95 {p95:8.3f} ms")
+    print(f"Speedup: {statistics.mean(before) / statistics.mean(after):.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Offline evaluation of the prompt router on labelled chat turns.
+
+Run from the repository root:
+    python -m scripts.evaluate_prompt_router [turns.jsonl] [--threshold 0.7]
+
+Each line of the file is a JSON object with "prompt", "needs_agent" and
+optionally "chat_history" ([human, ai] pairs) and "agent_seconds" /
+"fast_seconds" measured for that turn (e.g. from the
+llm_feature_call_seconds histograms). Without a file a small built in
+sample is used. Reports how often the router misroutes and the latency
+it would have saved.
+"""
+import argparse
+import json
+import time
+
+from api.lib.prompt_router import PromptRouter
+
+DEFAULT_AGENT_SECONDS = 6.0
+DEFAULT_FAST_SECONDS = 1.5
+
+SAMPLE = [
+    ("thanks!", False),
+    ("hi", False),
+    ("hello there", False),
+    ("ok cool", False),
+    ("who are you", False),
+    ("good morning", False),
+    ("Thank you so much", False),
+    ("bye", False),
+    ("tell me more", False),
+    ("Can you tell me a joke", False),
+    ("what is photosynthesis?", False),
+    ("Explain newton's laws in simple words", False),
+    ("make a presentation on world war 2", True),
+    ("draw a graph of y = x^2", True),
+    ("solve 2x + 3 = 7", True),
+    ("search the latest news on climate change", True),
+    ("write an essay about dogs, 500 words", True),
+    ("make notes from https://youtube.com/watch?v=abc", True),
+    ("what files are in my physics subject?", True),
+    ("make me a timetable for exam week", True),
+    ("find free courses on machine learning", True),
+    ("run this python code: print(sum(range(10)))", True),
+    ("what's 17 * 23", True),
+    ("what is the weather today", True),
+    ("who won the match yesterday", True),
+    ("current price of bitcoin", True),
+]
+
+OFFER = [("what is photosynthesis?", "Photosynthesis is how plants make food. Want me to make a presentation on it?")]
+SAMPLE_WITH_HISTORY = [
+    ("yes", OFFER, True),
+    ("ok do it", OFFER, True),
+    ("no thanks", OFFER, False),
+    ("yes", [("hi", "Hello! How can I help you today?")], False),
+]
+
+
+def load_turns(path: str) -> list:
+    if not path:
+        return [{"prompt": prompt, "needs_agent": needs_agent} for prompt, needs_agent in SAMPLE] + [
+            {"prompt": prompt, "chat_history": chat_history, "needs_agent": needs_agent}
+            for prompt, chat_history, needs_agent in SAMPLE_WITH_HISTORY
+        ]
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def evaluate(turns: list, router: PromptRouter) -> None:
+    fast_ok = fast_wrong = agent_ok = agent_missed = 0
+    saved = lost = 0.0
+    start = time.perf_counter()
+    decisions = [router.decide(turn["prompt"], turn.get("chat_history")) for turn in turns]
+    overhead = (time.perf_counter() - start) / max(len(turns), 1)
+
+    for turn, decision in zip(turns, decisions):
+        agent_seconds = turn.get("agent_seconds", DEFAULT_AGENT_SECONDS)
+        fast_seconds = turn.get("fast_seconds", DEFAULT_FAST_SECONDS)
+        if decision.fast and not turn["needs_agent"]:
+            fast_ok += 1
+            saved += agent_seconds - fast_seconds
+        elif decision.fast:
+            fast_wrong += 1
+            # The student has to ask again, paying both paths
+            lost += fast_seconds
+            print(f"Misrouted to fast path: {turn['prompt']!r} (score {decision.score:.2f})")
+        elif turn["needs_agent"]:
+            agent_ok += 1
+        else:
+            agent_missed += 1
+
+    total = len(turns)
+    print(f"Turns:                    {total}")
+    print(f"Fast path, correct:       {fast_ok}")
+    print(f"Fast path, needed agent:  {fast_wrong}")
+    print(f"Agent, needed:            {agent_ok}")
+    print(f"Agent, could be fast:     {agent_missed}")
+    print(f"Routed fast:              {(fast_ok + fast_wrong) / max(total, 1):.1%}")
+    print(f"Router overhead:          {overhead * 1e6:.1f} us/turn")
+    print(f"Latency saved:            {saved - lost:.1f} s total, {(saved - lost) / max(total, 1):.2f} s/turn")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("turns", nargs="?", default="", help="JSONL file of labelled chat turns")
+    parser.add_argument("--threshold", type=float, default=0.7)
+    args = parser.parse_args()
+    evaluate(load_turns(args.turns), PromptRouter(threshold=args.threshold))
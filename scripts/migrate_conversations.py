@@ -0,0 +1,75 @@
+"""Copies conversations from the legacy per user `messages` documents to the
+`conversations` and `conversation_messages` collections.
+
+Safe to run while the API serves traffic, users are also copied on their
+first request, and safe to re-run, a copy never overwrites newer data.
+Run it once every worker runs the new MessageDBManager, older workers still
+write to the legacy documents. Needs MONGODB_URL and DATABASE_NAME, from
+the repository root:
+    python -m scripts.migrate_conversations [--dry-run] [--limit N]
+    python -m scripts.migrate_conversations --prune
+
+--prune empties the conversations of legacy documents already copied, do
+it only after checking the copies.
+"""
+import argparse
+import time
+
+from api.config import DATABASE_NAME, MONGODB_URL
+from api.lib.database.collections import CollectionDBManager
+from api.lib.database.messages import MessageDBManager
+
+
+class NoCache:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dry-run", action="store_true", help="Only count the users left to copy")
+    parser.add_argument("--limit", type=int, default=0, help="Copy at most this many users")
+    parser.add_argument("--prune", action="store_true", help="Empty legacy documents that were copied")
+    args = parser.parse_args()
+
+    collection_manager = CollectionDBManager(MONGODB_URL, DATABASE_NAME)
+    manager = MessageDBManager(
+        MONGODB_URL, DATABASE_NAME, collection_manager, collection_manager.file_manager, NoCache()
+    )
+    legacy = manager.message_collection
+
+    if args.prune:
+        result = legacy.update_many(
+            {"migrated_at": {"$exists": True}, "conversations": {"$ne": {}}}, {"$set": {"conversations": {}}}
+        )
+        print(f"Emptied {result.modified_count} legacy documents")
+        return
+
+    pending = {"migrated_at": {"$exists": False}}
+    print(f"{legacy.count_documents(pending)} users left to copy")
+    if args.dry_run:
+        return
+
+    users, conversations, start = 0, 0, time.perf_counter()
+    cursor = legacy.find(pending, {"user_id": 1}, no_cursor_timeout=True)
+    try:
+        for doc in cursor:
+            conversations += manager.migrate_user(doc["user_id"])
+            users += 1
+            if users % 1000 == 0:
+                print(f"{users} users, {conversations} conversations, {time.perf_counter() - start:.0f}s")
+            if args.limit and users >= args.limit:
+                break
+    finally:
+        cursor.close()
+    print(f"Copied {conversations} conversations of {users} users in {time.perf_counter() - start:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
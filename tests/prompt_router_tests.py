@@ -0,0 +1,35 @@
+import unittest
+
+from lib.prompt_router import AGENT, FAST, PromptRouter
+
+
+OFFER = [("what is photosynthesis?", "Photosynthesis is how plants make food. Want me to make a presentation on it?")]
+
+
+class TestPromptRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = PromptRouter()
+
+    def test_yes_after_an_offer_goes_to_the_agent(self):
+        decision = self.router.decide("yes", OFFER)
+        self.assertEqual(decision.route, AGENT)
+        self.assertEqual(decision.reason, "confirmation")
+
+    def test_confirmations_after_a_question_about_a_tool(self):
+        history = [("tell me about mitosis", "Mitosis is cell division.\n\nShould I search the web for diagrams?")]
+        for prompt in ["sure", "ok do it", "yes please", "Yeah, go ahead!"]:
+            self.assertEqual(self.router.decide(prompt, history).route, AGENT, prompt)
+
+    def test_yes_without_history_goes_fast(self):
+        self.assertEqual(self.router.decide("yes").route, FAST)
+        self.assertEqual(self.router.decide("yes", []).route, FAST)
+
+    def test_yes_after_small_talk_goes_fast(self):
+        self.assertEqual(self.router.decide("yes", [("hi", "Hello! How can I help you today?")]).route, FAST)
+
+    def test_declining_an_offer_goes_fast(self):
+        self.assertEqual(self.router.decide("no", OFFER).route, FAST)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import asyncio
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, List
+
+from langchain_core.caches import InMemoryCache
+from langchain_core.globals import set_llm_cache
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from lib.hedging import Hedger, HedgedRunnable
+from lib.single_flight import SingleFlight, SingleFlightCache
+
+
+class FakeRedis:
+    """The lock commands `SingleFlight` uses."""
+
+    def __init__(self):
+        self.data = {}
+        self.lock = threading.Lock()
+
+    def set(self, key, value, nx=False, px=None):
+        with self.lock:
+            if nx and key in self.data:
+                return False
+            self.data[key] = value
+            return True
+
+    def eval(self, script, numkeys, key, token):
+        with self.lock:
+            if self.data.get(key) == token:
+                del self.data[key]
+                return 1
+            return 0
+
+    def exists(self, key):
+        return key in self.data
+
+
+class SlowModel(FakeListChatModel):
+    calls: List[str] = []
+    fail: bool = False
+
+    def _call(self, *args: Any, **kwargs: Any) -> str:
+        self.calls.append("call")
+        time.sleep(0.3)
+        if self.fail:
+            raise RuntimeError("provider error")
+        return super()._call(*args, **kwargs)
+
+
+class TestSingleFlightWithFallbacks(unittest.TestCase):
+    def setUp(self):
+        self.redis = FakeRedis()
+        set_llm_cache(
+            SingleFlightCache(InMemoryCache(), SingleFlight(self.redis, wait_timeout=5, poll_interval=0.01))
+        )
+        self.primary = SlowModel(responses=["primary"])
+        self.fallback = SlowModel(responses=["fallback"])
+        # Built like `get_model`, a primary with fallbacks
+        self.model = HedgedRunnable(
+            runnable=self.primary,
+            fallbacks=[self.fallback],
+            exceptions_to_handle=(Exception,),
+            hedger=Hedger({}),
+        )
+
+    def tearDown(self):
+        set_llm_cache(None)
+
+    def invoke_twice(self) -> List[str]:
+        with ThreadPoolExecutor(2) as executor:
+            futures = [executor.submit(self.model.invoke, "Make a quiz on photosynthesis") for _ in range(2)]
+            time.sleep(0.05)
+            return [future.result().content for future in futures]
+
+    def test_identical_calls_make_one_provider_call(self):
+        self.assertEqual(self.invoke_twice(), ["primary", "primary"])
+        self.assertEqual(len(self.primary.calls), 1)
+        self.assertEqual(self.fallback.calls, [])
+        self.assertEqual(self.redis.data, {})
+
+    def test_fallback_answer_is_shared(self):
+        self.primary.fail = True
+        self.assertEqual(self.invoke_twice(), ["fallback", "fallback"])
+        self.assertEqual(len(self.primary.calls), 1)
+        self.assertEqual(len(self.fallback.calls), 1)
+        self.assertEqual(self.redis.data, {})
+
+    def test_identical_async_calls_make_one_provider_call(self):
+        async def invoke_twice():
+            return await asyncio.gather(
+                *[self.model.ainvoke("Summarize chapter one") for _ in range(2)]
+            )
+
+        self.assertEqual([answer.content for answer in asyncio.run(invoke_twice())], ["primary", "primary"])
+        self.assertEqual(len(self.primary.calls), 1)
+        self.assertEqual(self.redis.data, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import time
+import unittest
+
+from langchain.embeddings.base import Embeddings
+from prometheus_client import REGISTRY
+from lib.tool_index import ToolIndex, normalize_query
+
+
+DESCRIPTIONS = [
+    "Make a powerpoint presentation on a topic",
+    "Search the web for the latest information",
+    "Draw a graph of an equation",
+]
+
+
+class FakeEmbeddings(Embeddings):
+    """Vectors over a fixed vocabulary, counts the query embeddings."""
+
+    vocabulary = ["presentation", "search", "web", "graph", "equation"]
+
+    def __init__(self):
+        self.queries = []
+
+    def _embed(self, text):
+        return [float(word in text.lower()) for word in self.vocabulary]
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return self._embed(text)
+
+
+def picks(method):
+    return REGISTRY.get_sample_value("tool_index_picks_total", {"method": method}) or 0
+
+
+class TestToolIndex(unittest.TestCase):
+    def setUp(self):
+        self.embeddings = FakeEmbeddings()
+        self.index = ToolIndex(self.embeddings)
+
+    def wait_for_embeddings(self):
+        deadline = time.monotonic() + 5
+        while (self.index._pending or self.index._pending_queries) and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_normalize_query(self):
+        self.assertEqual(normalize_query("Make me a presentation on WW2!"), normalize_query("make presentations on ww2"))
+        self.assertEqual(normalize_query("the"), "")
+
+    def test_rephrased_prompt_is_ranked_by_embeddings(self):
+        self.index.warm(DESCRIPTIONS)
+        self.wait_for_embeddings()
+
+        keywords = picks("keywords")
+        self.index.rank(DESCRIPTIONS, "Make me a presentation on WW2")
+        self.assertEqual(picks("keywords"), keywords + 1)
+        self.wait_for_embeddings()
+
+        embeddings = picks("embeddings")
+        scores = self.index.rank(DESCRIPTIONS, "make  presentations on ww2?")
+        self.assertEqual(picks("embeddings"), embeddings + 1)
+        self.assertEqual(max(range(len(scores)), key=scores.__getitem__), 0)
+        self.assertEqual(len(self.embeddings.queries), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()